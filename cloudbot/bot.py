@@ -5,7 +5,6 @@ import collections
 import re
 import os
 import gc
-from sqlalchemy import create_engine
 
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -18,6 +17,7 @@ from cloudbot.reloader import PluginReloader
 from cloudbot.plugin import PluginManager
 from cloudbot.event import Event, CommandEvent, RegexEvent, EventType
 from cloudbot.util import database, formatting
+from cloudbot.util.scheduler import Scheduler
 from cloudbot.clients.irc import IrcClient
 
 try:
@@ -50,6 +50,8 @@ class CloudBot:
     :type db_factory: sqlalchemy.orm.session.sessionmaker
     :type db_session: sqlalchemy.orm.scoping.scoped_session
     :type db_metadata: sqlalchemy.sql.schema.MetaData
+    :type db_executor: cloudbot.util.database.DatabaseExecutor
+    :type scheduler: cloudbot.util.scheduler.Scheduler
     :type loop: asyncio.events.AbstractEventLoop
     :type stopped_future: asyncio.Future
     :param: stopped_future: Future that will be given a result when the bot has stopped.
@@ -63,6 +65,9 @@ class CloudBot:
         # future which will be called when the bot stopsIf you
         self.stopped_future = asyncio.Future(loop=self.loop)
 
+        # runs jobs at given times, for plugins
+        self.scheduler = Scheduler(self.loop)
+
         # stores each bot server connection
         self.connections = {}
 
@@ -92,11 +97,14 @@ class CloudBot:
 
         # setup db
         db_path = self.config.get('database', 'sqlite:///cloudbot.db')
-        self.db_engine = create_engine(db_path)
+        self.db_engine = database.create_engine(db_path, self.config.get("database_pool"),
+                                                self.config.get("sqlite_pragmas"))
         self.db_factory = sessionmaker(bind=self.db_engine)
         self.db_session = scoped_session(self.db_factory)
         self.db_metadata = MetaData()
         self.db_base = declarative_base(metadata=self.db_metadata, bind=self.db_engine)
+        # threads for database work from coroutine hooks
+        self.db_executor = database.DatabaseExecutor(self.loop, self.config.get("database_threads", 4))
 
         # create web interface
         if self.config.get("web", {}).get("enabled", False) and web_installed:
@@ -130,6 +138,11 @@ class CloudBot:
         self.loop.run_until_complete(self._init_routine())
         # Wait till the bot stops. The stopped_future will be set to True to restart, False otherwise
         restart = self.loop.run_until_complete(self.stopped_future)
+        self.db_executor.shutdown()
+        pool_stats = database.get_pool_stats(self.db_engine)
+        if pool_stats is not None:
+            logger.debug("Database connections: {}".format(pool_stats))
+        self.db_engine.dispose()
         self.loop.close()
         return restart
 
@@ -179,6 +192,9 @@ class CloudBot:
                 continue
             connection.close()
 
+        # let plugins save anything they keep in memory
+        yield from self.plugin_manager.stop_plugins()
+
         self.running = False
         # Give the stopped_future a result, so that run() will exit
         self.stopped_future.set_result(restart)
@@ -219,10 +235,13 @@ class CloudBot:
         """
         run_before_tasks = []
         tasks = []
-        command_prefix = event.conn.config.get('command_prefix', '.')
+        # hooks which are turned off in this channel
+        blocked_hooks = self.plugin_manager.get_blocked_hooks(event.conn, event.chan)
 
         # Raw IRC hook
         for raw_hook in self.plugin_manager.catch_all_triggers:
+            if raw_hook in blocked_hooks:
+                continue
             # run catch-all coroutine hooks before all others - TODO: Make this a plugin argument
             if not raw_hook.threaded:
                 run_before_tasks.append(
@@ -231,34 +250,36 @@ class CloudBot:
                 tasks.append(self.plugin_manager.launch(raw_hook, Event(hook=raw_hook, base_event=event)))
         if event.irc_command in self.plugin_manager.raw_triggers:
             for raw_hook in self.plugin_manager.raw_triggers[event.irc_command]:
+                if raw_hook in blocked_hooks:
+                    continue
                 tasks.append(self.plugin_manager.launch(raw_hook, Event(hook=raw_hook, base_event=event)))
 
         # Event hooks
         if event.type in self.plugin_manager.event_type_hooks:
             for event_hook in self.plugin_manager.event_type_hooks[event.type]:
+                if event_hook in blocked_hooks:
+                    continue
                 tasks.append(self.plugin_manager.launch(event_hook, Event(hook=event_hook, base_event=event)))
 
         if event.type is EventType.message:
             # Commands
-            if event.chan.lower() == event.nick.lower():  # private message, no command prefix
-                command_re = r'(?i)^(?:[{}]?|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'.format(command_prefix, event.conn.nick)
-            else:
-                command_re = r'(?i)^(?:[{}]|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'.format(command_prefix, event.conn.nick)
-
-            cmd_match = re.match(command_re, event.content)
+            # in private messages, the command prefix is optional
+            cmd_match = event.conn.command_matcher.match(event.content, event.chan.lower() == event.nick.lower())
 
             if cmd_match:
                 command = cmd_match.group(1).lower()
+                disabled_commands = event.conn.config.get("disabled_commands", ())
                 if command in self.plugin_manager.commands:
                     command_hook = self.plugin_manager.commands[command]
-                    command_event = CommandEvent(hook=command_hook, text=cmd_match.group(2).strip(),
-                                             triggered_command=command, base_event=event)
-                    tasks.append(self.plugin_manager.launch(command_hook, command_event))
+                    if command not in disabled_commands and command_hook not in blocked_hooks:
+                        command_event = CommandEvent(hook=command_hook, text=cmd_match.group(2).strip(),
+                                                     triggered_command=command, base_event=event)
+                        tasks.append(self.plugin_manager.launch(command_hook, command_event))
                 else:
-                    potential_matches = []
-                    for potential_match, plugin in self.plugin_manager.commands.items():
-                        if potential_match.startswith(command):
-                            potential_matches.append((potential_match, plugin))
+                    # don't offer disabled commands as possible matches
+                    potential_matches = [(name, hook) for name, hook in
+                                         self.plugin_manager.command_trie.items(command, exclude=disabled_commands)
+                                         if hook not in blocked_hooks]
                     if potential_matches:
                         if len(potential_matches) == 1:
                             command_hook = potential_matches[0][1]
@@ -269,9 +290,9 @@ class CloudBot:
                             event.notice("Possible matches: {}".format(
                                 formatting.get_text_list([command for command, plugin in potential_matches])))
 
-            # Regex hooks
-            for regex, regex_hook in self.plugin_manager.regex_hooks:
-                if not regex_hook.run_on_cmd and cmd_match:
+            # Regex hooks, skipping those which can't match this message
+            for regex, regex_hook in self.plugin_manager.regex_matcher.candidates(event.content):
+                if (not regex_hook.run_on_cmd and cmd_match) or regex_hook in blocked_hooks:
                     pass
                 else:
                     regex_match = regex.search(event.content)
@@ -3,6 +3,7 @@ import logging
 import collections
 
 from cloudbot.permissions import PermissionManager
+from cloudbot.util.commandmatcher import CommandMatcher
 
 logger = logging.getLogger("cloudbot")
 
@@ -19,6 +20,7 @@ class Client:
     :type vars: dict
     :type history: dict[str, list[tuple]]
     :type permissions: PermissionManager
+    :type command_matcher: CommandMatcher
     """
 
     def __init__(self, bot, name, nick, *, channels=None, config=None):
@@ -32,7 +34,6 @@ class Client:
         self.bot = bot
         self.loop = bot.loop
         self.name = name
-        self.nick = nick
 
         if channels is None:
             self.channels = []
@@ -43,6 +44,10 @@ class Client:
             self.config = {}
         else:
             self.config = config
+
+        # matches commands in messages, recompiled when the nick or command prefix changes
+        self.command_matcher = CommandMatcher(self.config.get("command_prefix", "."), nick)
+        self._nick = nick
         self.vars = {}
         self.history = {}
 
@@ -55,6 +60,18 @@ class Client:
         # set when on_load in core_misc is done
         self.ready = False
 
+    @property
+    def nick(self):
+        """
+        :rtype: str
+        """
+        return self._nick
+
+    @nick.setter
+    def nick(self, value):
+        self._nick = value
+        self.command_matcher.update(nick=value)
+
     def describe_server(self):
         raise NotImplementedError
 
@@ -77,27 +94,36 @@ class Client:
         """
         raise NotImplementedError
 
-    def message(self, target, *text):
+    def message(self, target, *text, priority=None):
         """
         Sends a message to the given target
+        :param priority: The send priority (one of the cloudbot.util.sendqueue PRIORITY_* constants), or None for
+                         the default. Clients which don't queue lines ignore it.
         :type target: str
         :type text: str
+        :type priority: int
         """
         raise NotImplementedError
 
-    def action(self, target, text):
+    def action(self, target, text, priority=None):
         """
         Sends an action (or /me) to the given target channel
+        :param priority: The send priority (one of the cloudbot.util.sendqueue PRIORITY_* constants), or None for
+                         the default. Clients which don't queue lines ignore it.
         :type target: str
         :type text: str
+        :type priority: int
         """
         raise NotImplementedError
 
-    def notice(self, target, text):
+    def notice(self, target, text, priority=None):
         """
         Sends a notice to the given target
+        :param priority: The send priority (one of the cloudbot.util.sendqueue PRIORITY_* constants), or None for
+                         the default. Clients which don't queue lines ignore it.
         :type target: str
         :type text: str
+        :type priority: int
         """
         raise NotImplementedError
 
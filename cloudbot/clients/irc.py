@@ -3,24 +3,37 @@ import asyncio
 import re
 import ssl
 import logging
+import threading
 from ssl import SSLContext
 
 from cloudbot.client import Client
 from cloudbot.event import Event, EventType
+from cloudbot.util.formatting import chunk_bytes
+from cloudbot.util.ircparse import parse_line
+from cloudbot.util.linebuffer import LineBuffer, MAX_LINE_LENGTH
+from cloudbot.util.linedecoder import LineDecoder
+from cloudbot.util.sendqueue import SendQueue, PRIORITY_PROTOCOL, PRIORITY_INTERACTIVE, PRIORITY_NOTICE
 
 logger = logging.getLogger("cloudbot")
 
-irc_prefix_re = re.compile(r":([^ ]*) ([^ ]*) (.*)")
-irc_noprefix_re = re.compile(r"([^ ]*) (.*)")
-irc_netmask_re = re.compile(r"([^!@]*)!([^@]*)@(.*)")
-irc_param_re = re.compile(r"(?:^|(?<= ))(:.*|[^ ]+)")
-
 irc_bad_chars = ''.join([chr(x) for x in list(range(0, 32)) + list(range(127, 160))])
 irc_clean_re = re.compile('[{}]'.format(re.escape(irc_bad_chars)))
 
 def irc_clean(dirty):
     return irc_clean_re.sub('', dirty)
 
+# commands not listed here are sent with PRIORITY_PROTOCOL
+irc_command_priorities = {
+    "PRIVMSG": PRIORITY_INTERACTIVE,
+    "NOTICE": PRIORITY_NOTICE
+}
+
+# the longest hostname the server may use for the bot when relaying its messages
+irc_max_host_length = 63
+
+# commands which are never held back by the send rate limit
+irc_unthrottled_commands = {"PONG"}
+
 irc_command_to_event_type = {
     "PRIVMSG": EventType.message,
     "JOIN": EventType.join,
@@ -30,18 +43,6 @@ irc_command_to_event_type = {
 }
 
 
-def decode(bytestring):
-    """
-    Tries to decode a bytestring using multiple encoding formats
-    """
-    for codec in ('utf-8', 'iso-8859-1', 'shift_jis', 'cp1252'):
-        try:
-            return bytestring.decode(codec)
-        except UnicodeDecodeError:
-            continue
-    return bytestring.decode('utf-8', errors='ignore')
-
-
 class IrcClient(Client):
     """
     An implementation of Client for IRC.
@@ -51,6 +52,7 @@ class IrcClient(Client):
     :type _connected: bool
     :type _ignore_cert_errors: bool
     :type capabilities: set[str]
+    :type decoder: LineDecoder
     """
 
     def __init__(self, bot, name, nick, *, channels=None, config=None,
@@ -94,8 +96,15 @@ class IrcClient(Client):
         self._transport = None
         self._protocol = None
 
+        # the thread the event loop runs in, so send() can skip call_soon_threadsafe when called from it
+        self._loop_thread_id = None
+
         self.capabilities = set(self.config.get('capabilities', []))
 
+        # decodes incoming lines, remembering the encoding of each sender across reconnects
+        self.decoder = LineDecoder(self.config.get("encoding", "utf-8"),
+                                   self.config.get("fallback_encodings", ["cp1252", "iso-8859-1"]))
+
     def describe_server(self):
         if self.use_ssl:
             return "+{}:{}".format(self.server, self.port)
@@ -119,6 +128,7 @@ class IrcClient(Client):
         else:
             self._connected = True
             logger.info("[{}] Connecting".format(self.name))
+        self._loop_thread_id = threading.get_ident()
         optional_params = {}
         if self.local_bind:
             optional_params["local_addr"] = self.local_bind
@@ -139,6 +149,9 @@ class IrcClient(Client):
             self.cmd("QUIT", reason)
         else:
             self.cmd("QUIT")
+        if self._protocol is not None:
+            # don't let the send rate limit hold back the QUIT, or anything queued before it
+            self.loop.call_soon_threadsafe(self._protocol.drain)
 
     def close(self):
         if not self._quit:
@@ -146,24 +159,43 @@ class IrcClient(Client):
         if not self._connected:
             return
 
+        # write out whatever is still queued before the transport goes
+        self._protocol.drain()
         self._transport.close()
         self._connected = False
 
-    def message(self, target, *messages, sanatize=True):
+    def message(self, target, *messages, sanatize=True, priority=None):
         for text in messages:
             if sanatize == True:
                 text = "".join(text.splitlines())
-            self.cmd("PRIVMSG", target, text)
+            for chunk in chunk_bytes(text, self.max_content_length("PRIVMSG", target)):
+                self.cmd("PRIVMSG", target, chunk, priority=priority)
 
-    def action(self, target, text, sanatize=True):
+    def action(self, target, text, sanatize=True, priority=None):
         if sanatize == True:
             text = "".join(text.splitlines())
-        self.ctcp(target, "ACTION", text)
+        # leave room for the "\x01ACTION " and "\x01" around each chunk
+        for chunk in chunk_bytes(text, self.max_content_length("PRIVMSG", target) - 9):
+            self.ctcp(target, "ACTION", chunk, priority=priority)
 
-    def notice(self, target, text, sanatize=True):
+    def notice(self, target, text, sanatize=True, priority=None):
         if sanatize == True:
             text = "".join(text.splitlines())
-        self.cmd("NOTICE", target, text)
+        for chunk in chunk_bytes(text, self.max_content_length("NOTICE", target)):
+            self.cmd("NOTICE", target, chunk, priority=priority)
+
+    def max_content_length(self, command, target):
+        """
+        Works out how many bytes of text fit in a single <command> to <target>, once the server has added the
+        bot's "nick!user@host" prefix to it.
+        :type command: str
+        :type target: str
+        :rtype: int
+        """
+        # the server may prefix the user with "~" if it doesn't get an ident response
+        user = "~" + self.config.get('user', 'cloudbot')
+        overhead = len(":{}!{}@ {} {} :\r\n".format(self.nick, user, command, target).encode("utf-8", "replace"))
+        return 512 - overhead - irc_max_host_length
 
     def set_nick(self, nick):
         self.cmd("NICK", nick)
@@ -183,48 +215,57 @@ class IrcClient(Client):
             return
         self.cmd("PASS", password)
 
-    def ctcp(self, target, ctcp_type, text):
+    def ctcp(self, target, ctcp_type, text, priority=None):
         """
         Makes the bot send a PRIVMSG CTCP of type <ctcp_type> to the target
         :type ctcp_type: str
         :type text: str
         :type target: str
+        :type priority: int
         """
         out = "\x01{} {}\x01".format(ctcp_type, text)
-        self.cmd("PRIVMSG", target, out)
+        self.cmd("PRIVMSG", target, out, priority=priority)
 
-    def cmd(self, command, *params):
+    def cmd(self, command, *params, priority=None):
         """
         Sends a raw IRC command of type <command> with params <params>
         :param command: The IRC command to send
         :param params: The params to the IRC command
+        :param priority: The send priority (one of the PRIORITY_* constants), or None to pick one by command
         :type command: str
         :type params: (str)
+        :type priority: int
         """
         params = list(params)  # turn the tuple of parameters into a list
         if params:
             params[-1] = ':' + params[-1]
-            self.send("{} {}".format(command, ' '.join(params)))
+            self.send("{} {}".format(command, ' '.join(params)), priority=priority)
         else:
-            self.send(command)
+            self.send(command, priority=priority)
 
-    def send(self, line):
+    def send(self, line, priority=None):
         """
         Sends a raw IRC line
+        :param priority: The send priority (one of the PRIORITY_* constants), or None to pick one by command
         :type line: str
+        :type priority: int
         """
         if not self._connected:
             raise ValueError("Client must be connected to irc server to use send")
-        self.loop.call_soon_threadsafe(self._send, line)
+        if threading.get_ident() == self._loop_thread_id:
+            # we're already in the event loop's thread, so there's no need to wake it up
+            self._send(line, priority)
+        else:
+            self.loop.call_soon_threadsafe(self._send, line, priority)
 
-    def _send(self, line):
+    def _send(self, line, priority=None):
         """
         Sends a raw IRC line unchecked. Doesn't do connected check, and is *not* threadsafe
         :type line: str
+        :type priority: int
         """
         logger.info("[{}] >> {}".format(self.name, line))
-        asyncio.async(self._protocol.send(line), loop=self.loop)
-
+        self._protocol.send(line, priority)
 
     @property
     def connected(self):
@@ -236,10 +277,14 @@ class _IrcProtocol(asyncio.Protocol):
     :type loop: asyncio.events.AbstractEventLoop
     :type conn: IrcClient
     :type bot: cloudbot.bot.CloudBot
-    :type _input_buffer: bytes
+    :type _input_buffer: LineBuffer
+    :type send_queue: SendQueue
+    :type _flush_handle: asyncio.Handle
+    :type _flush_delayed: bool
     :type _connected: bool
     :type _transport: asyncio.transports.Transport
-    :type _connected_future: asyncio.Future
+    :type lines_written: int
+    :type bytes_written: int
     """
 
     def __init__(self, conn):
@@ -251,7 +296,17 @@ class _IrcProtocol(asyncio.Protocol):
         self.conn = conn
 
         # input buffer
-        self._input_buffer = b""
+        self._input_buffer = LineBuffer(max_line_length=conn.config.get("max_line_length", MAX_LINE_LENGTH))
+
+        # output queue, written out once per event loop iteration as far as the send rate limit allows
+        ratelimit = conn.config.get("send_ratelimit", {})
+        self.send_queue = SendQueue(enabled=ratelimit.get("enabled", True), tokens=ratelimit.get("tokens", 5),
+                                    restore_rate=ratelimit.get("restore_rate", 1))
+        self._flush_handle = None
+        # True if the scheduled flush is waiting for the rate limit
+        self._flush_delayed = False
+        self.lines_written = 0
+        self.bytes_written = 0
 
         # connected
         self._connected = False
@@ -259,20 +314,17 @@ class _IrcProtocol(asyncio.Protocol):
         # transport
         self._transport = None
 
-        # Future that waits until we are connected
-        self._connected_future = asyncio.Future(loop=self.loop)
-
     def connection_made(self, transport):
         self._transport = transport
         self._connected = True
-        self._connected_future.set_result(None)
-        # we don't need the _connected_future, everything uses it will check _connected first.
-        del self._connected_future
+        # write out anything that was sent before we were connected
+        self._schedule_flush()
 
     def connection_lost(self, exc):
         self._connected = False
-        # create a new connected_future for when we are connected.
-        self._connected_future = asyncio.Future(loop=self.loop)
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
         if exc is None:
             # we've been closed intentionally, so don't reconnect
             return
@@ -281,85 +333,137 @@ class _IrcProtocol(asyncio.Protocol):
 
     def eof_received(self):
         self._connected = False
-        # create a new connected_future for when we are connected.
-        self._connected_future = asyncio.Future(loop=self.loop)
         logger.info("[{}] EOF received.".format(self.conn.name))
         asyncio.async(self.conn.connect(), loop=self.loop)
         return True
 
-    @asyncio.coroutine
-    def send(self, line):
-        # make sure we are connected before sending
-        if not self._connected:
-            yield from self._connected_future
-        line = line[:510] + "\r\n"
+    def send(self, line, priority=None):
+        """
+        Queues a raw IRC line to be written. Queued lines are written once per event loop iteration, in order of
+        priority and taking turns between targets, as fast as the send rate limit allows. This is *not* threadsafe.
+        :param priority: The send priority (one of the PRIORITY_* constants), or None to pick one by command
+        :type line: str
+        :type priority: int
+        """
+        command, _, params = line.partition(" ")
+        command = command.upper()
         data = line.encode("utf-8", "replace")
-        self._transport.write(data)
+        if len(data) > 510:
+            # truncate to the maximum line length, without splitting a multibyte character
+            end = 510
+            while data[end] & 0xC0 == 0x80:
+                end -= 1
+            data = data[:end]
+        data += b"\r\n"
+
+        if command in irc_unthrottled_commands:
+            self.send_queue.put_unthrottled(data)
+            self._schedule_flush(urgent=True)
+            return
 
-    def data_received(self, data):
-        self._input_buffer += data
+        if priority is None:
+            priority = irc_command_priorities.get(command, PRIORITY_PROTOCOL)
+        if command in irc_command_priorities:
+            # PRIVMSG and NOTICE take turns per target
+            target = params.split(" ", 1)[0].lower()
+        else:
+            target = None
 
-        while b"\r\n" in self._input_buffer:
-            line_data, self._input_buffer = self._input_buffer.split(b"\r\n", 1)
-            line = decode(line_data)
+        self.send_queue.put(data, priority, target)
+        self._schedule_flush()
+
+    def _schedule_flush(self, urgent=False):
+        """
+        :param urgent: If True, don't wait for a flush which is delayed by the rate limit
+        :type urgent: bool
+        """
+        if not self._connected or not self.send_queue:
+            return
+        if self._flush_handle is not None:
+            if not (urgent and self._flush_delayed):
+                return
+            self._flush_handle.cancel()
+        self._flush_handle = self.loop.call_soon(self._flush)
+        self._flush_delayed = False
+
+    def _flush(self):
+        """
+        Writes all lines the rate limit allows to the transport in a single write
+        """
+        self._flush_handle = None
+        if not self._connected:
+            return
+
+        lines, delay = self.send_queue.pop_ready()
+        if lines:
+            data = b"".join(lines)
+            self.lines_written += len(lines)
+            self.bytes_written += len(data)
+            self._transport.write(data)
+
+        if delay is not None:
+            # there are lines left which the rate limit is holding back
+            self._flush_handle = self.loop.call_later(delay, self._flush)
+            self._flush_delayed = True
+
+    def drain(self):
+        """
+        Writes out every queued line right away, regardless of the send rate limit
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._connected:
+            return
+
+        lines = self.send_queue.pop_all()
+        if lines:
+            data = b"".join(lines)
+            self.lines_written += len(lines)
+            self.bytes_written += len(data)
+            self._transport.write(data)
+
+    @property
+    def input_buffer(self):
+        """
+        The line buffer for incoming data, which keeps counters for received lines and bytes
+        :rtype: LineBuffer
+        """
+        return self._input_buffer
+
+    def data_received(self, data):
+        for line_data in self._input_buffer.feed(data):
+            line = self.conn.decoder.decode(line_data)
 
             # parse the line into a message
-            if line.startswith(":"):
-                prefix_line_match = irc_prefix_re.match(line)
-                if prefix_line_match is None:
-                    logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
-                        self.conn.name, line, self.conn.describe_server()))
-                    continue
-
-                netmask_prefix, command, params = prefix_line_match.groups()
-                prefix = ":" + netmask_prefix  # TODO: Do we need to know this?
-                netmask_match = irc_netmask_re.match(netmask_prefix)
-                if netmask_match is None:
-                    # This isn't in the format of a netmask
-                    nick = netmask_prefix
-                    user = None
-                    host = None
-                    mask = netmask_prefix
-                else:
-                    nick = netmask_match.group(1)
-                    user = netmask_match.group(2)
-                    host = netmask_match.group(3)
-                    mask = netmask_prefix
-            else:
-                prefix = None
-                noprefix_line_match = irc_noprefix_re.match(line)
-                if noprefix_line_match is None:
-                    logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
-                        self.conn.name, line, self.conn.describe_server()))
-                    continue
-                command = noprefix_line_match.group(1)
-                params = noprefix_line_match.group(2)
-                nick = None
-                user = None
-                host = None
-                mask = None
-
-            command_params = irc_param_re.findall(params)
+            try:
+                message = parse_line(line)
+            except ValueError:
+                logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
+                    self.conn.name, line, self.conn.describe_server()))
+                continue
+
+            command = message.command
+            command_params = message.paramlist
 
             # Reply to pings immediately
 
             if command == "PING":
-                asyncio.async(self.send("PONG " + command_params[-1]), loop=self.loop)
+                self.send("PONG " + command_params[-1])
+            elif command == "QUIT":
+                # their prefix won't be seen again until they reconnect, so don't keep its encoding cached
+                self.conn.decoder.forget(line_data)
 
             # Parse the command and params
 
             # Content
-            if command_params:
-                if command_params[-1].startswith(":"):
-                # If the last param is in the format of `:content` remove the `:` from it, and set content from it
-                    content_raw = command_params[-1][1:]
-                    content = irc_clean(content_raw)
-                else:
-                    content_raw = None
-                    content = None
-                    if not command_params[-1]=="" and isinstance("string", type(command_params[-1])):
-                        content = command_params[-1]
-                        content_raw = command_params[-1]
+            content_raw = message.content
+            if content_raw is None:
+                content = None
+            elif message.trailing is not None:
+                content = irc_clean(content_raw)
+            else:
+                content = content_raw
 
             # Event type
             if command in irc_command_to_event_type:
@@ -377,14 +481,15 @@ class _IrcProtocol(asyncio.Protocol):
                 target = None
 
             # Parse for CTCP
-            if event_type is EventType.message and content_raw.count("\x01") >= 2 and content_raw.startswith("\x01"):
+            if event_type is EventType.message and content_raw and content_raw.startswith("\x01") \
+                    and "\x01" in content_raw[1:]:
                 # Remove the first \x01, then rsplit to remove the last one, and ignore text after the last \x01
                 ctcp_text = content_raw[1:].rsplit("\x01", 1)[0]
                 ctcp_text_split = ctcp_text.split(None, 1)
-                if ctcp_text_split[0] == "ACTION":
+                if ctcp_text_split and ctcp_text_split[0] == "ACTION":
                     # this is a CTCP ACTION, set event_type and content accordingly
                     event_type = EventType.action
-                    content = ctcp_text_split[1]
+                    content = ctcp_text_split[1] if len(ctcp_text_split) > 1 else ""
                 else:
                     # this shouldn't be considered a regular message
                     event_type = EventType.other
@@ -393,21 +498,26 @@ class _IrcProtocol(asyncio.Protocol):
 
             # Channel
             # TODO: Migrate plugins using chan for storage to use chan.lower() instead so we can pass the original case
-            if command_params and (len(command_params) > 2 or not command_params[0].startswith(":")):
-
-                if command_params[0].lower() == self.conn.nick.lower():
+            if message.params:
+                if message.params[0].lower() == self.conn.nick.lower():
                     # this is a private message - set the channel to the sender's nick
-                    channel = nick.lower()
+                    channel = message.nick.lower()
                 else:
-                    channel = command_params[0].lower()
+                    channel = message.params[0].lower()
             else:
                 channel = None
 
+            if message.prefix is None:
+                prefix = None
+            else:
+                prefix = ":" + message.prefix
+
             # Set up parsed message
             # TODO: Do we really want to send the raw `prefix` and `command_params` here?
             event = Event(bot=self.bot, conn=self.conn, event_type=event_type, content=content, target=target,
-                          channel=channel, nick=nick, user=user, host=host, mask=mask, irc_raw=line, irc_prefix=prefix,
-                          irc_command=command, irc_paramlist=command_params, irc_ctcp_text=ctcp_text)
+                          channel=channel, mask=message.prefix, irc_raw=line, irc_prefix=prefix, irc_command=command,
+                          irc_paramlist=command_params, irc_ctcp_text=ctcp_text, irc_tags=message.tags,
+                          irc_message=message)
 
             # handle the message, async
             asyncio.async(self.bot.process(event), loop=self.loop)
@@ -67,10 +67,20 @@ class Config(dict):
             self.update(json.load(f))
             logger.debug("Config loaded from file.")
 
-        # reload permissions
+        # reload permissions and the command prefix
         if self.bot.connections:
+            # the connection configs were replaced along with the rest, so point each connection at its new one
+            connection_configs = {config["name"]: config for config in self.get("connections", [])}
             for connection in self.bot.connections.values():
+                if connection.name in connection_configs:
+                    connection.config = connection_configs[connection.name]
+                    connection.permissions.config = connection.config
                 connection.permissions.reload()
+                # configs are reloaded from the watchdog thread, so update the matcher in the event loop
+                self.bot.loop.call_soon_threadsafe(connection.command_matcher.update,
+                                                   connection.config.get("command_prefix", "."))
+            # acls might have changed, so clear the blocked hooks in the event loop too
+            self.bot.loop.call_soon_threadsafe(self.bot.plugin_manager.clear_channel_hooks)
 
     def save_config(self):
         """saves the contents of the config dict to the config file"""
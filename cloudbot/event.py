@@ -1,7 +1,8 @@
 import asyncio
 import enum
+import functools
 import logging
-import concurrent.futures
+import operator
 
 logger = logging.getLogger("cloudbot")
 
@@ -18,6 +19,79 @@ class EventType(enum.Enum):
     other = 6
 
 
+# marks a nick, user or host which hasn't been split out of the event's IRC message yet
+_unsplit = object()
+
+
+class _EventData:
+    """
+    The fields of an event which describe the line it was created from. These are shared between an event and all of
+    the per-hook events based on it, and are only copied when one of the events changes them.
+    """
+    __slots__ = ("type", "content", "target", "chan", "nick", "user", "host", "mask", "irc_raw", "irc_prefix",
+                 "irc_command", "irc_paramlist", "irc_ctcp_text", "irc_tags", "irc_message")
+
+    def __init__(self, event_type, content, target, channel, nick, user, host, mask, irc_raw, irc_prefix,
+                 irc_command, irc_paramlist, irc_ctcp_text, irc_tags, irc_message):
+        if irc_message is not None and nick is None and user is None and host is None:
+            # split out of the message's prefix when they are first read
+            nick = user = host = _unsplit
+        self.type = event_type
+        self.content = content
+        self.target = target
+        self.chan = channel
+        self.nick = nick
+        self.user = user
+        self.host = host
+        self.mask = mask
+        # clients-specific parameters
+        self.irc_raw = irc_raw
+        self.irc_prefix = irc_prefix
+        self.irc_command = irc_command
+        self.irc_paramlist = irc_paramlist
+        self.irc_ctcp_text = irc_ctcp_text
+        self.irc_tags = irc_tags
+        self.irc_message = irc_message
+
+    def copy(self):
+        """
+        :rtype: _EventData
+        """
+        return _EventData(self.type, self.content, self.target, self.chan, self.nick, self.user, self.host, self.mask,
+                          self.irc_raw, self.irc_prefix, self.irc_command, self.irc_paramlist, self.irc_ctcp_text,
+                          self.irc_tags, self.irc_message)
+
+
+def _shared_field(name):
+    """
+    Creates a property for an Event which reads from the shared event data, and copies it before the first write
+    """
+
+    def fset(self, value):
+        if not self._owns_data:
+            self._data = self._data.copy()
+            self._owns_data = True
+        setattr(self._data, name, value)
+
+    return property(operator.attrgetter("_data." + name), fset)
+
+
+def _netmask_field(name, index):
+    """
+    Creates a property for an Event's nick, user or host, which splits the netmask of the event's IRC message the first
+    time any of them is read
+    """
+    shared = _shared_field(name)
+
+    def fget(self):
+        value = getattr(self._data, name)
+        if value is _unsplit:
+            value = self._data.irc_message.netmask[index]
+        return value
+
+    return property(fget, shared.fset)
+
+
 class Event:
     """
     :type bot: cloudbot.bot.CloudBot
@@ -33,16 +107,21 @@ class Event:
     :type mask: str
     :type db: sqlalchemy.orm.Session
     :type db_executor: concurrent.futures.ThreadPoolExecutor
+    :param db_executor: The database thread this event last ran database work in
     :type irc_raw: str
     :type irc_prefix: str
     :type irc_command: str
     :type irc_paramlist: str
     :type irc_ctcp_text: str
+    :type irc_tags: dict[str, str]
+    :type irc_message: cloudbot.util.ircparse.Message
     """
+    __slots__ = ("bot", "conn", "hook", "db", "db_executor", "_data", "_owns_data")
 
     def __init__(self, *, bot=None, hook=None, conn=None, base_event=None, event_type=EventType.other, content=None,
                  target=None, channel=None, nick=None, user=None, host=None, mask=None, irc_raw=None, irc_prefix=None,
-                 irc_command=None, irc_paramlist=None, irc_ctcp_text=None):
+                 irc_command=None, irc_paramlist=None, irc_ctcp_text=None, irc_tags=None,
+                 irc_message=None):
         """
         All of these parameters except for `bot` and `hook` are optional.
         The irc_* parameters should only be specified for IRC events.
@@ -53,7 +132,8 @@ class Event:
         :param conn: The Client instance this event was triggered from
         :param hook: The hook this event will be passed to
         :param base_event: The base event that this event is based on. If this parameter is not None, then nick, user,
-                            host, mask, and irc_* arguments are ignored
+                            host, mask, and irc_* arguments are ignored. The values are shared with the base event
+                            rather than copied, until either event changes one of them.
         :param event_type: The type of the event
         :param content: The content of the message, or the reason for an join or part
         :param target: The target of the action, for example the user being kicked, or invited
@@ -68,6 +148,9 @@ class Event:
         :param irc_paramlist: The list of params for the IRC command. If the last param is a content param, the ':'
                                 should be removed from the front.
         :param irc_ctcp_text: CTCP text if this message is a CTCP command
+        :param irc_tags: The IRCv3 message tags of the line, if it had any
+        :param irc_message: The parsed IRC line. If nick, user and host aren't given, they are split out of its prefix
+                            when they are first read.
         :type bot: cloudbot.bot.CloudBot
         :type conn: cloudbot.client.Client
         :type hook: cloudbot.plugin.Hook
@@ -84,6 +167,8 @@ class Event:
         :type irc_command: str
         :type irc_paramlist: list[str]
         :type irc_ctcp_text: str
+        :type irc_tags: dict[str, str]
+        :type irc_message: cloudbot.util.ircparse.Message
         """
         self.db = None
         self.db_executor = None
@@ -99,37 +184,32 @@ class Event:
             if self.hook is None and base_event.hook is not None:
                 self.hook = base_event.hook
 
-            # If base_event is provided, don't check these parameters, just inherit
-            self.type = base_event.type
-            self.content = base_event.content
-            self.target = base_event.target
-            self.chan = base_event.chan
-            self.nick = base_event.nick
-            self.user = base_event.user
-            self.host = base_event.host
-            self.mask = base_event.mask
-            # clients-specific parameters
-            self.irc_raw = base_event.irc_raw
-            self.irc_prefix = base_event.irc_prefix
-            self.irc_command = base_event.irc_command
-            self.irc_paramlist = base_event.irc_paramlist
-            self.irc_ctcp_text = base_event.irc_ctcp_text
+            # If base_event is provided, don't check these parameters, just share the base event's values. Neither
+            # event owns the shared values anymore, so whichever changes them first will make its own copy.
+            self._data = base_event._data
+            self._owns_data = False
+            base_event._owns_data = False
         else:
             # Since base_event wasn't provided, we can take these parameters
-            self.type = event_type
-            self.content = content
-            self.target = target
-            self.chan = channel
-            self.nick = nick
-            self.user = user
-            self.host = host
-            self.mask = mask
-            # clients-specific parameters
-            self.irc_raw = irc_raw
-            self.irc_prefix = irc_prefix
-            self.irc_command = irc_command
-            self.irc_paramlist = irc_paramlist
-            self.irc_ctcp_text = irc_ctcp_text
+            self._data = _EventData(event_type, content, target, channel, nick, user, host, mask, irc_raw, irc_prefix,
+                                    irc_command, irc_paramlist, irc_ctcp_text, irc_tags, irc_message)
+            self._owns_data = True
+
+    type = _shared_field("type")
+    content = _shared_field("content")
+    target = _shared_field("target")
+    chan = _shared_field("chan")
+    nick = _netmask_field("nick", 0)
+    user = _netmask_field("user", 1)
+    host = _netmask_field("host", 2)
+    mask = _shared_field("mask")
+    irc_raw = _shared_field("irc_raw")
+    irc_prefix = _shared_field("irc_prefix")
+    irc_command = _shared_field("irc_command")
+    irc_paramlist = _shared_field("irc_paramlist")
+    irc_ctcp_text = _shared_field("irc_ctcp_text")
+    irc_tags = _shared_field("irc_tags")
+    irc_message = _shared_field("irc_message")
 
     @asyncio.coroutine
     def prepare(self):
@@ -148,10 +228,9 @@ class Event:
         if "db" in self.hook.required_args:
             #logger.debug("Opening database session for {}:threaded=False".format(self.hook.description))
 
-            # we're running a coroutine hook with a db, so initialise an executor pool
-            self.db_executor = concurrent.futures.ThreadPoolExecutor(1)
-            # be sure to initialize the db in the database executor, so it will be accessible in that thread.
-            self.db = yield from self.async(self.bot.db_session)
+            # database threads are shared between events, so this event gets a session of its own rather than the
+            # thread's scoped session
+            self.db = yield from self.async(self.bot.db_factory)
 
     def prepare_threaded(self):
         """
@@ -186,9 +265,12 @@ class Event:
 
         if self.db is not None:
             #logger.debug("Closing database session for {}:threaded=False".format(self.hook.description))
-            # be sure the close the database in the database executor, as it is only accessable in that one thread
-            yield from self.async(self.db.close)
-            self.db = None
+            # be sure the close the database in a database thread, as it may block
+            try:
+                yield from self.async(self.db.close)
+            finally:
+                self.db = None
+                self.db_executor = None
 
     def close_threaded(self):
         """
@@ -309,14 +391,31 @@ class Event:
 
     @asyncio.coroutine
     def async(self, function, *args, **kwargs):
-        if self.db_executor is not None:
-            executor = self.db_executor
-        else:
-            executor = None
         if kwargs:
-            result = yield from self.loop.run_in_executor(executor, function, *args)
+            call = lambda: function(*args, **kwargs)
         else:
-            result = yield from self.loop.run_in_executor(executor, lambda: function(*args, **kwargs))
+            call = functools.partial(function, *args)
+
+        if self.hook is None or "db" not in self.hook.required_args:
+            result = yield from self.loop.run_in_executor(None, call)
+            return result
+
+        # reserve a database thread for this call only, so the hook doesn't hold one while it waits on anything else.
+        # The thread this event used last is preferred, so its session usually stays in one thread.
+        executor_future = self.bot.db_executor.acquire(self.db_executor)
+        try:
+            executor = yield from executor_future
+        except asyncio.CancelledError:
+            if executor_future.done() and not executor_future.cancelled():
+                # we were given a thread just before being cancelled
+                self.bot.db_executor.release(executor_future.result())
+            raise
+
+        try:
+            result = yield from self.loop.run_in_executor(executor, call)
+        finally:
+            self.bot.db_executor.release(executor)
+        self.db_executor = executor
         return result
 
 
@@ -326,6 +425,7 @@ class CommandEvent(Event):
     :type text: str
     :type triggered_command: str
     """
+    __slots__ = ("text", "doc", "triggered_command")
 
     def __init__(self, *, bot=None, hook, text, triggered_command, conn=None, base_event=None, event_type=None,
                  content=None, target=None, channel=None, nick=None, user=None, host=None, mask=None, irc_raw=None,
@@ -369,6 +469,7 @@ class RegexEvent(Event):
     :type hook: cloudbot.plugin.RegexHook
     :type match: re.__Match
     """
+    __slots__ = ("match",)
 
     def __init__(self, *, bot=None, hook, match, conn=None, base_event=None, event_type=None, content=None, target=None,
                  channel=None, nick=None, user=None, host=None, mask=None, irc_raw=None, irc_prefix=None,
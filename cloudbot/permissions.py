@@ -1,6 +1,9 @@
 from fnmatch import fnmatch
+import functools
 import logging
 
+from cloudbot.util.maskmatcher import MaskMatcher
+
 logger = logging.getLogger("cloudbot")
 
 # put your hostmask here for magic
@@ -15,6 +18,8 @@ class PermissionManager(object):
     :type group_perms: dict[str, list[str]]
     :type group_users: dict[str, list[str]]
     :type perm_users: dict[str, list[str]]
+    :type perm_matchers: dict[str, MaskMatcher]
+    :type group_matchers: dict[str, MaskMatcher]
     """
 
     def __init__(self, conn):
@@ -30,6 +35,8 @@ class PermissionManager(object):
         self.group_perms = {}
         self.group_users = {}
         self.perm_users = {}
+        self.perm_matchers = {}
+        self.group_matchers = {}
 
         self.reload()
 
@@ -60,6 +67,13 @@ class PermissionManager(object):
                     self.perm_users[perm] = []
                 self.perm_users[perm].extend(users)
 
+        # compile the masks, and forget the permissions of users matched with the old ones
+        self.perm_matchers = {perm: MaskMatcher(users) for perm, users in self.perm_users.items()}
+        self.group_matchers = {group: MaskMatcher(users) for group, users in self.group_users.items()}
+        cache_size = self.config.get("permission_cache_size", 1024)
+        self._user_permissions = functools.lru_cache(cache_size)(self._find_user_permissions)
+        self._user_groups = functools.lru_cache(cache_size)(self._find_user_groups)
+
         logger.debug("[{}|permissions] Group permissions: {}".format(self.name, self.group_perms))
         logger.debug("[{}|permissions] Group users: {}".format(self.name, self.group_users))
         logger.debug("[{}|permissions] Permission users: {}".format(self.name, self.perm_users))
@@ -79,13 +93,10 @@ class PermissionManager(object):
             # no one has access
             return False
 
-        allowed_users = self.perm_users[perm.lower()]
-
-        for allowed_mask in allowed_users:
-            if fnmatch(user_mask.lower(), allowed_mask):
-                if notice:
-                    logger.info("[{}|permissions] Allowed user {} access to {}".format(self.name, user_mask, perm))
-                return True
+        if perm.lower() in self._user_permissions(user_mask.lower()):
+            if notice:
+                logger.info("[{}|permissions] Allowed user {} access to {}".format(self.name, user_mask, perm))
+            return True
 
         return False
 
@@ -109,27 +120,39 @@ class PermissionManager(object):
     def get_user_permissions(self, user_mask):
         """
         :type user_mask: str
-        :rtype: list[str]
+        :rtype: set[str]
         """
-        permissions = set()
-        for permission, users in self.perm_users.items():
-            for mask_to_check in users:
-                if fnmatch(user_mask.lower(), mask_to_check):
-                    permissions.add(permission)
-        return permissions
+        return set(self._user_permissions(user_mask.lower()))
 
     def get_user_groups(self, user_mask):
         """
         :type user_mask: str
         :rtype: list[str]
         """
-        groups = []
-        for group, users in self.group_users.items():
-            for mask_to_check in users:
-                if fnmatch(user_mask.lower(), mask_to_check):
-                    groups.append(group)
-                    continue
-        return groups
+        return list(self._user_groups(user_mask.lower()))
+
+    def _find_user_permissions(self, user_mask):
+        """
+        :param user_mask: A lowercase user mask
+        :type user_mask: str
+        :rtype: frozenset[str]
+        """
+        return frozenset(perm for perm, matcher in self.perm_matchers.items() if matcher.match(user_mask))
+
+    def _find_user_groups(self, user_mask):
+        """
+        :param user_mask: A lowercase user mask
+        :type user_mask: str
+        :rtype: tuple[str]
+        """
+        return tuple(group for group, matcher in self.group_matchers.items() if matcher.match(user_mask))
+
+    def cache_info(self):
+        """
+        The hits, misses and sizes of the caches of user permissions and groups
+        :rtype: (functools._CacheInfo, functools._CacheInfo)
+        """
+        return self._user_permissions.cache_info(), self._user_groups.cache_info()
 
     def group_exists(self, group):
         """
@@ -146,13 +169,7 @@ class PermissionManager(object):
         :type user_mask: str
         :rtype: bool
         """
-        users = self.group_users.get(group.lower())
-        if not users:
-            return False
-        for mask_to_check in users:
-            if fnmatch(user_mask.lower(), mask_to_check):
-                return True
-        return False
+        return group.lower() in self._user_groups(user_mask.lower())
 
     def remove_group_user(self, group, user_mask):
         """
@@ -1,15 +1,21 @@
 import asyncio
+import collections
 import glob
 import importlib
 import inspect
 import logging
+import operator
 import os
 import re
+import time
 
 import sqlalchemy
 
-from cloudbot.event import Event
+from cloudbot.event import Event, CommandEvent, RegexEvent
 from cloudbot.util import database
+from cloudbot.util.prefixtrie import PrefixTrie
+from cloudbot.util.regexmatcher import RegexMatcher
+from cloudbot.util.scheduler import PeriodicJob
 
 logger = logging.getLogger("cloudbot")
 
@@ -18,7 +24,8 @@ def find_hooks(parent, module):
     """
     :type parent: Plugin
     :type module: object
-    :rtype: (list[CommandHook], list[RegexHook], list[RawHook], list[SieveHook], List[EventHook], list[OnStartHook])
+    :rtype: (list[CommandHook], list[RegexHook], list[RawHook], list[SieveHook], List[EventHook], list[PeriodicHook],
+             list[OnStartHook], list[OnStopHook])
     """
     # set the loaded flag
     module._cloudbot_loaded = True
@@ -29,8 +36,9 @@ def find_hooks(parent, module):
     event = []
     periodic = []
     on_start = []
+    on_stop = []
     type_lists = {"command": command, "regex": regex, "irc_raw": raw, "sieve": sieve, "event": event,
-                  "periodic": periodic, "on_start": on_start}
+                  "periodic": periodic, "on_start": on_start, "on_stop": on_stop}
     for name, func in module.__dict__.items():
         if hasattr(func, "_cloudbot_hook"):
             # if it has cloudbot hook
@@ -42,7 +50,15 @@ def find_hooks(parent, module):
             # delete the hook to free memory
             del func._cloudbot_hook
 
-    return command, regex, raw, sieve, event, periodic, on_start
+    return command, regex, raw, sieve, event, periodic, on_start, on_stop
+
+
+def find_migrations(code):
+    """
+    :type code: object
+    :rtype: list[cloudbot.util.database.Migration]
+    """
+    return [obj for obj in code.__dict__.values() if isinstance(obj, database.Migration)]
 
 
 def find_tables(code):
@@ -76,11 +92,14 @@ class PluginManager:
     :type bot: cloudbot.bot.CloudBot
     :type plugins: dict[str, Plugin]
     :type commands: dict[str, CommandHook]
+    :type command_trie: PrefixTrie
     :type raw_triggers: dict[str, list[RawHook]]
     :type catch_all_triggers: list[RawHook]
     :type event_type_hooks: dict[cloudbot.event.EventType, list[EventHook]]
     :type regex_hooks: list[(re.__Regex, RegexHook)]
+    :type regex_matcher: RegexMatcher
     :type sieves: list[SieveHook]
+    :type channel_sieves: list[SieveHook]
     """
 
     def __init__(self, bot):
@@ -92,11 +111,21 @@ class PluginManager:
 
         self.plugins = {}
         self.commands = {}
+        # the same command aliases as self.commands, for looking up abbreviated commands
+        self.command_trie = PrefixTrie()
         self.raw_triggers = {}
         self.catch_all_triggers = []
         self.event_type_hooks = {}
         self.regex_hooks = []
+        # the same regexes as self.regex_hooks, indexed by the literals they require
+        self.regex_matcher = RegexMatcher()
         self.sieves = []
+        # sieves which only depend on the connection and channel, see get_blocked_hooks()
+        self.channel_sieves = []
+        # (connection name, channel) -> the hooks which can't run in that channel, in least to most recently used order
+        self._blocked_hooks = collections.OrderedDict()
+        # the most channels to remember the blocked hooks of. Private messages get an entry per nick.
+        self.blocked_hooks_cache_size = 1024
         self._hook_waiting_queues = {}
 
     @asyncio.coroutine
@@ -108,9 +137,42 @@ class PluginManager:
 
         :type plugin_dir: str
         """
+        start = time.time()
         path_list = glob.iglob(os.path.join(plugin_dir, '*.py'))
         # Load plugins asynchronously :O
-        yield from asyncio.gather(*[self.load_plugin(path) for path in path_list], loop=self.bot.loop)
+        plugins = yield from asyncio.gather(*[self._import_plugin(path) for path in path_list], loop=self.bot.loop)
+        plugins = [plugin for plugin in plugins if plugin is not None]
+        import_time = time.time() - start
+
+        # create the tables of all plugins at once, instead of a few queries per table
+        start = time.time()
+        yield from self._create_all_tables(plugins)
+        database_time = time.time() - start
+
+        start = time.time()
+        yield from asyncio.gather(*[self._register_plugin(plugin) for plugin in plugins], loop=self.bot.loop)
+        register_time = time.time() - start
+
+        logger.info("Loaded {} plugins in {:.2f}s (importing: {:.2f}s, database: {:.2f}s, on_start and registering: "
+                    "{:.2f}s)".format(len(self.plugins), import_time + database_time + register_time, import_time,
+                                      database_time, register_time))
+
+    @asyncio.coroutine
+    def _create_all_tables(self, plugins):
+        """
+        Creates the tables and applies the migrations of all given plugins in a single transaction
+
+        :type plugins: list[Plugin]
+        """
+        schemas = [(plugin.title, plugin.tables, plugin.migrations) for plugin in plugins
+                   if plugin.tables or plugin.migrations]
+        if not schemas:
+            return
+
+        versions = yield from self.bot.loop.run_in_executor(None, database.migrate_all, self.bot.db_engine, schemas)
+        for plugin in plugins:
+            if plugin.migrations:
+                logger.debug("Database schema of {} is at version {}".format(plugin.title, versions[plugin.title]))
 
     @asyncio.coroutine
     def load_plugin(self, path):
@@ -121,6 +183,24 @@ class PluginManager:
 
         :type path: str
         """
+        plugin = yield from self._import_plugin(path)
+        if plugin is None:
+            return
+
+        # create database tables
+        yield from plugin.create_tables(self.bot)
+
+        yield from self._register_plugin(plugin)
+
+    @asyncio.coroutine
+    def _import_plugin(self, path):
+        """
+        Imports the plugin from the given path, unloading the previously loaded version of it
+
+        :type path: str
+        :return: The plugin, or None if it couldn't or shouldn't be loaded
+        :rtype: Plugin | None
+        """
 
         file_path = os.path.abspath(path)
         file_name = os.path.basename(path)
@@ -155,11 +235,24 @@ class PluginManager:
         # create the plugin
         plugin = Plugin(file_path, file_name, title, plugin_module)
 
-        # proceed to register hooks
+        # hooks asking for arguments events don't have would fail every time they're run, so leave them out. The
+        # rest of the plugin is still loaded, as the old copy of it is already gone.
+        invalid_hooks = [hook for hook in plugin.hooks if hook.invalid_args]
+        if invalid_hooks:
+            for hook in invalid_hooks:
+                logger.error("Not registering hook {} in plugin {}: it asked for invalid arguments {}".format(
+                    hook.function_name, plugin.title, hook.invalid_args))
+            plugin.remove_hooks(invalid_hooks)
 
-        # create database tables
-        yield from plugin.create_tables(self.bot)
+        return plugin
+
+    @asyncio.coroutine
+    def _register_plugin(self, plugin):
+        """
+        Runs the on_start hooks of a plugin, then registers all of its hooks. Its tables need to exist already.
 
+        :type plugin: Plugin
+        """
         # run on_start hooks
         for on_start_hook in plugin.run_on_start:
             success = yield from self.launch(on_start_hook, Event(bot=self.bot, hook=on_start_hook))
@@ -173,7 +266,10 @@ class PluginManager:
         self.plugins[plugin.file_name] = plugin
 
         for periodic_hook in plugin.periodic:
-            asyncio.async(self._start_periodic(periodic_hook))
+            periodic_hook.job = PeriodicJob(self.bot.loop, periodic_hook.interval, self._run_periodic, periodic_hook,
+                                            initial_interval=periodic_hook.initial_interval,
+                                            fixed_rate=periodic_hook.fixed_rate, jitter=periodic_hook.jitter)
+            periodic_hook.job.start()
             self._log_hook(periodic_hook)
 
 
@@ -186,6 +282,7 @@ class PluginManager:
                         "Ignoring new assignment.".format(plugin.title, alias, self.commands[alias].plugin.title))
                 else:
                     self.commands[alias] = command_hook
+                    self.command_trie[alias] = command_hook
             self._log_hook(command_hook)
 
         # register raw hooks
@@ -213,15 +310,33 @@ class PluginManager:
         for regex_hook in plugin.regexes:
             for regex_match in regex_hook.regexes:
                 self.regex_hooks.append((regex_match, regex_hook))
+                self.regex_matcher.add(regex_match, regex_hook)
             self._log_hook(regex_hook)
 
         # register sieves
         for sieve_hook in plugin.sieves:
-            self.sieves.append(sieve_hook)
+            if sieve_hook.per_channel and (not sieve_hook.threaded or sieve_hook.blocking):
+                # get_blocked_hooks() runs per-channel sieves inline, for every hook at once
+                logger.warning("Sieve {} can't be per-channel, as it isn't a quick synchronous function. Running it "
+                               "on every hook launch instead.".format(sieve_hook.description))
+                sieve_hook.per_channel = False
+            if sieve_hook.per_channel:
+                self.channel_sieves.append(sieve_hook)
+            else:
+                self.sieves.append(sieve_hook)
             self._log_hook(sieve_hook)
 
         # sort sieve hooks by priority
         self.sieves.sort(key=lambda x: x.priority)
+        self.channel_sieves.sort(key=lambda x: x.priority)
+        self.clear_channel_hooks()
+
+        # compile which sieves run for each hook. New sieves can apply to any loaded hook.
+        if plugin.sieves:
+            self._compile_all_sieve_chains()
+        else:
+            for hook in plugin.sieved_hooks:
+                self._compile_sieve_chain(hook)
 
         # we don't need this anymore
         del plugin.run_on_start
@@ -249,12 +364,16 @@ class PluginManager:
         # get the loaded plugin
         plugin = self.plugins[file_name]
 
+        # run on_stop hooks, while everything they might use is still registered
+        yield from self._run_on_stop(plugin)
+
         # unregister commands
         for command_hook in plugin.commands:
             for alias in command_hook.aliases:
                 if alias in self.commands and self.commands[alias] == command_hook:
                     # we need to make sure that there wasn't a conflict, so we don't delete another plugin's command
                     del self.commands[alias]
+                    del self.command_trie[alias]
 
         # unregister raw hooks
         for raw_hook in plugin.raw_hooks:
@@ -279,10 +398,23 @@ class PluginManager:
         for regex_hook in plugin.regexes:
             for regex_match in regex_hook.regexes:
                 self.regex_hooks.remove((regex_match, regex_hook))
+                self.regex_matcher.remove(regex_match, regex_hook)
 
         # unregister sieves
         for sieve_hook in plugin.sieves:
-            self.sieves.remove(sieve_hook)
+            if sieve_hook.per_channel:
+                self.channel_sieves.remove(sieve_hook)
+            else:
+                self.sieves.remove(sieve_hook)
+        if plugin.sieves:
+            self._compile_all_sieve_chains()
+        self.clear_channel_hooks()
+
+        # cancel the plugin's scheduled jobs
+        for periodic_hook in plugin.periodic:
+            if periodic_hook.job is not None:
+                periodic_hook.job.stop()
+        self.bot.scheduler.cancel_all(plugin.title)
 
         # unregister databases
         plugin.unregister_tables(self.bot)
@@ -295,6 +427,89 @@ class PluginManager:
 
         return True
 
+    @asyncio.coroutine
+    def stop_plugins(self):
+        """
+        Runs the on_stop hooks of all loaded plugins, for when the bot is shutting down. The plugins stay loaded.
+        """
+        for plugin in list(self.plugins.values()):
+            yield from self._run_on_stop(plugin)
+
+    @asyncio.coroutine
+    def _run_on_stop(self, plugin):
+        """
+        :type plugin: Plugin
+        """
+        for on_stop_hook in plugin.run_on_stop:
+            yield from self.launch(on_stop_hook, Event(bot=self.bot, hook=on_stop_hook))
+
+    def _compile_sieve_chain(self, hook):
+        """
+        Finds the sieves which apply to the given hook, in the order they should be run
+
+        :type hook: Hook
+        """
+        if hook.type in ("on_start", "on_stop", "periodic"):  # we don't need sieves on these hooks.
+            hook.sieve_chain = []
+        else:
+            hook.sieve_chain = [sieve for sieve in self.sieves if sieve.applies_to(hook)]
+
+    def _compile_all_sieve_chains(self):
+        for plugin in self.plugins.values():
+            for hook in plugin.sieved_hooks:
+                self._compile_sieve_chain(hook)
+
+    def get_blocked_hooks(self, conn, chan):
+        """
+        Finds the hooks which can't run in the given channel, because a per-channel sieve blocks them. This is worked
+        out once per channel, and then cached until clear_channel_hooks() is called. Per-channel sieves are quick and
+        synchronous, so this runs them all directly, without giving up the event loop.
+
+        :type conn: cloudbot.client.Client
+        :type chan: str
+        :rtype: set[Hook]
+        """
+        if chan is None or not self.channel_sieves:
+            return frozenset()
+
+        key = (conn.name, chan)
+        blocked = self._blocked_hooks.get(key)
+        if blocked is not None:
+            self._blocked_hooks.move_to_end(key)
+            return blocked
+
+        blocked = set()
+        # per-channel sieves only look at the connection and channel, so all hooks can share an event
+        event = Event(bot=self.bot, conn=conn, channel=chan)
+        for plugin in self.plugins.values():
+            for hook in plugin.sieved_hooks:
+                for sieve in self.channel_sieves:
+                    if sieve.applies_to(hook) and self._sieve_inline(sieve, event, hook) is None:
+                        blocked.add(hook)
+                        break
+
+        self._blocked_hooks[key] = blocked
+        if len(self._blocked_hooks) > self.blocked_hooks_cache_size:
+            self._blocked_hooks.popitem(last=False)
+        return blocked
+
+    def clear_channel_hooks(self, conn=None, chan=None):
+        """
+        Forgets which hooks are blocked in a channel, for example after its settings changed. If conn or chan are
+        None, all connections or channels are cleared. This is *not* threadsafe, threaded hooks should call it with
+        bot.loop.call_soon_threadsafe().
+
+        :type conn: cloudbot.client.Client
+        :type chan: str
+        """
+        if conn is None and chan is None:
+            self._blocked_hooks.clear()
+            return
+
+        for conn_name, channel in list(self._blocked_hooks):
+            if (conn is None or conn_name == conn.name) and (chan is None or channel == chan):
+                del self._blocked_hooks[(conn_name, channel)]
+
     def _log_hook(self, hook):
         """
         Logs registering a given hook
@@ -311,19 +526,16 @@ class PluginManager:
 
         :type hook: cloudbot.plugin.Hook
         :type event: cloudbot.event.Event
-        :rtype: list
+        :rtype: list | tuple
         """
-        parameters = []
-        for required_arg in hook.required_args:
-            if hasattr(event, required_arg):
-                value = getattr(event, required_arg)
-                parameters.append(value)
-            else:
-                logger.error("Plugin {} asked for invalid argument '{}', cancelling execution!"
-                             .format(hook.description, required_arg))
-                logger.debug("Valid arguments are: {} ({})".format(dir(event), event))
-                return None
-        return parameters
+        try:
+            return hook.get_arguments(event)
+        except AttributeError:
+            # the arguments are validated when the plugin is loaded, so this should only happen with an event of the
+            # wrong type
+            logger.exception("Plugin {} asked for an argument {} doesn't have, cancelling execution!"
+                             .format(hook.description, type(event).__name__))
+            return None
 
     def _execute_hook_threaded(self, hook, event):
         """
@@ -388,14 +600,35 @@ class PluginManager:
                 event.reply(str(out))
         return True
 
+    def _sieve_inline(self, sieve, event, hook):
+        """
+        Runs a synchronous sieve directly in the event loop
+
+        :type sieve: SieveHook
+        :type event: cloudbot.event.Event
+        :type hook: cloudbot.plugin.Hook
+        :rtype: cloudbot.event.Event
+        """
+        start = time.perf_counter()
+        try:
+            result = sieve.function(self.bot, event, hook)
+        except Exception:
+            logger.exception("Error running sieve {} on {}:".format(sieve.description, hook.description))
+            result = None
+        sieve.count(result, time.perf_counter() - start)
+        return result
+
     @asyncio.coroutine
     def _sieve(self, sieve, event, hook):
         """
-        :type sieve: cloudbot.plugin.Hook
+        Runs a coroutine sieve, or a synchronous sieve which was marked as blocking in an executor
+
+        :type sieve: SieveHook
         :type event: cloudbot.event.Event
         :type hook: cloudbot.plugin.Hook
         :rtype: cloudbot.event.Event
         """
+        start = time.perf_counter()
         try:
             if sieve.threaded:
                 result = yield from self.bot.loop.run_in_executor(None, sieve.function, self.bot, event, hook)
@@ -403,20 +636,21 @@ class PluginManager:
                 result = yield from sieve.function(self.bot, event, hook)
         except Exception:
             logger.exception("Error running sieve {} on {}:".format(sieve.description, hook.description))
-            return None
-        else:
-            return result
+            result = None
+        sieve.count(result, time.perf_counter() - start)
+        return result
 
     @asyncio.coroutine
-    def _start_periodic(self, hook):
-        interval = hook.interval
-        initial_interval = hook.initial_interval
-        yield from asyncio.sleep(initial_interval)
+    def _run_periodic(self, hook):
+        """
+        Runs a periodic hook, from its job
+        :type hook: PeriodicHook
+        """
+        if self.plugins.get(hook.plugin.file_name) is not hook.plugin:
+            # the plugin was unloaded since this run was scheduled
+            return
 
-        while True:
-            event = Event(bot=self.bot, hook=hook)
-            yield from self.launch(hook, event)
-            yield from asyncio.sleep(interval)
+        yield from self.launch(hook, Event(bot=self.bot, hook=hook))
 
     @asyncio.coroutine
     def launch(self, hook, event):
@@ -430,11 +664,17 @@ class PluginManager:
         :rtype: bool
         """
 
-        if hook.type not in ("on_start", "periodic"):  # we don't need sieves on on_start hooks.
-            for sieve in self.bot.plugin_manager.sieves:
+        if hook.sieve_chain is None:
+            # this hook wasn't registered through load_plugin
+            self._compile_sieve_chain(hook)
+
+        for sieve in hook.sieve_chain:
+            if sieve.threaded and not sieve.blocking:
+                event = self._sieve_inline(sieve, event, hook)
+            else:
                 event = yield from self._sieve(sieve, event, hook)
-                if event is None:
-                    return False
+            if event is None:
+                return False
 
         if hook.type == "command" and hook.auto_help and not event.text and hook.doc is not None:
             event.notice_doc()
@@ -493,7 +733,9 @@ class Plugin:
     :type raw_hooks: list[RawHook]
     :type sieves: list[SieveHook]
     :type events: list[EventHook]
+    :type run_on_stop: list[OnStopHook]
     :type tables: list[sqlalchemy.Table]
+    :type migrations: list[cloudbot.util.database.Migration]
     """
 
     def __init__(self, filepath, filename, title, code):
@@ -505,26 +747,55 @@ class Plugin:
         self.file_path = filepath
         self.file_name = filename
         self.title = title
-        self.commands, self.regexes, self.raw_hooks, self.sieves, self.events, self.periodic, self.run_on_start = find_hooks(self, code)
+        self.commands, self.regexes, self.raw_hooks, self.sieves, self.events, self.periodic, self.run_on_start, \
+            self.run_on_stop = find_hooks(self, code)
         # we need to find tables for each plugin so that they can be unloaded from the global metadata when the
         # plugin is reloaded
         self.tables = find_tables(code)
+        self.migrations = find_migrations(code)
+
+    @property
+    def hooks(self):
+        """
+        All hooks of this plugin
+        :rtype: list[Hook]
+        """
+        return self.commands + self.regexes + self.raw_hooks + self.sieves + self.events + self.periodic + \
+            getattr(self, "run_on_start", []) + self.run_on_stop
+
+    def remove_hooks(self, hooks):
+        """
+        Removes the given hooks from this plugin, so they aren't registered
+        :type hooks: list[Hook]
+        """
+        for hook_list in (self.commands, self.regexes, self.raw_hooks, self.sieves, self.events, self.periodic,
+                          self.run_on_start, self.run_on_stop):
+            hook_list[:] = [hook for hook in hook_list if hook not in hooks]
+
+    @property
+    def sieved_hooks(self):
+        """
+        All hooks of this plugin which events are run through sieves for
+        :rtype: list[Hook]
+        """
+        return self.commands + self.regexes + self.raw_hooks + self.events
 
     @asyncio.coroutine
     def create_tables(self, bot):
         """
-        Creates all sqlalchemy Tables that are registered in this plugin
+        Creates all sqlalchemy Tables that are registered in this plugin, and applies its migrations
 
         :type bot: cloudbot.bot.CloudBot
         """
-        if self.tables:
+        if self.tables or self.migrations:
             # if there are any tables
 
             logger.info("Registering tables for {}".format(self.title))
 
-            for table in self.tables:
-                if not (yield from bot.loop.run_in_executor(None, table.exists, bot.db_engine)):
-                    yield from bot.loop.run_in_executor(None, table.create, bot.db_engine)
+            version = yield from bot.loop.run_in_executor(None, database.migrate, bot.db_engine, self.title,
+                                                          self.tables, self.migrations)
+            if self.migrations:
+                logger.debug("Database schema of {} is at version {}".format(self.title, version))
 
     def unregister_tables(self, bot):
         """
@@ -539,6 +810,21 @@ class Plugin:
                 bot.db_metadata.remove(table)
 
 
+def _compile_argument_getter(args):
+    """
+    Creates a function which gets the given attributes of an event, as a tuple
+    :type args: list[str]
+    :rtype: (cloudbot.event.Event) -> tuple
+    """
+    if not args:
+        return lambda event: ()
+    if len(args) == 1:
+        # attrgetter only returns a tuple for multiple attributes
+        getter = operator.attrgetter(args[0])
+        return lambda event: (getter(event),)
+    return operator.attrgetter(*args)
+
+
 class Hook:
     """
     Each hook is specific to one function. This class is never used by itself, rather extended.
@@ -551,6 +837,9 @@ class Hook:
     :type threaded: bool
     :type permissions: list[str]
     :type single_thread: bool
+    :type sieve_chain: list[SieveHook]
+    :type invalid_args: list[str]
+    :type get_arguments: (cloudbot.event.Event) -> tuple
     """
 
     def __init__(self, _type, plugin, func_hook):
@@ -571,6 +860,14 @@ class Hook:
         # don't process args starting with "_"
         self.required_args = [arg for arg in self.required_args if not arg.startswith("_")]
 
+        if _type == "sieve":
+            # sieves are called with (bot, event, hook) rather than with event attributes
+            self.invalid_args = []
+        else:
+            event_class = hook_event_classes.get(_type, Event)
+            self.invalid_args = [arg for arg in self.required_args if not hasattr(event_class, arg)]
+        self.get_arguments = _compile_argument_getter(self.required_args)
+
         if asyncio.iscoroutine(self.function) or asyncio.iscoroutinefunction(self.function):
             self.threaded = False
         else:
@@ -579,6 +876,9 @@ class Hook:
         self.permissions = func_hook.kwargs.pop("permissions", [])
         self.single_thread = func_hook.kwargs.pop("singlethread", False)
 
+        # the sieves which apply to this hook, set by the PluginManager
+        self.sieve_chain = None
+
         if func_hook.kwargs:
             # we should have popped all the args, so warn if there are any left
             logger.warning("Ignoring extra args {} from {}".format(func_hook.kwargs, self.description))
@@ -650,6 +950,10 @@ class RegexHook(Hook):
 class PeriodicHook(Hook):
     """
     :type interval: int
+    :type initial_interval: int
+    :type fixed_rate: bool
+    :type jitter: float | None
+    :type job: cloudbot.util.scheduler.PeriodicJob
     """
 
     def __init__(self, plugin, periodic_hook):
@@ -660,11 +964,25 @@ class PeriodicHook(Hook):
 
         self.interval = periodic_hook.interval
         self.initial_interval = periodic_hook.kwargs.pop("initial_interval", self.interval)
+        # if True, runs are due every interval seconds, rather than interval seconds after the last run finished
+        self.fixed_rate = periodic_hook.kwargs.pop("fixed_rate", False)
+        # up to this many seconds are randomly added to each run. If it isn't given, up to 5% of the interval is added
+        # to the first run only, so hooks loaded together don't all run together.
+        self.jitter = periodic_hook.kwargs.pop("jitter", None)
 
         super().__init__("periodic", plugin, periodic_hook)
 
+        # runs the hook, and counts its runs, while the plugin is loaded
+        self.job = None
+
     def __repr__(self):
-        return "Periodic[interval: [{}], {}]".format(self.interval, Hook.__repr__(self))
+        job = self.job
+        if job is None:
+            return "Periodic[interval: [{}], fixed_rate: {}, {}]".format(self.interval, self.fixed_rate,
+                                                                         Hook.__repr__(self))
+        return "Periodic[interval: [{}], fixed_rate: {}, runs: {}, skipped: {}, run_time: {:.3f}, " \
+               "max_lateness: {:.3f}, {}]".format(self.interval, self.fixed_rate, job.runs, job.skipped,
+                                                  job.run_time, job.max_lateness, Hook.__repr__(self))
 
     def __str__(self):
         return "periodic hook ({} seconds) {} from {}".format(self.interval, self.function_name, self.plugin.file_name)
@@ -695,6 +1013,16 @@ class RawHook(Hook):
 
 
 class SieveHook(Hook):
+    """
+    :type priority: int
+    :type per_channel: bool
+    :type hook_types: set[str] | None
+    :type blocking: bool
+    :type runs: int
+    :type rejections: int
+    :type run_time: float
+    """
+
     def __init__(self, plugin, sieve_hook):
         """
         :type plugin: Plugin
@@ -702,11 +1030,45 @@ class SieveHook(Hook):
         """
 
         self.priority = sieve_hook.kwargs.pop("priority", 100)
-        # We don't want to thread sieves by default - this is retaining old behavior for compatibility
+        # if True, the sieve only depends on the connection, channel and hook, and not on the rest of the event. Such
+        # sieves must be quick synchronous functions, see PluginManager.get_blocked_hooks().
+        self.per_channel = sieve_hook.kwargs.pop("per_channel", False)
+        hook_types = sieve_hook.kwargs.pop("hook_types", None)
+        if isinstance(hook_types, str):
+            hook_types = [hook_types]
+        self.hook_types = set(hook_types) if hook_types is not None else None
+        # synchronous sieves are run directly in the event loop, unless they are marked as blocking, in which case
+        # they are run in a thread
+        self.blocking = sieve_hook.kwargs.pop("blocking", False)
         super().__init__("sieve", plugin, sieve_hook)
 
+        # counters
+        self.runs = 0
+        self.rejections = 0
+        # total seconds spent in this sieve
+        self.run_time = 0.0
+
+    def applies_to(self, hook):
+        """
+        :type hook: Hook
+        :rtype: bool
+        """
+        return self.hook_types is None or hook.type in self.hook_types
+
+    def count(self, result, run_time):
+        """
+        Records a single run of this sieve
+        :param result: The event the sieve returned, or None if it blocked the event
+        :type run_time: float
+        """
+        self.runs += 1
+        self.run_time += run_time
+        if result is None:
+            self.rejections += 1
+
     def __repr__(self):
-        return "Sieve[{}]".format(Hook.__repr__(self))
+        return "Sieve[hook_types: {}, runs: {}, rejections: {}, run_time: {:.3f}, {}]".format(
+            self.hook_types, self.runs, self.rejections, self.run_time, Hook.__repr__(self))
 
     def __str__(self):
         return "sieve {} from {}".format(self.function_name, self.plugin.file_name)
@@ -749,6 +1111,27 @@ class OnStartHook(Hook):
         return "on_start {} from {}".format(self.function_name, self.plugin.file_name)
 
 
+class OnStopHook(Hook):
+    def __init__(self, plugin, on_stop_hook):
+        """
+        :type plugin: Plugin
+        :type on_stop_hook: cloudbot.util.hook._Hook
+        """
+        super().__init__("on_stop", plugin, on_stop_hook)
+
+    def __repr__(self):
+        return "On_stop[{}]".format(Hook.__repr__(self))
+
+    def __str__(self):
+        return "on_stop {} from {}".format(self.function_name, self.plugin.file_name)
+
+
+# the type of event each type of hook is called with
+hook_event_classes = {
+    "command": CommandEvent,
+    "regex": RegexEvent
+}
+
 _hook_name_to_plugin = {
     "command": CommandHook,
     "regex": RegexHook,
@@ -756,5 +1139,6 @@ _hook_name_to_plugin = {
     "sieve": SieveHook,
     "event": EventHook,
     "periodic": PeriodicHook,
-    "on_start": OnStartHook
+    "on_start": OnStartHook,
+    "on_stop": OnStopHook
 }
@@ -0,0 +1,90 @@
+"""
+commandmatcher.py
+
+Matches command invocations in messages. The regexes are compiled once per connection and only rebuilt when the
+command prefix or the bot's nick changes, and messages which can't be a command are rejected before any regex runs.
+
+License:
+    GPL v3
+"""
+
+import re
+
+
+class CommandMatcher:
+    """
+    Matches messages of the form "<prefix><command> <text>" or "<nick>: <command> <text>". In private messages the
+    prefix is optional.
+
+    >> matcher = CommandMatcher(".", "CloudBot")
+    >> matcher.match(".weather london", False).groups()
+    ('weather', 'london')
+    >> matcher.match("cloudbot, weather london", False).groups()
+    ('weather', 'london')
+
+    :type prefix: str
+    :type nick: str
+    """
+
+    def __init__(self, prefix, nick):
+        """
+        :param prefix: The command prefix. Each character of the string is accepted as a prefix on its own.
+        :param nick: The bot's nick
+        :type prefix: str
+        :type nick: str
+        """
+        self.prefix = None
+        self.nick = None
+        self._nick_lower = None
+        self._channel_re = None
+        self._private_re = None
+        self.update(prefix, nick)
+
+    def update(self, prefix=None, nick=None):
+        """
+        Updates the command prefix and/or nick, recompiling the regexes if either changed
+        :type prefix: str
+        :type nick: str
+        """
+        if prefix is None:
+            prefix = self.prefix
+        if nick is None:
+            nick = self.nick
+        if prefix == self.prefix and nick == self.nick:
+            return
+
+        self.prefix = prefix
+        self.nick = nick
+        self._nick_lower = nick.lower()
+
+        nick_re = r"{}[,;:]+\s+".format(re.escape(nick))
+        if prefix:
+            prefix_re = "[{}]".format(re.escape(prefix))
+            channel_trigger = "{}|{}".format(prefix_re, nick_re)
+            private_trigger = "{}?|{}".format(prefix_re, nick_re)
+        else:
+            channel_trigger = nick_re
+            private_trigger = "|" + nick_re
+
+        self._channel_re = re.compile(r"(?i)^(?:{})(\w+)(?:$|\s+)(.*)".format(channel_trigger))
+        self._private_re = re.compile(r"(?i)^(?:{})(\w+)(?:$|\s+)(.*)".format(private_trigger))
+
+    def match(self, content, private):
+        """
+        Matches a message against the command format. Group 1 of the returned match is the command, group 2 is the
+        text following it.
+        :param content: The content of the message
+        :param private: Whether this is a private message, where the command prefix is optional
+        :type content: str
+        :type private: bool
+        :rtype: re.__Match | None
+        """
+        if private:
+            return self._private_re.match(content)
+
+        # only lines starting with the prefix or the bot's nick can be a command
+        if not content:
+            return None
+        if content[0] not in self.prefix and content[:len(self._nick_lower)].lower() != self._nick_lower:
+            return None
+        return self._channel_re.match(content)
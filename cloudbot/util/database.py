@@ -1,7 +1,715 @@
 """
-database - contains variables set by cloudbot to be easily access
+database - contains variables set by cloudbot to be easily access, the database engine setup, and the executor database
+work is run in
 """
 
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import sys
+import threading
+from time import time
+
+import sqlalchemy
+from sqlalchemy import Table, Column, String, Integer
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger("cloudbot")
+
 # this is assigned in the CloudBot so that its recreated when the bot restarts
 metadata = None
 base = None
+
+# the schema version of each plugin. This isn't in the plugin metadata, so it isn't affected by plugins reloading.
+schema_metadata = sqlalchemy.MetaData()
+schema_versions = Table(
+    "schema_versions",
+    schema_metadata,
+    Column("plugin", String(100), primary_key=True),
+    Column("version", Integer, nullable=False)
+)
+
+# connection pool settings, can be overridden with the "database_pool" config option
+default_pool_options = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "timeout": 30,
+    # seconds after which connections are replaced, so servers don't close them from under us
+    "recycle": 3600
+}
+
+# set on every new SQLite connection, can be overridden with the "sqlite_pragmas" config option
+default_sqlite_pragmas = {
+    # readers don't block the writer, and commits don't need to rewrite a rollback journal
+    "journal_mode": "WAL",
+    # in WAL mode this only syncs on checkpoints, while still being safe from corruption
+    "synchronous": "NORMAL",
+    # milliseconds to wait for a lock instead of failing with "database is locked"
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024
+}
+
+
+class PoolStats:
+    """
+    Connection checkout statistics of a connection pool
+
+    :type checkouts: int
+    :type total_wait: float
+    :type max_wait: float
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait):
+        """
+        :param wait: The number of seconds a checkout took
+        :type wait: float
+        """
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def average_wait(self):
+        """
+        :rtype: float
+        """
+        if not self.checkouts:
+            return 0.0
+        return self.total_wait / self.checkouts
+
+    def __str__(self):
+        return "{} checkouts, average wait {:.1f}ms, max wait {:.1f}ms".format(
+            self.checkouts, self.average_wait * 1000, self.max_wait * 1000)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    A QueuePool which records how long getting a connection took, including waiting for a free connection and
+    opening new ones.
+
+    :type stats: PoolStats
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record(time() - start)
+
+
+def create_engine(url, pool_options=None, sqlite_pragmas=None):
+    """
+    Creates an engine for the given database url, with pooling configured for the database backend.
+
+    File SQLite databases keep up to pool_size connections open and are switched to WAL mode, so the bot's writes
+    don't each need a new connection and a full journal sync. Their pool never runs out: every session which needs a
+    connection when all pooled ones are in use gets an extra one, as it would without a pool, since threaded hooks and
+    the database threads can together have any number of sessions open. Other databases (for example PostgreSQL through
+    psycopg2) get a connection pool sized and limited with pool_options. In-memory SQLite databases only exist within a
+    single connection, so they keep SQLAlchemy's default pool.
+
+    :param pool_options: Overrides for default_pool_options
+    :param sqlite_pragmas: Overrides for default_sqlite_pragmas
+    :type url: str
+    :type pool_options: dict[str, int]
+    :type sqlite_pragmas: dict[str, str | int]
+    :rtype: sqlalchemy.engine.Engine
+    """
+    url = make_url(url)
+    is_sqlite = url.drivername.startswith("sqlite")
+    if is_sqlite and url.database in (None, "", ":memory:"):
+        # sessions of coroutine hooks may be used from more than one database thread
+        return sqlalchemy.create_engine(url, connect_args={"check_same_thread": False})
+
+    options = dict(default_pool_options)
+    if pool_options:
+        options.update(pool_options)
+
+    engine_args = {
+        "poolclass": TimedQueuePool,
+        "pool_size": options["pool_size"],
+        "max_overflow": options["max_overflow"],
+        "pool_timeout": options["timeout"],
+        "pool_recycle": options["recycle"]
+    }
+    if is_sqlite:
+        # there's no server to limit connections for, and a limit would make busy hooks time out. Connections to a
+        # local file never go stale, so they aren't recycled either.
+        engine_args["max_overflow"] = -1
+        del engine_args["pool_timeout"]
+        del engine_args["pool_recycle"]
+        # pooled connections are used by whichever thread checks them out
+        engine_args["connect_args"] = {"check_same_thread": False}
+
+    engine = sqlalchemy.create_engine(url, **engine_args)
+
+    if is_sqlite:
+        pragmas = dict(default_sqlite_pragmas)
+        if sqlite_pragmas:
+            pragmas.update(sqlite_pragmas)
+
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute("PRAGMA {} = {}".format(name, value))
+            cursor.close()
+
+        sqlalchemy.event.listen(engine, "connect", set_pragmas)
+
+    return engine
+
+
+def get_pool_stats(engine):
+    """
+    :type engine: sqlalchemy.engine.Engine
+    :return: The checkout statistics of the engine's pool, or None if its pool doesn't keep them
+    :rtype: PoolStats | None
+    """
+    return getattr(engine.pool, "stats", None)
+
+
+class Migration:
+    """
+    A versioned change to the database schema of a plugin. Plugins declare them as module level variables:
+
+    >> add_time_index = Migration(1, "create index if not exists seen_user_chan on seen_user (chan)")
+
+    Each step is either an SQL statement, or a function which is called with a sqlalchemy.engine.Connection. Databases
+    created before a plugin had any migrations have no recorded version, so the first migrations of a plugin should
+    also work on a schema which already has their changes.
+
+    :type version: int
+    :type steps: tuple[str | function]
+    """
+
+    def __init__(self, version, *steps):
+        """
+        :type version: int
+        :type steps: str | function
+        """
+        if version < 1:
+            raise ValueError("Migration versions start at 1")
+        self.version = version
+        self.steps = steps
+
+    def apply(self, connection):
+        """
+        :type connection: sqlalchemy.engine.Connection
+        """
+        for step in self.steps:
+            if callable(step):
+                step(connection)
+            else:
+                connection.execute(sqlalchemy.text(step))
+
+    def __repr__(self):
+        return "Migration[version: {}, steps: {}]".format(self.version, len(self.steps))
+
+
+def migrate(engine, plugin, tables, migrations):
+    """
+    Brings the database schema of a plugin up to date, see migrate_all()
+
+    :param plugin: The name of the plugin, used as the key of its schema version
+    :type engine: sqlalchemy.engine.Engine
+    :type plugin: str
+    :type tables: list[sqlalchemy.Table]
+    :type migrations: list[Migration]
+    :return: The schema version of the plugin
+    :rtype: int
+    """
+    return migrate_all(engine, [(plugin, tables, migrations)])[plugin]
+
+
+def migrate_all(engine, schemas):
+    """
+    Brings the database schemas of plugins up to date, in a single transaction:
+
+    - Tables which don't exist yet are created, including their indexes.
+    - Migrations newer than the recorded schema version of each plugin are applied in order. If a plugin has no
+      recorded version and all of its tables were just created, the tables already have the latest schema, so the
+      migrations are skipped.
+    - Indexes declared on tables which already existed are created if they are missing.
+    - The version of the newest migration of each plugin is recorded as its schema version.
+
+    The existing tables and schema versions are each looked up with a single query.
+
+    :param schemas: A (plugin name, tables, migrations) tuple for each plugin
+    :type engine: sqlalchemy.engine.Engine
+    :type schemas: list[(str, list[sqlalchemy.Table], list[Migration])]
+    :return: The schema version of each plugin
+    :rtype: dict[str, int]
+    """
+    with engine.begin() as connection:
+        schema_versions.create(connection, checkfirst=True)
+        recorded = {plugin: version for plugin, version in
+                    connection.execute(sqlalchemy.select([schema_versions.c.plugin, schema_versions.c.version]))}
+        table_names = set(sqlalchemy.inspect(connection).get_table_names())
+
+        new_tables = [table for plugin, tables, migrations in schemas for table in tables
+                      if table.name not in table_names]
+        for table_metadata in {table.metadata for table in new_tables}:
+            table_metadata.create_all(connection, tables=[table for table in new_tables
+                                                          if table.metadata is table_metadata], checkfirst=False)
+
+        versions = {}
+        indexed_tables = []
+        for plugin, tables, migrations in schemas:
+            migrations = sorted(migrations, key=lambda migration: migration.version)
+            latest = migrations[-1].version if migrations else 0
+            existing_tables = [table for table in tables if table.name in table_names]
+
+            version = recorded.get(plugin)
+            current = version or 0
+            if version is None and tables and not existing_tables:
+                current = latest
+                if migrations:
+                    logger.info("Created tables for {} at schema version {}, skipping migrations {}".format(
+                        plugin, latest, ", ".join(str(migration.version) for migration in migrations)))
+            for migration in migrations:
+                if migration.version > current:
+                    migration.apply(connection)
+            versions[plugin] = max(current, latest)
+
+            indexed_tables.extend(table for table in existing_tables if table.indexes)
+
+        if indexed_tables:
+            # migrations may have changed the schema, so this needs a new inspector
+            inspector = sqlalchemy.inspect(connection)
+            for table in indexed_tables:
+                index_names = {index["name"] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in index_names:
+                        index.create(connection)
+
+        for plugin, version in versions.items():
+            if plugin not in recorded:
+                if version:
+                    connection.execute(schema_versions.insert().values(plugin=plugin, version=version))
+            elif version != recorded[plugin]:
+                connection.execute(schema_versions.update().where(schema_versions.c.plugin == plugin)
+                                   .values(version=version))
+
+    return versions
+
+
+class CachedTable:
+    """
+    An in-memory mirror of a table, for plugins which look rows up on every message. The table is loaded once, and
+    writes go to both the database and the mirror, so it never needs to be reloaded.
+
+    Rows are dicts of column name -> value, keyed by the values of the key columns. Secondary indexes can be added for
+    columns rows are often looked up by. Rows which are returned must not be modified.
+
+    Threaded hooks write to mirrors while the event loop reads them, so all access to the mirror goes through a lock.
+    Database writes are made outside of it.
+
+    >> accounts = CachedTable(lastfm_table, "nick")
+    >> accounts.load(db)
+    >> accounts.upsert(db, nick="luke", acc="lukeroge")
+    >> accounts.get("luke")
+    {'nick': 'luke', 'acc': 'lukeroge'}
+    >> reminders = CachedTable(reminder_table, ("network", "added_user", "added_time"),
+    ..                         indexes=[("network", "added_user")])
+    >> reminders.find(network="snoonet", added_user="luke")
+
+    :type table: sqlalchemy.Table
+    :type key: tuple[str]
+    :type rows: dict[tuple, dict[str, object]]
+    :type hits: int
+    :type misses: int
+    :type scans: int
+    """
+
+    def __init__(self, table, key, indexes=()):
+        """
+        :param key: The column or columns which identify a row, usually the primary key of the table
+        :param indexes: Tuples of columns to index rows by
+        :type table: sqlalchemy.Table
+        :type key: str | tuple[str]
+        :type indexes: list[tuple[str]]
+        """
+        if isinstance(key, str):
+            key = (key,)
+        self.table = table
+        self.key = tuple(key)
+        self.rows = {}
+        # index columns -> index values -> key -> row
+        self._indexes = {tuple(columns): {} for columns in indexes}
+        self._index_columns = {frozenset(columns): columns for columns in self._indexes}
+        self._lock = threading.RLock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        # lookups which had to go through every row, as no index matched them
+        self.scans = 0
+
+    def _get_key(self, row):
+        return tuple(row[column] for column in self.key)
+
+    def _where(self, query, values):
+        """
+        :type values: dict[str, object]
+        """
+        for column, value in values.items():
+            query = query.where(self.table.c[column] == value)
+        return query
+
+    def _add(self, row):
+        key = self._get_key(row)
+        self._remove(key)
+        self.rows[key] = row
+        _index_row(self._indexes, key, row)
+
+    def _remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return None
+        for columns, index in self._indexes.items():
+            values = tuple(row[column] for column in columns)
+            entries = index[values]
+            del entries[key]
+            if not entries:
+                del index[values]
+        return row
+
+    def load(self, db):
+        """
+        Loads all rows of the table, replacing anything in the mirror
+        :type db: sqlalchemy.orm.Session
+        """
+        # the new rows are put together first and then swapped in, so readers never see a half loaded mirror
+        rows = {}
+        indexes = {columns: {} for columns in self._indexes}
+        for row in db.execute(self.table.select()):
+            row = dict(row)
+            key = self._get_key(row)
+            rows[key] = row
+            _index_row(indexes, key, row)
+
+        with self._lock:
+            self.rows = rows
+            self._indexes = indexes
+        logger.debug("Loaded {} rows of {} into memory ({:.1f}KiB)".format(len(self.rows), self.table.name,
+                                                                         self.memory_usage() / 1024))
+
+    def get(self, *key):
+        """
+        :param key: The values of the key columns
+        :return: The row with the given key, or None if there is none
+        :rtype: dict[str, object] | None
+        """
+        with self._lock:
+            row = self.rows.get(key)
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+
+    def find(self, **values):
+        """
+        Finds all rows with the given column values, in no particular order. This is a single lookup if an index
+        covers exactly the given columns, otherwise all rows are checked.
+        :rtype: list[dict[str, object]]
+        """
+        columns = self._index_columns.get(frozenset(values))
+        with self._lock:
+            if columns is not None:
+                entries = self._indexes[columns].get(tuple(values[column] for column in columns))
+                rows = list(entries.values()) if entries else []
+            else:
+                self.scans += 1
+                rows = [row for row in self.rows.values()
+                        if all(row[column] == value for column, value in values.items())]
+
+            if rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return rows
+
+    def insert(self, db, **values):
+        """
+        Inserts a row into the table and the mirror. Columns which aren't given get their scalar default, if any.
+        :type db: sqlalchemy.orm.Session
+        :rtype: dict[str, object]
+        """
+        db.execute(self.table.insert().values(**values))
+        db.commit()
+
+        row = {}
+        for column in self.table.columns:
+            if column.name in values:
+                row[column.name] = values[column.name]
+            elif column.default is not None and column.default.is_scalar:
+                row[column.name] = column.default.arg
+            else:
+                row[column.name] = None
+        with self._lock:
+            self._add(row)
+        return row
+
+    def update(self, db, key, **values):
+        """
+        Updates a row in the table and the mirror
+        :param key: The values of the key columns of the row
+        :type db: sqlalchemy.orm.Session
+        :type key: tuple
+        """
+        db.execute(self._where(self.table.update(), dict(zip(self.key, key))).values(**values))
+        db.commit()
+
+        with self._lock:
+            row = self._remove(tuple(key))
+            if row is not None:
+                row = dict(row)
+                row.update(values)
+                self._add(row)
+
+    def upsert(self, db, **values):
+        """
+        Updates the row with the key in the given values if it exists, or inserts a row otherwise
+        :type db: sqlalchemy.orm.Session
+        """
+        key = self._get_key(values)
+        if key in self:
+            self.update(db, key, **{column: value for column, value in values.items() if column not in self.key})
+        else:
+            self.insert(db, **values)
+
+    def delete(self, db, *key):
+        """
+        Deletes the row with the given key from the table and the mirror
+        :param key: The values of the key columns
+        :type db: sqlalchemy.orm.Session
+        """
+        db.execute(self._where(self.table.delete(), dict(zip(self.key, key))))
+        db.commit()
+        with self._lock:
+            self._remove(key)
+
+    def delete_where(self, db, **values):
+        """
+        Deletes all rows with the given column values from the table and the mirror
+        :type db: sqlalchemy.orm.Session
+        :return: The number of rows deleted from the mirror
+        :rtype: int
+        """
+        db.execute(self._where(self.table.delete(), values))
+        db.commit()
+
+        with self._lock:
+            rows = self.find(**values)
+            for row in rows:
+                self._remove(self._get_key(row))
+        return len(rows)
+
+    def memory_usage(self):
+        """
+        An estimate of the memory used by the mirror, in bytes
+        :rtype: int
+        """
+        with self._lock:
+            size = sys.getsizeof(self.rows)
+            for key, row in self.rows.items():
+                size += sys.getsizeof(key) + sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+            for index in self._indexes.values():
+                size += sys.getsizeof(index)
+                for values, entries in index.items():
+                    size += sys.getsizeof(values) + sys.getsizeof(entries)
+        return size
+
+    def __contains__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        with self._lock:
+            return key in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        # iterate over a snapshot, which writers can't change
+        with self._lock:
+            rows = list(self.rows.values())
+        return iter(rows)
+
+    def __repr__(self):
+        return "CachedTable[table: {}, rows: {}, hits: {}, misses: {}, scans: {}, memory: {:.1f}KiB]".format(
+            self.table.name, len(self.rows), self.hits, self.misses, self.scans, self.memory_usage() / 1024)
+
+
+def _index_row(indexes, key, row):
+    """
+    Adds a row to the secondary indexes of a CachedTable
+    :type indexes: dict[tuple[str], dict[tuple, dict[tuple, dict[str, object]]]]
+    :type key: tuple
+    :type row: dict[str, object]
+    """
+    for columns, index in indexes.items():
+        index.setdefault(tuple(row[column] for column in columns), {})[key] = row
+
+
+class DatabaseExecutor:
+    """
+    A fixed set of single-thread executors for running database work from coroutine hooks. A thread is reserved for
+    each database call, and given back as soon as the call is done, so a hook waiting on anything else doesn't hold
+    one. Calls wait for a free thread if all of them are in use, rather than queueing behind each other in one thread,
+    where a call waiting for a SQLite lock could hold up the call which would release it.
+
+    :type loop: asyncio.events.AbstractEventLoop
+    :type size: int
+    :type acquired: int
+    :type max_queue_depth: int
+    :type total_wait: float
+    :type max_wait: float
+    """
+
+    def __init__(self, loop, size=4):
+        """
+        :param size: The number of database threads
+        :type loop: asyncio.events.AbstractEventLoop
+        :type size: int
+        """
+        self.loop = loop
+        self.size = size
+        self._executors = [concurrent.futures.ThreadPoolExecutor(1) for _ in range(size)]
+        self._idle = collections.deque(self._executors)
+        # futures of calls waiting for a free thread
+        self._waiters = collections.deque()
+
+        # counters
+        self.acquired = 0
+        self.max_queue_depth = 0
+        # seconds calls spent waiting for a free thread
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, preferred=None):
+        """
+        Reserves a free database thread. The returned future is resolved with the executor of the thread once one is
+        free, and the executor must be given back with release().
+        :param preferred: The executor to reserve if it's free, such as the one the caller's last call ran in
+        :type preferred: concurrent.futures.ThreadPoolExecutor
+        :rtype: asyncio.Future
+        """
+        future = asyncio.Future(loop=self.loop)
+        if self._idle and not self._waiters:
+            self.acquired += 1
+            if preferred is not None and preferred in self._idle:
+                self._idle.remove(preferred)
+                future.set_result(preferred)
+            else:
+                future.set_result(self._idle.popleft())
+            return future
+
+        self._waiters.append((future, time()))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        return future
+
+    def release(self, executor):
+        """
+        Gives back a database thread reserved with acquire()
+        :type executor: concurrent.futures.ThreadPoolExecutor
+        """
+        while self._waiters:
+            future, start = self._waiters.popleft()
+            if future.done():
+                # the waiting call was cancelled
+                continue
+            wait = time() - start
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.acquired += 1
+            future.set_result(executor)
+            return
+        self._idle.append(executor)
+
+    def run(self, function, *args):
+        """
+        Runs function(*args) in a free database thread, for database work which isn't done by a hook, such as from a
+        scheduled job. Hooks should use event.async instead.
+        :type function: function
+        :return: A future resolved with the result of the call
+        :rtype: asyncio.Future
+        """
+        result = asyncio.Future(loop=self.loop)
+        acquired = self.acquire()
+
+        def start(_):
+            if acquired.cancelled():
+                return
+            executor = acquired.result()
+            if result.cancelled():
+                self.release(executor)
+                return
+            call = self.loop.run_in_executor(executor, function, *args)
+            call.add_done_callback(lambda done: finish(executor, done))
+
+        def finish(executor, call):
+            self.release(executor)
+            if result.cancelled():
+                return
+            if call.cancelled():
+                result.cancel()
+            elif call.exception() is not None:
+                result.set_exception(call.exception())
+            else:
+                result.set_result(call.result())
+
+        def cancelled(_):
+            if result.cancelled() and not acquired.done():
+                # stop waiting for a thread, release() skips cancelled waiters
+                acquired.cancel()
+
+        acquired.add_done_callback(start)
+        result.add_done_callback(cancelled)
+        return result
+
+    def shutdown(self, wait=True):
+        """
+        Stops all database threads, after they've finished the work given to them
+        :type wait: bool
+        """
+        for executor in self._executors:
+            executor.shutdown(wait=wait)
+
+    @property
+    def queue_depth(self):
+        """
+        The number of calls waiting for a free database thread
+        :rtype: int
+        """
+        return len(self._waiters)
+
+    @property
+    def busy(self):
+        """
+        The number of database threads currently reserved
+        :rtype: int
+        """
+        return self.size - len(self._idle)
+
+    @property
+    def average_wait(self):
+        """
+        The average number of seconds a call waited for a database thread
+        :rtype: float
+        """
+        if not self.acquired:
+            return 0.0
+        return self.total_wait / self.acquired
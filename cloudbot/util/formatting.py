@@ -56,6 +56,8 @@ from cloudbot.util.colors import strip_irc
 # Constants
 
 IRC_COLOR_RE = re.compile(r"(\x03(\d+,\d+|\d)|[\x0f\x02\x16\x1f])")
+IRC_FORMAT_BYTES_RE = re.compile(br"[\x02\x0f\x11\x16\x1d\x1e\x1f]|\x03(?:(\d{1,2})(?:,(\d{1,2}))?)?")
+IRC_TRAILING_COLOR_RE = re.compile(br"\x03(?:\d{1,2}(?:,\d{0,2})?)?$")
 
 REPLACEMENTS = {
     'a': 'ä',
@@ -239,6 +241,105 @@ def chunk_str(content, length=420):
     return list(chunk(content, length))
 
 
+def chunk_bytes(content, length=420, encoding="utf-8"):
+    """
+    Chunks a string into smaller strings which are at most <length> bytes long once encoded. Chunks are split on
+    spaces where possible, and never inside a multibyte character. IRC formatting (bold, colors, etc.) active at
+    the end of a chunk is restarted at the beginning of the next one. Returns chunks.
+    :rtype list
+    """
+    data = content.encode(encoding, "replace")
+    if len(data) <= length:
+        return [content]
+
+    chunks = []
+    state = _IrcFormatState()
+    prefix = b""
+    pos = 0
+    while pos < len(data):
+        end = pos + length - len(prefix)
+        if end <= pos:
+            # the formatting doesn't leave room for any text, so drop it
+            prefix = b""
+            end = pos + length
+        if end >= len(data):
+            chunk = data[pos:]
+            pos = len(data)
+        else:
+            # split on the last space that fits, dropping the space itself
+            space = data.rfind(b" ", pos, end + 1)
+            if space > pos:
+                chunk = data[pos:space]
+                next_pos = space + 1
+            else:
+                # no space to split on, so split before the first byte of a multibyte character
+                while end > pos and data[end] & 0xC0 == 0x80:
+                    end -= 1
+                if end == pos:
+                    # <length> is too small for this character, so send it whole anyway
+                    end += 1
+                    while data[end] & 0xC0 == 0x80:
+                        end += 1
+                chunk = data[pos:end]
+                next_pos = end
+
+            # don't separate a color code from its numbers, it will be restarted by the next chunk anyway
+            color = IRC_TRAILING_COLOR_RE.search(chunk)
+            if color is not None and color.start() > 0:
+                next_pos = pos + color.start()
+                chunk = chunk[:color.start()]
+            pos = next_pos
+
+        chunks.append((prefix + chunk).decode(encoding))
+        state.update(chunk)
+        prefix = state.encode()
+
+    return chunks
+
+
+class _IrcFormatState:
+    """
+    Tracks which IRC formatting codes are active in a piece of text
+    """
+
+    def __init__(self):
+        self.toggles = set()
+        self.foreground = None
+        self.background = None
+
+    def update(self, data):
+        """
+        :type data: bytes
+        """
+        for match in IRC_FORMAT_BYTES_RE.finditer(data):
+            code = match.group(0)[:1]
+            if code == b"\x0f":
+                self.toggles.clear()
+                self.foreground = self.background = None
+            elif code == b"\x03":
+                foreground, background = match.group(1), match.group(2)
+                if foreground is None:
+                    self.foreground = self.background = None
+                else:
+                    self.foreground = int(foreground)
+                    if background is not None:
+                        self.background = int(background)
+            else:
+                self.toggles ^= {code}
+
+    def encode(self):
+        """
+        :return: The formatting codes needed to restore this state
+        :rtype: bytes
+        """
+        out = b"".join(sorted(self.toggles))
+        if self.foreground is not None:
+            out += "\x03{:02d}".format(self.foreground).encode()
+            if self.background is not None:
+                out += ",{:02d}".format(self.background).encode()
+        return out
+
+
 def pluralize(num=0, text=''):
     """
     Takes a number and a string, and pluralizes that string using the number and combines the results.
@@ -0,0 +1,189 @@
+"""
+ircparse.py
+
+A single-pass parser for IRC lines, supporting IRCv3 message tags.
+
+License:
+    GPL v3
+"""
+
+import re
+
+tag_escape_re = re.compile(r"\\(.?)")
+
+tag_escapes = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n",
+}
+
+
+def _unescape_tag(match):
+    char = match.group(1)
+    return tag_escapes.get(char, char)
+
+
+def parse_tags(tag_string):
+    """
+    Parses an IRCv3 message tag string (without the leading "@") into a dict. Tags without a value are given
+    an empty string as value, as required by the specification.
+    :type tag_string: str
+    :rtype: dict[str, str]
+    """
+    tags = {}
+    for tag in tag_string.split(";"):
+        if not tag:
+            continue
+        key, _, value = tag.partition("=")
+        if "\\" in value:
+            value = tag_escape_re.sub(_unescape_tag, value)
+        tags[key] = value
+    return tags
+
+
+def _escape_tag(value):
+    return value.replace("\\", "\\\\").replace(";", "\\:").replace(" ", "\\s").replace("\r", "\\r") \
+        .replace("\n", "\\n")
+
+
+def parse_line(line):
+    """
+    Parses a single IRC line (without line terminator) into a Message.
+    Raises ValueError if the line doesn't contain a command.
+    :type line: str
+    :rtype: Message
+    """
+    tags = None
+    if line.startswith("@"):
+        tag_string, _, line = line.partition(" ")
+        tags = parse_tags(tag_string[1:])
+        line = line.lstrip(" ")
+
+    prefix = None
+    if line.startswith(":"):
+        prefix, sep, line = line.partition(" ")
+        if not sep:
+            raise ValueError("IRC line contains only a prefix: {!r}".format(prefix))
+        prefix = prefix[1:]
+
+    middle, sep, trailing = line.partition(" :")
+    if not sep:
+        trailing = None
+
+    params = middle.split(" ")
+    if "" in params:
+        # there were repeated spaces between params
+        params = [param for param in params if param]
+        if not params:
+            raise ValueError("IRC line doesn't contain a command: {!r}".format(line))
+
+    return Message(tags, prefix, params[0], params[1:], trailing)
+
+
+class Message:
+    """
+    A parsed IRC line. The nick, user and host of the prefix are only split out when they are first accessed.
+
+    :type tags: dict[str, str] | None
+    :type prefix: str | None
+    :type command: str
+    :type params: list[str]
+    :type trailing: str | None
+    """
+    __slots__ = ("tags", "prefix", "command", "params", "trailing", "_netmask")
+
+    def __init__(self, tags, prefix, command, params, trailing):
+        """
+        :param tags: The IRCv3 message tags, or None if the line had no tags
+        :param prefix: The prefix of the line, without the leading ":"
+        :param command: The IRC command or numeric
+        :param params: The middle params of the line
+        :param trailing: The trailing param of the line, without the leading ":"
+        :type tags: dict[str, str] | None
+        :type prefix: str | None
+        :type command: str
+        :type params: list[str]
+        :type trailing: str | None
+        """
+        self.tags = tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.trailing = trailing
+        self._netmask = None
+
+    @property
+    def netmask(self):
+        """
+        The (nick, user, host) of the prefix. If the prefix isn't a netmask, it is returned as the nick.
+        :rtype: (str | None, str | None, str | None)
+        """
+        netmask = self._netmask
+        if netmask is None:
+            prefix = self.prefix
+            if prefix is None:
+                netmask = (None, None, None)
+            else:
+                nick, sep, rest = prefix.partition("!")
+                user, sep2, host = rest.partition("@")
+                if sep and sep2 and "@" not in nick:
+                    netmask = (nick, user, host)
+                else:
+                    # This isn't in the format of a netmask
+                    netmask = (prefix, None, None)
+            self._netmask = netmask
+        return netmask
+
+    @property
+    def nick(self):
+        return self.netmask[0]
+
+    @property
+    def user(self):
+        return self.netmask[1]
+
+    @property
+    def host(self):
+        return self.netmask[2]
+
+    @property
+    def paramlist(self):
+        """
+        All params of the line, in the legacy format used by Event.irc_paramlist: the trailing param (if any)
+        keeps its leading ":".
+        :rtype: list[str]
+        """
+        if self.trailing is None:
+            return list(self.params)
+        return self.params + [":" + self.trailing]
+
+    @property
+    def content(self):
+        """
+        The last param of the line, or None if there are no params
+        :rtype: str | None
+        """
+        if self.trailing is not None:
+            return self.trailing
+        if self.params:
+            return self.params[-1]
+        return None
+
+    def __str__(self):
+        parts = []
+        if self.tags:
+            parts.append("@" + ";".join(key if not value else "{}={}".format(key, _escape_tag(value))
+                                        for key, value in self.tags.items()))
+        if self.prefix is not None:
+            parts.append(":" + self.prefix)
+        parts.append(self.command)
+        parts.extend(self.params)
+        if self.trailing is not None:
+            parts.append(":" + self.trailing)
+        return " ".join(parts)
+
+    def __repr__(self):
+        return "Message(tags={!r}, prefix={!r}, command={!r}, params={!r}, trailing={!r})".format(
+            self.tags, self.prefix, self.command, self.params, self.trailing)
@@ -0,0 +1,136 @@
+"""
+linebuffer.py
+
+Incremental line framing for byte streams. Incoming chunks are appended to a single bytearray which is scanned
+once for line terminators, so large bursts of lines (NAMES replies, netsplits, bouncer playback) are framed in
+linear time instead of re-copying the remaining buffer for every line.
+
+License:
+    GPL v3
+"""
+
+from time import time
+
+# IRCv3 allows up to 8191 bytes of message tags on top of the 512 byte RFC 1459 line
+MAX_LINE_LENGTH = 8191 + 512
+
+
+class LineBuffer:
+    """
+    Splits a stream of bytes into lines. Lines may end with either b"\\r\\n" or a bare b"\\n"; empty lines are
+    skipped. Lines longer than max_line_length are truncated, and the remainder of the line is discarded.
+
+    >> buffer = LineBuffer()
+    >> buffer.feed(b":server PING :abc\\r\\n:server NOT")
+    [b':server PING :abc']
+    >> buffer.feed(b"ICE * :hi\\n")
+    [b':server NOTICE * :hi']
+
+    :type max_line_length: int
+    :type lines_received: int
+    :type bytes_received: int
+    :type lines_truncated: int
+    """
+
+    def __init__(self, max_line_length=MAX_LINE_LENGTH, rate_interval=1.0):
+        """
+        :param max_line_length: The maximum length of a line in bytes, not including the line terminator
+        :param rate_interval: The number of seconds lines_per_second is averaged over
+        :type max_line_length: int
+        :type rate_interval: float
+        """
+        self.max_line_length = max_line_length
+        self.rate_interval = rate_interval
+
+        self._buffer = bytearray()
+        # True while we are discarding the rest of a line that was longer than max_line_length
+        self._discarding = False
+
+        # counters
+        self.lines_received = 0
+        self.bytes_received = 0
+        self.lines_truncated = 0
+
+        self._rate_start = time()
+        self._rate_lines = 0
+        self._lines_per_second = 0.0
+
+    def feed(self, data):
+        """
+        Adds a chunk of data to the buffer, and returns all complete lines found.
+        :type data: bytes
+        :rtype: list[bytes]
+        """
+        self.bytes_received += len(data)
+        buffer = self._buffer
+        # only the new data can contain a line terminator, everything already buffered is a partial line
+        scan_from = len(buffer)
+        buffer += data
+
+        lines = []
+        view = memoryview(buffer)
+        start = 0
+        try:
+            while True:
+                end = buffer.find(b"\n", scan_from)
+                if end == -1:
+                    break
+
+                line_end = end
+                if line_end > start and buffer[line_end - 1] == 0x0d:  # b"\r"
+                    line_end -= 1
+
+                if self._discarding:
+                    # this is the tail of a line we've already truncated and returned
+                    self._discarding = False
+                elif line_end - start > self.max_line_length:
+                    self.lines_truncated += 1
+                    lines.append(bytes(view[start:start + self.max_line_length]))
+                elif line_end > start:
+                    lines.append(bytes(view[start:line_end]))
+
+                start = scan_from = end + 1
+        finally:
+            # the memoryview must be released before the bytearray can be resized
+            view.release()
+
+        if start:
+            del buffer[:start]
+
+        if len(buffer) > self.max_line_length:
+            # the partial line is already too long, so hand out what we have and drop the rest when it arrives
+            if not self._discarding:
+                self.lines_truncated += 1
+                lines.append(bytes(buffer[:self.max_line_length]))
+                self._discarding = True
+            del buffer[:]
+
+        self._count_lines(len(lines))
+        return lines
+
+    def _count_lines(self, count):
+        self.lines_received += count
+        self._rate_lines += count
+
+        now = time()
+        elapsed = now - self._rate_start
+        if elapsed >= self.rate_interval:
+            self._lines_per_second = self._rate_lines / elapsed
+            self._rate_start = now
+            self._rate_lines = 0
+
+    @property
+    def buffered(self):
+        """
+        The number of bytes currently waiting for a line terminator
+        :rtype: int
+        """
+        return len(self._buffer)
+
+    @property
+    def lines_per_second(self):
+        """
+        The rate of received lines, averaged over the last full rate_interval
+        :rtype: float
+        """
+        return self._lines_per_second
@@ -0,0 +1,144 @@
+"""
+linedecoder.py
+
+Decodes IRC lines of unknown encoding. The encoding that worked for each sender is remembered, so senders using a
+legacy encoding don't need every other encoding tried for each line they send.
+
+License:
+    GPL v3
+"""
+
+import codecs
+import collections
+import re
+
+non_ascii_re = re.compile(b"[\x80-\xff]")
+# a lead byte followed by a continuation byte. Text containing non-ASCII bytes but none of these can't be UTF-8.
+utf8_sequence_re = re.compile(b"[\xc2-\xf4][\x80-\xbf]")
+
+
+class LineDecoder:
+    """
+    :type encodings: list[str]
+    :type cache_size: int
+    :type lines_decoded: int
+    :type ascii_lines: int
+    :type fallbacks: collections.Counter
+    """
+
+    def __init__(self, encoding="utf-8", fallback_encodings=("cp1252", "iso-8859-1"), cache_size=1024):
+        """
+        :param encoding: The encoding to try first
+        :param fallback_encodings: Encodings to try in order if a line can't be decoded with <encoding>. Note that
+                                   iso-8859-1 can decode anything, so any encodings after it will never be tried.
+        :param cache_size: The number of senders to remember encodings for
+        :type encoding: str
+        :type fallback_encodings: list[str]
+        :type cache_size: int
+        """
+        self.encodings = [codecs.lookup(encoding).name]
+        for fallback in fallback_encodings:
+            fallback = codecs.lookup(fallback).name
+            if fallback not in self.encodings:
+                self.encodings.append(fallback)
+        self._primary_is_utf8 = self.encodings[0] == "utf-8"
+
+        self.cache_size = cache_size
+        # sender prefix -> the encoding that last worked for them, in least to most recently used order
+        self._sender_encodings = collections.OrderedDict()
+
+        # counters
+        self.lines_decoded = 0
+        self.ascii_lines = 0
+        # encoding -> number of lines which needed that fallback encoding
+        self.fallbacks = collections.Counter()
+
+    def decode(self, data):
+        """
+        Decodes a single line
+        :type data: bytes
+        :rtype: str
+        """
+        self.lines_decoded += 1
+
+        if non_ascii_re.search(data) is None:
+            # ASCII is valid in every encoding we could have picked
+            self.ascii_lines += 1
+            return data.decode("ascii")
+
+        sender = _get_sender(data)
+        for encoding in self._get_encodings(data, sender):
+            try:
+                line = data.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+
+            if encoding != self.encodings[0]:
+                self.fallbacks[encoding] += 1
+            if sender is not None:
+                self._remember(sender, encoding)
+            return line
+
+        return data.decode(self.encodings[0], errors="ignore")
+
+    def _get_encodings(self, data, sender):
+        """
+        :return: The encodings to try for this line, in order
+        :rtype: list[str]
+        """
+        encodings = self.encodings
+        if self._primary_is_utf8 and utf8_sequence_re.search(data) is None:
+            # this line can't be UTF-8, so don't bother trying it
+            encodings = encodings[1:]
+
+        if sender is not None and encodings[0] != "utf-8":
+            # prefer the encoding this sender used last time. Lines which look like UTF-8 are still tried as UTF-8
+            # first, so senders who switch to UTF-8 are picked up again.
+            known = self._sender_encodings.get(sender)
+            if known is not None and known != encodings[0] and known in encodings:
+                encodings = [known] + [encoding for encoding in encodings if encoding != known]
+
+        return encodings
+
+    def _remember(self, sender, encoding):
+        cache = self._sender_encodings
+        if sender in cache:
+            cache.move_to_end(sender)
+        cache[sender] = encoding
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def forget(self, data):
+        """
+        Forgets the remembered encoding for the sender of a raw line, for when they quit
+        :type data: bytes
+        """
+        sender = _get_sender(data)
+        if sender is not None:
+            self._sender_encodings.pop(sender, None)
+
+    @property
+    def fallback_count(self):
+        """
+        The number of lines which couldn't be decoded with the primary encoding
+        :rtype: int
+        """
+        return sum(self.fallbacks.values())
+
+
+def _get_sender(data):
+    """
+    Finds the prefix of a raw IRC line, skipping message tags
+    :type data: bytes
+    :rtype: bytes | None
+    """
+    start = 0
+    if data.startswith(b"@"):
+        start = data.find(b" ") + 1
+        if not start:
+            return None
+    if data.startswith(b":", start):
+        end = data.find(b" ", start)
+        if end != -1:
+            return data[start + 1:end]
+    return None
@@ -0,0 +1,134 @@
+"""
+maskmatcher.py
+
+Matches IRC user masks against a set of glob masks like "*!*@example.com". Masks without wildcards are looked up in a
+set, and all other masks are compiled into a single regex, instead of calling fnmatch once for every mask.
+
+License:
+    GPL v3
+"""
+
+import re
+
+_wildcards = frozenset("*?[")
+
+
+def translate(mask):
+    """
+    Translates a glob mask into a regex, with the same rules as fnmatch: "*" matches anything, "?" matches any
+    single character, and "[...]" or "[!...]" match a set of characters.
+    :type mask: str
+    :rtype: str
+    """
+    i, n = 0, len(mask)
+    result = []
+    while i < n:
+        char = mask[i]
+        i += 1
+        if char == "*":
+            # a run of stars is the same as one
+            if not result or result[-1] != ".*":
+                result.append(".*")
+        elif char == "?":
+            result.append(".")
+        elif char == "[":
+            j = i
+            if j < n and mask[j] == "!":
+                j += 1
+            if j < n and mask[j] == "]":
+                j += 1
+            while j < n and mask[j] != "]":
+                j += 1
+            if j >= n:
+                # no closing bracket, so it's a literal "["
+                result.append("\\[")
+            else:
+                # escape anything re would read as nested sets or set operations
+                chars = re.sub(r"([\\\[&~|])", r"\\\1", mask[i:j])
+                i = j + 1
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                elif chars.startswith("^"):
+                    chars = "\\" + chars
+                result.append("[{}]".format(chars))
+        else:
+            result.append(re.escape(char))
+    return "".join(result)
+
+
+class MaskMatcher:
+    """
+    Checks whether a user mask matches any of a set of glob masks. Matching is case-insensitive.
+
+    >> matcher = MaskMatcher(["luke!*@*", "*!*@snoonet/staff/*", "exact!user@host"])
+    >> matcher.match("Luke!~luke@host.com")
+    True
+    >> matcher.match("other!user@host")
+    False
+
+    :type exact: set[str]
+    :type patterns: list[str]
+    """
+
+    def __init__(self, masks):
+        """
+        :type masks: collections.abc.Iterable[str]
+        """
+        self.exact = set()
+        self.patterns = []
+        for mask in masks:
+            mask = mask.lower()
+            if _wildcards.isdisjoint(mask):
+                self.exact.add(mask)
+            elif mask not in self.patterns:
+                self.patterns.append(mask)
+
+        regexes = [translate(mask) for mask in self.patterns]
+        try:
+            self._regex = _compile(regexes)
+        except re.error:
+            # a mask like "[z-a]" can't match anything, but would stop all others from matching
+            self.patterns, regexes = _valid_patterns(self.patterns, regexes)
+            self._regex = _compile(regexes)
+
+    def match(self, user_mask):
+        """
+        :type user_mask: str
+        :rtype: bool
+        """
+        user_mask = user_mask.lower()
+        if user_mask in self.exact:
+            return True
+        return self._regex is not None and self._regex.fullmatch(user_mask) is not None
+
+    def __len__(self):
+        return len(self.exact) + len(self.patterns)
+
+
+def _compile(regexes):
+    """
+    :type regexes: list[str]
+    :rtype: re.__Regex | None
+    """
+    if not regexes:
+        return None
+    return re.compile("|".join("(?:{})".format(regex) for regex in regexes), re.DOTALL)
+
+
+def _valid_patterns(patterns, regexes):
+    """
+    :type patterns: list[str]
+    :type regexes: list[str]
+    :return: The patterns and regexes of the masks with valid regexes
+    :rtype: (list[str], list[str])
+    """
+    valid_patterns = []
+    valid_regexes = []
+    for pattern, regex in zip(patterns, regexes):
+        try:
+            re.compile(regex)
+        except re.error:
+            continue
+        valid_patterns.append(pattern)
+        valid_regexes.append(regex)
+    return valid_patterns, valid_regexes
@@ -0,0 +1,124 @@
+"""
+prefixtrie.py
+
+A mapping of strings which can be queried by prefix, used to look up abbreviated commands.
+
+License:
+    GPL v3
+"""
+
+
+class _Node:
+    __slots__ = ("children", "value", "has_value", "size")
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.has_value = False
+        # the number of keys in this node and all of its children
+        self.size = 0
+
+
+class PrefixTrie:
+    """
+    A dict-like mapping of str keys, which can find all keys starting with a prefix in O(len(prefix)) plus the number
+    of matching keys. Nodes are removed again when the keys using them are deleted.
+
+    >> trie = PrefixTrie()
+    >> trie["weather"] = 1
+    >> trie["weatherforecast"] = 2
+    >> trie.items("wea")
+    [('weather', 1), ('weatherforecast', 2)]
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def _find(self, key):
+        """
+        :type key: str
+        :rtype: _Node | None
+        """
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def __setitem__(self, key, value):
+        node = self._find(key)
+        if node is not None and node.has_value:
+            node.value = value
+            return
+
+        node = self._root
+        node.size += 1
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            child.size += 1
+            node = child
+        node.value = value
+        node.has_value = True
+
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None or not node.has_value:
+            raise KeyError(key)
+        return node.value
+
+    def __delitem__(self, key):
+        node = self._find(key)
+        if node is None or not node.has_value:
+            raise KeyError(key)
+
+        node = self._root
+        node.size -= 1
+        for char in key:
+            child = node.children[char]
+            child.size -= 1
+            if not child.size:
+                # nothing else uses this branch, so drop it
+                del node.children[char]
+                return
+            node = child
+        node.value = None
+        node.has_value = False
+
+    def __contains__(self, key):
+        node = self._find(key)
+        return node is not None and node.has_value
+
+    def __len__(self):
+        return self._root.size
+
+    def get(self, key, default=None):
+        node = self._find(key)
+        if node is None or not node.has_value:
+            return default
+        return node.value
+
+    def items(self, prefix="", exclude=()):
+        """
+        Finds all keys starting with the given prefix, in sorted order
+        :param exclude: Keys to leave out of the result
+        :type prefix: str
+        :type exclude: collections.abc.Container[str]
+        :rtype: list[(str, object)]
+        """
+        node = self._find(prefix)
+        if node is None:
+            return []
+
+        result = []
+        stack = [(prefix, node)]
+        while stack:
+            key, node = stack.pop()
+            if node.has_value and key not in exclude:
+                result.append((key, node.value))
+            # push in reverse, so children are visited in sorted order
+            for char in sorted(node.children, reverse=True):
+                stack.append((key + char, node.children[char]))
+        return result
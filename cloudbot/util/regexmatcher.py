@@ -0,0 +1,251 @@
+"""
+regexmatcher.py
+
+Finds which of a set of regexes can possibly match a string, without running them. The literals which any match of
+a regex has to contain are extracted from it when it is added, and a string is only handed to the regexes whose
+literals it contains.
+
+License:
+    GPL v3
+"""
+
+import collections
+
+try:
+    # the module was renamed in python 3.11
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# opcodes which don't consume any characters, and so don't split a run of literals
+_zero_width = {sre_constants.AT}
+
+# the non-ASCII characters which re.IGNORECASE matches to an ASCII letter, but which don't lowercase to it. The
+# Kelvin sign also matches "k", but lowercases to it.
+_ignorecase_ascii = {ord("\u0130"): "i", ord("\u0131"): "i", ord("\u017f"): "s"}
+# what those characters are once lowercased
+_ignorecase_lowered = ("\u0307", "\u0131", "\u017f")
+
+
+def required_literals(regex):
+    """
+    Finds the literals that every match of a regex must contain. Only ASCII literals are used, and they are lowercased,
+    so they can be looked for in a string folded by fold().
+    :type regex: re.__Regex
+    :return: A tuple of requirements, each being a tuple of literals of which at least one must be in any match, or
+             None if no required literals could be found
+    :rtype: tuple[tuple[str]] | None
+    """
+    pattern = getattr(regex, "pattern", None)
+    if not isinstance(pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern, regex.flags)
+    except Exception:
+        return None
+    requirements = set(_find_requirements(parsed))
+    if not requirements:
+        return None
+    # single characters like "/" are in most lines, so they are only worth checking if there is nothing better
+    strong = {literals for literals in requirements if min(len(literal) for literal in literals) > 1}
+    if strong:
+        requirements = strong
+    # most selective first, so lines are rejected after as few checks as possible
+    return tuple(sorted(requirements, key=_selectivity, reverse=True))
+
+
+def _selectivity(literals):
+    """
+    :type literals: tuple[str]
+    """
+    return min(len(literal) for literal in literals), -len(literals), literals
+
+
+def _best(requirements):
+    """
+    Picks the most selective requirement: the one with the longest shortest literal, then the fewest literals
+    :type requirements: list[tuple[str]]
+    :rtype: tuple[str] | None
+    """
+    if not requirements:
+        return None
+    return max(requirements, key=_selectivity)
+
+
+def _find_requirements(sequence):
+    """
+    :type sequence: sre_parse.SubPattern | list
+    :return: A list of requirements, each being a tuple of literals of which at least one must be in any match
+    :rtype: list[tuple[str]]
+    """
+    requirements = []
+    run = []
+
+    def end_run():
+        if run:
+            requirements.append(("".join(run).lower(),))
+            del run[:]
+
+    for op, av in sequence:
+        char = _literal_char(op, av)
+        if char is not None:
+            run.append(char)
+        elif op == sre_constants.SUBPATTERN:
+            literal = _literal_string(av[-1])
+            if literal is not None:
+                # the group is only a literal, so it continues the current run
+                run.append(literal)
+            else:
+                end_run()
+                requirements.extend(_find_requirements(av[-1]))
+        elif op in _zero_width:
+            continue
+        else:
+            end_run()
+            if op == sre_constants.MAX_REPEAT or op == sre_constants.MIN_REPEAT:
+                min_repeat, max_repeat, item = av
+                if min_repeat >= 1:
+                    requirements.extend(_find_requirements(item))
+            elif op == sre_constants.BRANCH:
+                alternatives = []
+                for branch in av[1]:
+                    best = _best(_find_requirements(branch))
+                    if best is None:
+                        # this alternative doesn't need any literal, so the branch as a whole doesn't either
+                        break
+                    alternatives.extend(best)
+                else:
+                    requirements.append(tuple(sorted(set(alternatives))))
+
+    end_run()
+    return requirements
+
+
+def _literal_char(op, av):
+    """
+    Checks if an opcode matches a single ASCII character, ignoring case. Character sets like [sS] are included.
+    :rtype: str | None
+    """
+    if op == sre_constants.LITERAL:
+        return chr(av) if av < 128 else None
+    if op != sre_constants.IN:
+        return None
+    chars = set()
+    for item_op, item_av in av:
+        if item_op != sre_constants.LITERAL or item_av >= 128:
+            return None
+        chars.add(chr(item_av).lower())
+    if len(chars) != 1:
+        return None
+    return chars.pop()
+
+
+def _literal_string(sequence):
+    """
+    Checks if a sequence only consists of ASCII characters
+    :rtype: str | None
+    """
+    chars = []
+    for op, av in sequence:
+        char = _literal_char(op, av)
+        if char is None and op == sre_constants.SUBPATTERN:
+            char = _literal_string(av[-1])
+        if char is None:
+            return None
+        chars.append(char)
+    return "".join(chars)
+
+
+def fold(text):
+    """
+    Lowercases a string, so it contains all the lowercased ASCII literals which a regex matching it requires. A few
+    non-ASCII characters which re.IGNORECASE matches to ASCII letters are turned into those letters first, because
+    lowercasing alone would not keep the literal together: "\u0130".lower() is "i" followed by a combining dot.
+    :type text: str
+    :rtype: str
+    """
+    folded = text.lower()
+    for char in _ignorecase_lowered:
+        if char in folded:
+            return text.translate(_ignorecase_ascii).lower()
+    return folded
+
+
+class RegexMatcher:
+    """
+    Keeps a list of (regex, value) pairs, and finds the ones which can match a given string.
+
+    >> matcher = RegexMatcher()
+    >> matcher.add(re.compile(r"youtu\\.?be"), "youtube")
+    >> matcher.add(re.compile(r"^s/(.*)/(.*)"), "correction")
+    >> matcher.candidates("check out https://youtu.be/abc")
+    [(re.compile('youtu\\\\.?be'), 'youtube')]
+
+    :type entries: list[(re.__Regex, object, tuple[tuple[str]] | None)]
+    :type checked: int
+    :type skipped: int
+    """
+
+    def __init__(self):
+        self.entries = []
+        # literal -> the number of entries requiring it
+        self._literals = collections.Counter()
+
+        # counters
+        self.checked = 0
+        self.skipped = 0
+
+    def add(self, regex, value):
+        """
+        :type regex: re.__Regex
+        """
+        requirements = required_literals(regex)
+        self.entries.append((regex, value, requirements))
+        if requirements is not None:
+            for literals in requirements:
+                self._literals.update(literals)
+
+    def remove(self, regex, value):
+        """
+        Removes the first entry with the given regex and value. Raises ValueError if there is no such entry.
+        :type regex: re.__Regex
+        """
+        for i, (entry_regex, entry_value, requirements) in enumerate(self.entries):
+            if entry_regex == regex and entry_value == value:
+                del self.entries[i]
+                if requirements is not None:
+                    for literals in requirements:
+                        self._literals.subtract(literals)
+                    self._literals += collections.Counter()  # drops literals which are no longer used
+                return
+        raise ValueError("{!r} is not in the matcher".format((regex, value)))
+
+    def candidates(self, text):
+        """
+        Finds the entries whose regex may match the given text, in the order they were added
+        :type text: str
+        :rtype: list[(re.__Regex, object)]
+        """
+        folded = fold(text)
+        found = {literal for literal in self._literals if literal in folded}
+
+        result = []
+        for regex, value, requirements in self.entries:
+            if requirements is not None:
+                if not found:
+                    continue
+                for literals in requirements:
+                    if found.isdisjoint(literals):
+                        break
+                else:
+                    result.append((regex, value))
+            else:
+                result.append((regex, value))
+        self.checked += len(result)
+        self.skipped += len(self.entries) - len(result)
+        return result
+
+    def __len__(self):
+        return len(self.entries)
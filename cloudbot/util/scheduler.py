@@ -0,0 +1,388 @@
+"""
+scheduler.py
+
+Runs callbacks at given times. Jobs are kept in a min-heap of due times, and a single loop.call_at() timer is kept
+armed for the earliest of them, so there's no polling, and adding or cancelling a job is O(log n).
+
+Jobs which repeat every few seconds are run by PeriodicJob instead, which keeps to the event loop's monotonic clock.
+
+License:
+    GPL v3
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+logger = logging.getLogger("cloudbot")
+
+
+class Job:
+    """
+    :type when: float
+    :type callback: function
+    :type args: tuple
+    :type owner: str
+    :type key: object
+    :type cancelled: bool
+    """
+    __slots__ = ("when", "callback", "args", "owner", "key", "cancelled")
+
+    def __init__(self, when, callback, args, owner, key):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.owner = owner
+        self.key = key
+        self.cancelled = False
+
+    def __repr__(self):
+        return "Job[when: {}, callback: {}, owner: {}, key: {}]".format(self.when, self.callback, self.owner,
+                                                                        self.key)
+
+
+class Scheduler:
+    """
+    Runs callbacks at given unix timestamps. Callbacks may be coroutine functions, in which case they are run as
+    tasks. Jobs can be given an owner, usually the title of the plugin scheduling them, and a key, which identifies
+    the job among the jobs of its owner.
+
+    >> scheduler = Scheduler(loop)
+    >> scheduler.schedule(time.time() + 60, remind, "luke", owner="remind", key=("luke", 1))
+    >> scheduler.cancel("remind", ("luke", 1))
+    True
+
+    :type loop: asyncio.events.AbstractEventLoop
+    :type jobs_run: int
+    :type total_lateness: float
+    :type max_lateness: float
+    """
+
+    def __init__(self, loop):
+        """
+        :type loop: asyncio.events.AbstractEventLoop
+        """
+        self.loop = loop
+        # (when, sequence number, job). The sequence number keeps jobs with the same due time in order.
+        self._heap = []
+        self._sequence = itertools.count()
+        # (owner, key) -> job
+        self._keyed_jobs = {}
+        # cancelled jobs are left in the heap until they come up, or until they are most of it
+        self._cancelled = 0
+        self._timer = None
+        self._timer_when = None
+
+        # counters
+        self.jobs_run = 0
+        # seconds jobs were run after they were due
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def schedule(self, when, callback, *args, owner=None, key=None):
+        """
+        Schedules callback(*args) to be run at the given time. If a job with the same owner and key is already
+        scheduled, it is replaced.
+        :param when: A unix timestamp
+        :type when: float
+        :type callback: function
+        :type owner: str
+        :rtype: Job
+        """
+        if key is not None:
+            self.cancel(owner, key)
+
+        job = Job(when, callback, args, owner, key)
+        heapq.heappush(self._heap, (when, next(self._sequence), job))
+        if key is not None:
+            self._keyed_jobs[(owner, key)] = job
+        self._arm()
+        return job
+
+    def cancel(self, owner, key):
+        """
+        Cancels the job with the given owner and key
+        :type owner: str
+        :return: Whether there was such a job
+        :rtype: bool
+        """
+        job = self._keyed_jobs.pop((owner, key), None)
+        if job is None:
+            return False
+        self._cancel(job)
+        return True
+
+    def cancel_job(self, job):
+        """
+        :type job: Job
+        """
+        if job.cancelled:
+            return
+        if job.key is not None and self._keyed_jobs.get((job.owner, job.key)) is job:
+            del self._keyed_jobs[(job.owner, job.key)]
+        self._cancel(job)
+
+    def cancel_all(self, owner):
+        """
+        Cancels all jobs of the given owner
+        :type owner: str
+        :return: The number of jobs cancelled
+        :rtype: int
+        """
+        jobs = [job for when, sequence, job in self._heap if job.owner == owner and not job.cancelled]
+        for job in jobs:
+            self.cancel_job(job)
+        return len(jobs)
+
+    def _cancel(self, job):
+        job.cancelled = True
+        self._cancelled += 1
+        if self._cancelled > len(self._heap) // 2:
+            # rebuild the heap without the cancelled jobs, so they don't pile up
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        self._arm()
+
+    def _arm(self):
+        """
+        Sets the timer to the earliest job, if it isn't set to it already
+        """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+
+        if not self._heap:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return
+
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_when == when:
+                return
+            self._timer.cancel()
+
+        delay = max(0.0, when - time.time())
+        self._timer = self.loop.call_at(self.loop.time() + delay, self._run_due)
+        self._timer_when = when
+
+    def _run_due(self):
+        self._timer = None
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            when, sequence, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                self._cancelled -= 1
+                continue
+            if job.key is not None and self._keyed_jobs.get((job.owner, job.key)) is job:
+                del self._keyed_jobs[(job.owner, job.key)]
+
+            lateness = now - when
+            self.jobs_run += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            self._run(job)
+
+        # if the clock was changed, the timer may have fired before anything was due, so this also re-arms it
+        self._arm()
+
+    def _run(self, job):
+        """
+        :type job: Job
+        """
+        try:
+            result = job.callback(*job.args)
+            if asyncio.iscoroutine(result):
+                task = self.loop.create_task(result)
+                task.add_done_callback(lambda done: self._task_done(job, done))
+        except Exception:
+            logger.exception("Error in scheduled job {}".format(job))
+
+    def _task_done(self, job, task):
+        """
+        :type job: Job
+        :type task: asyncio.Task
+        """
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error("Error in scheduled job {}".format(job), exc_info=(type(error), error, error.__traceback__))
+
+    def get_jobs(self, owner):
+        """
+        :type owner: str
+        :return: The scheduled jobs of the given owner, ordered by due time
+        :rtype: list[Job]
+        """
+        return [job for when, sequence, job in sorted(self._heap, key=lambda entry: entry[:2])
+                if job.owner == owner and not job.cancelled]
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    @property
+    def average_lateness(self):
+        """
+        The average number of seconds jobs were run after they were due
+        :rtype: float
+        """
+        if not self.jobs_run:
+            return 0.0
+        return self.total_lateness / self.jobs_run
+
+
+class PeriodicJob:
+    """
+    Runs a coroutine function every interval seconds. Runs are timed with the event loop's monotonic clock, so a change
+    to the system clock doesn't make them early or late. A run which comes up while the last run is still going is
+    skipped.
+
+    By default, the next run is due interval seconds after the last one finished. With fixed_rate, runs are due every
+    interval seconds, however long they take.
+
+    Unless jitter is given, up to 5% of the interval is randomly added to the first run only, so jobs started together
+    are spread out and still keep their rate afterwards. If it is given, up to that many seconds are added to every run.
+
+    >> job = PeriodicJob(loop, 60, poll, fixed_rate=True)
+    >> job.start()
+    >> job.stop()
+
+    :type loop: asyncio.events.AbstractEventLoop
+    :type interval: float
+    :type initial_interval: float
+    :type fixed_rate: bool
+    :type jitter: float | None
+    :type due: float
+    :type next_run: float
+    :type running: bool
+    :type stopped: bool
+    :type runs: int
+    :type skipped: int
+    :type run_time: float
+    :type max_run_time: float
+    :type lateness: float
+    :type max_lateness: float
+    """
+
+    def __init__(self, loop, interval, function, *args, initial_interval=None, fixed_rate=False, jitter=None):
+        """
+        :type loop: asyncio.events.AbstractEventLoop
+        :type interval: float
+        :param function: A coroutine function, which is called with args on every run
+        :type function: function
+        :param initial_interval: The number of seconds until the first run, which defaults to the interval
+        :type initial_interval: float
+        :type fixed_rate: bool
+        :type jitter: float
+        """
+        self.loop = loop
+        self.interval = interval
+        self.initial_interval = interval if initial_interval is None else initial_interval
+        self.fixed_rate = fixed_rate
+        self.jitter = jitter
+        self.function = function
+        self.args = args
+
+        # the loop time the next run is due, without and with jitter
+        self.due = None
+        self.next_run = None
+        self.running = False
+        self.stopped = True
+        self._timer = None
+        self._started = None
+
+        # counters
+        self.runs = 0
+        # runs skipped because the last run was still going
+        self.skipped = 0
+        # total seconds spent in runs
+        self.run_time = 0.0
+        self.max_run_time = 0.0
+        # total seconds runs started after they were due
+        self.lateness = 0.0
+        self.max_lateness = 0.0
+
+    def start(self):
+        """
+        Schedules the first run
+        """
+        self.stop()
+        self.stopped = False
+        jitter = self.interval * 0.05 if self.jitter is None else self.jitter
+        self._schedule(self.loop.time() + self.initial_interval, jitter)
+
+    def stop(self):
+        """
+        Cancels the next run. A run which is still going is left to finish, but won't schedule another.
+        """
+        self.stopped = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule(self, due, jitter=None):
+        """
+        :param due: The loop time the run is due at, before jitter
+        :type due: float
+        :type jitter: float
+        """
+        if jitter is None:
+            jitter = self.jitter or 0
+        self.due = due
+        self.next_run = due + random.uniform(0, jitter)
+        self._timer = self.loop.call_at(self.next_run, self._run)
+
+    def _run(self):
+        self._timer = None
+        now = self.loop.time()
+        lateness = now - self.next_run
+        if self.fixed_rate:
+            # the next run is due one interval after this one was due, however long this one takes
+            self._schedule(max(self.due + self.interval, now))
+
+        if self.running:
+            # the last run is still going, so skip this one rather than running them side by side
+            self.skipped += 1
+            return
+
+        self.running = True
+        self._started = now
+        self.lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        try:
+            task = self.loop.create_task(self.function(*self.args))
+        except Exception:
+            logger.exception("Error starting periodic job {}".format(self))
+            self._finished(None)
+        else:
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        """
+        :type task: asyncio.Task | None
+        """
+        self.running = False
+        run_time = self.loop.time() - self._started
+        self.runs += 1
+        self.run_time += run_time
+        self.max_run_time = max(self.max_run_time, run_time)
+
+        if task is not None and not task.cancelled():
+            error = task.exception()
+            if error is not None:
+                logger.error("Error in periodic job {}".format(self),
+                             exc_info=(type(error), error, error.__traceback__))
+
+        if not self.fixed_rate and not self.stopped:
+            # the next run is due one interval after this one finished
+            self._schedule(self.loop.time() + self.interval)
+
+    def __repr__(self):
+        return "PeriodicJob[function: {}, interval: {}, fixed_rate: {}, runs: {}, skipped: {}]".format(
+            self.function, self.interval, self.fixed_rate, self.runs, self.skipped)
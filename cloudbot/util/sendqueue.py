@@ -0,0 +1,158 @@
+"""
+sendqueue.py
+
+Queues outgoing IRC lines by priority and target, and paces them with a token bucket so the bot isn't disconnected
+for flooding.
+
+License:
+    GPL v3
+"""
+
+import collections
+import logging
+import time
+
+from cloudbot.util.tokenbucket import TokenBucket
+
+logger = logging.getLogger("cloudbot")
+
+# send priorities, lines with a lower priority are sent first
+PRIORITY_PROTOCOL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_NOTICE = 2
+PRIORITY_BULK = 3
+
+
+class SendQueue:
+    """
+    Queues outgoing lines for a connection, and decides which of them may be sent.
+
+    Lines are sent in order of priority. Within a priority, targets take turns, so one channel with a long reply
+    can't hold back replies to others. A token bucket limits the rate lines are sent at, to avoid being
+    disconnected for flooding.
+
+    :type enabled: bool
+    :type bucket: TokenBucket
+    :type depth: int
+    :type lines_sent: int
+    :type total_wait: float
+    :type max_wait: float
+    """
+
+    def __init__(self, *, enabled=True, tokens=5, restore_rate=1):
+        """
+        :param enabled: Whether to rate limit at all
+        :param tokens: The number of lines which can be sent in one burst
+        :param restore_rate: The number of lines per second which can be sent after a burst. If this or tokens is
+                             0, lines aren't rate limited.
+        :type enabled: bool
+        :type tokens: float
+        :type restore_rate: float
+        """
+        if enabled and (tokens <= 0 or restore_rate <= 0):
+            # the bucket would never have a token to send with, so treat this as no limit at all
+            logger.warning("Send rate limit of {} lines and {} lines per second can't send anything, "
+                           "disabling it".format(tokens, restore_rate))
+            enabled = False
+        self.enabled = enabled
+        self.bucket = TokenBucket(tokens, restore_rate)
+
+        # one ordered dict of target -> deque of (data, time queued) per priority
+        self._queues = [collections.OrderedDict() for _ in range(PRIORITY_BULK + 1)]
+        self._unthrottled = []
+
+        # metrics
+        self.depth = 0
+        self.lines_sent = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def put(self, data, priority, target=None):
+        """
+        :type data: bytes
+        :type priority: int
+        :type target: str
+        """
+        queue = self._queues[priority]
+        if target in queue:
+            queue[target].append((data, time.time()))
+        else:
+            queue[target] = collections.deque([(data, time.time())])
+        self.depth += 1
+
+    def put_unthrottled(self, data):
+        """
+        Queues a line which is sent on the next flush, regardless of the rate limit
+        :type data: bytes
+        """
+        self._unthrottled.append(data)
+
+    def pop_ready(self):
+        """
+        Removes and returns all lines which may be sent now, along with the number of seconds until the next
+        queued line may be sent (or None if there are no lines left).
+        :rtype: (list[bytes], float | None)
+        """
+        return self._pop(self.enabled)
+
+    def pop_all(self):
+        """
+        Removes and returns all queued lines, regardless of the rate limit. This is for when the connection is about
+        to be closed, and nothing queued should be held back.
+        :rtype: list[bytes]
+        """
+        lines, delay = self._pop(False)
+        return lines
+
+    def _pop(self, limited):
+        """
+        :type limited: bool
+        :rtype: (list[bytes], float | None)
+        """
+        lines = self._unthrottled
+        self._unthrottled = []
+        now = time.time()
+
+        for queue in self._queues:
+            while queue:
+                if limited and not self.bucket.consume(1):
+                    return lines, max((1 - self.bucket.tokens) / self.bucket.fill_rate, 0)
+
+                target = next(iter(queue))
+                target_lines = queue[target]
+                data, queued = target_lines.popleft()
+                if target_lines:
+                    # give the other targets a turn
+                    queue.move_to_end(target)
+                else:
+                    del queue[target]
+
+                lines.append(data)
+                wait = now - queued
+                self.depth -= 1
+                self.lines_sent += 1
+                self.total_wait += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+
+        return lines, None
+
+    def queue_depths(self):
+        """
+        :return: The number of queued lines for each priority
+        :rtype: list[int]
+        """
+        return [sum(len(lines) for lines in queue.values()) for queue in self._queues]
+
+    @property
+    def average_wait(self):
+        """
+        :return: The average number of seconds lines spent in the queue
+        :rtype: float
+        """
+        if not self.lines_sent:
+            return 0.0
+        return self.total_wait / self.lines_sent
+
+    def __bool__(self):
+        return bool(self.depth or self._unthrottled)
@@ -0,0 +1,43 @@
+from cloudbot.util.commandmatcher import CommandMatcher
+
+
+def test_match_prefix():
+    matcher = CommandMatcher(".!", "CloudBot")
+    assert matcher.match(".weather london", False).groups() == ("weather", "london")
+    assert matcher.match("!Weather  london ", False).groups() == ("Weather", "london ")
+    assert matcher.match(".ping", False).groups() == ("ping", "")
+    assert matcher.match("weather london", False) is None
+    assert matcher.match("", False) is None
+    assert matcher.match("...", False) is None
+
+
+def test_match_nick():
+    matcher = CommandMatcher(".", "Cloud[Bot]")
+    assert matcher.match("cloud[bot]: weather london", False).groups() == ("weather", "london")
+    assert matcher.match("Cloud[Bot],, ping", False).groups() == ("ping", "")
+    assert matcher.match("Cloud[Bot] ping", False) is None
+    assert matcher.match("CloudB: ping", False) is None
+
+
+def test_match_private():
+    matcher = CommandMatcher(".", "CloudBot")
+    assert matcher.match("weather london", True).groups() == ("weather", "london")
+    assert matcher.match(".weather london", True).groups() == ("weather", "london")
+    assert matcher.match("CloudBot: weather", True).groups() == ("weather", "")
+
+
+def test_update():
+    matcher = CommandMatcher(".", "CloudBot")
+    channel_re = matcher._channel_re
+    matcher.update(nick="CloudBot")
+    assert matcher._channel_re is channel_re
+
+    matcher.update(nick="OtherBot")
+    assert matcher.match("OtherBot: ping", False).groups() == ("ping", "")
+    assert matcher.match("CloudBot: ping", False) is None
+    assert matcher.match(".ping", False).groups() == ("ping", "")
+
+    matcher.update(prefix="")
+    assert matcher.match(".ping", False) is None
+    assert matcher.match("ping", True).groups() == ("ping", "")
+    assert matcher.match("OtherBot: ping", False).groups() == ("ping", "")
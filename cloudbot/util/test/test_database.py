@@ -1,6 +1,229 @@
-from cloudbot.util.database import metadata, base
+import asyncio
+import os
+import tempfile
+import threading
+
+import pytest
+import sqlalchemy
+from sqlalchemy import Table, Column, String, Boolean, Index
+from sqlalchemy.orm import sessionmaker
+
+from cloudbot.util.database import metadata, base, DatabaseExecutor, create_engine, get_pool_stats, Migration, \
+    migrate, migrate_all, CachedTable
 
 
 def test_database():
     assert metadata is None
     assert base is None
+
+
+def test_database_executor():
+    loop = asyncio.new_event_loop()
+    executor = DatabaseExecutor(loop, size=2)
+    try:
+        first = executor.acquire()
+        second = executor.acquire()
+        assert first.done() and second.done()
+        assert first.result() is not second.result()
+        assert executor.busy == 2
+
+        third = executor.acquire()
+        fourth = executor.acquire()
+        assert not third.done()
+        assert executor.queue_depth == 2
+
+        # a cancelled waiter is skipped
+        third.cancel()
+        executor.release(first.result())
+        assert fourth.result() is first.result()
+        assert executor.queue_depth == 0
+        assert executor.max_queue_depth == 2
+
+        executor.release(second.result())
+        executor.release(fourth.result())
+        assert executor.busy == 0
+        assert executor.acquired == 3
+
+        # a free preferred thread is reserved over the others
+        preferred = executor.acquire(second.result())
+        assert preferred.result() is second.result()
+        executor.release(preferred.result())
+
+        # work runs in the reserved thread
+        thread_executor = second.result()
+        thread = loop.run_until_complete(loop.run_in_executor(thread_executor, threading.get_ident))
+        assert thread != threading.get_ident()
+        assert loop.run_until_complete(loop.run_in_executor(thread_executor, threading.get_ident)) == thread
+    finally:
+        executor.shutdown()
+        loop.close()
+
+
+
+def test_database_executor_run():
+    loop = asyncio.new_event_loop()
+    executor = DatabaseExecutor(loop, size=1)
+    try:
+        thread = loop.run_until_complete(executor.run(threading.get_ident))
+        assert thread != threading.get_ident()
+        assert executor.busy == 0
+
+        with pytest.raises(ZeroDivisionError):
+            loop.run_until_complete(executor.run(divmod, 1, 0))
+        assert executor.busy == 0
+
+        # a call cancelled while it waits for a thread gives up its place
+        held = executor.acquire().result()
+        waiting = executor.run(threading.get_ident)
+        waiting.cancel()
+        loop.run_until_complete(asyncio.sleep(0))
+        executor.release(held)
+        assert executor.queue_depth == 0
+        assert executor.busy == 0
+    finally:
+        executor.shutdown()
+        loop.close()
+
+
+def test_sqlite_engine():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine("sqlite:///" + os.path.join(directory, "test.db"), {"pool_size": 2},
+                               {"busy_timeout": 1000})
+        try:
+            connection = engine.connect()
+            assert connection.execute("PRAGMA journal_mode").scalar() == "wal"
+            assert connection.execute("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert connection.execute("PRAGMA busy_timeout").scalar() == 1000
+            connection.close()
+
+            # more connections than the pool keeps never wait for one to be returned
+            connections = [engine.connect() for _ in range(5)]
+            for connection in connections:
+                connection.close()
+
+            stats = get_pool_stats(engine)
+            assert stats.checkouts == 6
+            assert stats.max_wait >= stats.average_wait >= 0
+            assert engine.pool.size() == 2
+        finally:
+            engine.dispose()
+
+
+def test_memory_engine():
+    engine = create_engine("sqlite://")
+    assert get_pool_stats(engine) is None
+    assert engine.execute("SELECT 1").scalar() == 1
+
+
+def test_migrate():
+    engine = create_engine("sqlite://")
+    table_metadata = sqlalchemy.MetaData()
+    table = Table("test", table_metadata, Column("name", String), Column("chan", String))
+
+    # new tables already have the latest schema, so their migrations are skipped
+    skipped = Migration(1, "this isn't sql")
+    assert migrate(engine, "test", [table], [skipped]) == 1
+
+    # declared indexes are added to existing tables
+    Index("test_chan", table.c.chan)
+    migration = Migration(2, "insert into test (name, chan) values ('a', '#b')")
+    assert migrate(engine, "test", [table], [skipped, migration]) == 2
+    assert [index["name"] for index in sqlalchemy.inspect(engine).get_indexes("test")] == ["test_chan"]
+    assert engine.execute("select count(*) from test").scalar() == 1
+
+    # applied migrations aren't run again
+    assert migrate(engine, "test", [table], [skipped, migration]) == 2
+    assert engine.execute("select count(*) from test").scalar() == 1
+
+    # plugins without tables get their migrations run
+    steps = []
+    assert migrate(engine, "other", [], [Migration(1, steps.append)]) == 1
+    assert len(steps) == 1
+
+
+def test_migrate_all():
+    engine = create_engine("sqlite://")
+    table_metadata = sqlalchemy.MetaData()
+    first = Table("first", table_metadata, Column("name", String))
+    second = Table("second", table_metadata, Column("name", String))
+
+    versions = migrate_all(engine, [("first", [first], []), ("second", [second], [Migration(3, "this isn't sql")]),
+                                    ("third", [], [Migration(1, "create table third (name)")])])
+    assert versions == {"first": 0, "second": 3, "third": 1}
+    assert set(sqlalchemy.inspect(engine).get_table_names()) == {"first", "second", "third", "schema_versions"}
+
+
+def test_cached_table():
+    engine = create_engine("sqlite://")
+    table_metadata = sqlalchemy.MetaData()
+    table = Table("test", table_metadata, Column("conn", String, primary_key=True),
+                  Column("nick", String, primary_key=True), Column("chan", String), Column("op", Boolean, default=False))
+    table_metadata.create_all(engine)
+    engine.execute(table.insert().values(conn="a", nick="foo", chan="#x", op=True))
+    db = sessionmaker(bind=engine)()
+
+    cache = CachedTable(table, ("conn", "nick"), indexes=[("conn", "chan")])
+    cache.load(db)
+    assert cache.get("a", "foo")["op"] is True
+    assert cache.get("a", "bar") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.insert(db, conn="a", nick="bar", chan="#x")
+    assert cache.get("a", "bar")["op"] is False
+    assert sorted(row["nick"] for row in cache.find(conn="a", chan="#x")) == ["bar", "foo"]
+    assert cache.scans == 0
+
+    cache.upsert(db, conn="a", nick="bar", chan="#y")
+    assert [row["nick"] for row in cache.find(conn="a", chan="#y")] == ["bar"]
+    assert [row["nick"] for row in cache.find(chan="#x")] == ["foo"]
+    assert cache.scans == 1
+
+    cache.delete(db, "a", "foo")
+    assert ("a", "foo") not in cache
+    assert cache.delete_where(db, conn="a", chan="#y") == 1
+    assert len(cache) == 0
+    assert engine.execute("select count(*) from test").scalar() == 0
+
+    # the mirror matches the table after reloading
+    cache.upsert(db, conn="b", nick="baz", chan="#z")
+    rows = list(cache)
+    cache.load(db)
+    assert list(cache) == rows
+    assert cache.memory_usage() > 0
+
+
+def test_cached_table_threads():
+    engine = create_engine("sqlite://")
+    table_metadata = sqlalchemy.MetaData()
+    table = Table("test", table_metadata, Column("conn", String, primary_key=True),
+                  Column("nick", String, primary_key=True), Column("chan", String))
+    table_metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    cache = CachedTable(table, ("conn", "nick"), indexes=[("conn", "chan")])
+    for i in range(50):
+        cache.insert(db, conn="a", nick=str(i), chan="#x")
+
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                # the mirror is never seen empty while it is reloaded or written to
+                assert cache.find(chan="#x")
+                assert len(list(cache)) >= 50
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for i in range(50, 150):
+            cache.insert(db, conn="a", nick=str(i), chan="#x")
+            cache.load(db)
+    finally:
+        done.set()
+        reader.join()
+
+    assert not errors
+    assert len(cache) == 150
@@ -1,5 +1,6 @@
 from cloudbot.util.formatting import munge, dict_format, pluralize, strip_colors, truncate, truncate_str, \
-    strip_html, multi_replace, multiword_replace, truncate_words, smart_split, get_text_list, ireplace, chunk_str
+    strip_html, multi_replace, multiword_replace, truncate_words, smart_split, get_text_list, ireplace, chunk_str, \
+    chunk_bytes
 
 test_munge_input = "The quick brown fox jumps over the lazy dog"
 test_munge_count = 3
@@ -106,6 +107,44 @@ def test_chunk_str():
     assert chunk_str(test_chunk_str_input, 10) == test_chunk_str_result
 
 
+def test_chunk_bytes():
+    # short strings are returned as-is
+    assert chunk_bytes("short", 10) == ["short"]
+    # ascii splits on spaces, like chunk_str
+    assert chunk_bytes("The quick brown fox jumps", 10) == ["The quick", "brown fox", "jumps"]
+
+    # CJK characters are three bytes each, and are never split
+    text = "日本語のテキスト" * 10
+    chunks = chunk_bytes(text, 20)
+    assert "".join(chunks) == text
+    assert all(len(chunk.encode()) <= 20 for chunk in chunks)
+    assert chunks[0] == "日本語のテキ"
+
+    # emoji are four bytes each
+    text = "a" + "\U0001F600" * 30
+    chunks = chunk_bytes(text, 10)
+    assert "".join(chunks) == text
+    assert all(len(chunk.encode()) <= 10 for chunk in chunks)
+    assert chunks[0] == "a\U0001F600\U0001F600"
+
+    # words are kept together when mixed with multibyte text
+    chunks = chunk_bytes("héllo wörld ünïcode", 14)
+    assert chunks == ["héllo wörld", "ünïcode"]
+
+
+def test_chunk_bytes_formatting():
+    # bold and colors are restarted in the next chunk
+    chunks = chunk_bytes("\x02bold \x034,12colored words here", 20)
+    assert chunks == ["\x02bold \x034,12colored", "\x02\x0304,12words here"]
+
+    # finished formatting isn't carried over
+    assert chunk_bytes("\x02bold\x02 plain text", 12) == ["\x02bold\x02 plain", "text"]
+
+    # color codes are not separated from their numbers
+    chunks = chunk_bytes("abcdefghi\x0304xyz", 12)
+    assert chunks == ["abcdefghi", "\x0304xyz"]
+
+
 def test_get_text_list():
     assert get_text_list(['a', 'b', 'c', 'd']) == 'a, b, c or d'
     assert get_text_list(['a', 'b', 'c'], 'and') == 'a, b and c'
@@ -0,0 +1,64 @@
+import pytest
+
+from cloudbot.util.ircparse import parse_line, parse_tags
+
+
+def test_parse_privmsg():
+    message = parse_line(":nick!user@host.example PRIVMSG #channel :hello there :)")
+    assert message.tags is None
+    assert message.prefix == "nick!user@host.example"
+    assert message.command == "PRIVMSG"
+    assert message.params == ["#channel"]
+    assert message.trailing == "hello there :)"
+    assert message.paramlist == ["#channel", ":hello there :)"]
+    assert message.content == "hello there :)"
+    assert (message.nick, message.user, message.host) == ("nick", "user", "host.example")
+
+
+def test_parse_no_prefix():
+    message = parse_line("PING :irc.example.com")
+    assert message.prefix is None
+    assert message.command == "PING"
+    assert message.paramlist == [":irc.example.com"]
+    assert (message.nick, message.user, message.host) == (None, None, None)
+
+
+def test_parse_middle_params():
+    message = parse_line(":irc.example.com 005 bot CHANTYPES=# PREFIX=(ov)@+  NETWORK=Example :are supported")
+    assert message.params == ["bot", "CHANTYPES=#", "PREFIX=(ov)@+", "NETWORK=Example"]
+    assert message.trailing == "are supported"
+    assert message.nick == "irc.example.com"
+    assert message.user is None
+
+    message = parse_line(":nick!user@host MODE #channel +o other")
+    assert message.trailing is None
+    assert message.paramlist == ["#channel", "+o", "other"]
+    assert message.content == "other"
+
+
+def test_parse_empty_trailing():
+    message = parse_line(":nick!user@host PART #channel :")
+    assert message.params == ["#channel"]
+    assert message.trailing == ""
+
+
+def test_parse_tags():
+    message = parse_line(r"@time=2016-01-01T00:00:00.000Z;account=someone;+example/flag :nick!u@h PRIVMSG #c :hi")
+    assert message.tags == {"time": "2016-01-01T00:00:00.000Z", "account": "someone", "+example/flag": ""}
+    assert message.nick == "nick"
+    assert message.command == "PRIVMSG"
+    assert message.trailing == "hi"
+
+    assert parse_tags(r"a=one\stwo\:three\\four\r\n;b=;c=x\y\\") == {"a": "one two;three\\four\r\n", "b": "",
+                                                                     "c": "xy\\"}
+
+
+def test_round_trip():
+    line = r"@a=one\stwo;b :nick!user@host PRIVMSG #channel :some text"
+    assert str(parse_line(line)) == line
+
+
+def test_invalid_lines():
+    for line in ("", ":prefix-only", "@a=b", ":prefix ", "   "):
+        with pytest.raises(ValueError):
+            parse_line(line)
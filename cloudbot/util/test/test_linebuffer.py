@@ -0,0 +1,51 @@
+from cloudbot.util.linebuffer import LineBuffer
+
+
+def test_split_lines():
+    buffer = LineBuffer()
+    assert buffer.feed(b":a PRIVMSG #b :one\r\n:a PRIVMSG #b :two\r\n") == [b":a PRIVMSG #b :one",
+                                                                          b":a PRIVMSG #b :two"]
+    assert buffer.buffered == 0
+    assert buffer.lines_received == 2
+
+
+def test_partial_lines():
+    buffer = LineBuffer()
+    assert buffer.feed(b"PING :ab") == []
+    assert buffer.buffered == 8
+    assert buffer.feed(b"c\r") == []
+    assert buffer.feed(b"\nPING") == [b"PING :abc"]
+    assert buffer.buffered == 4
+
+
+def test_bare_newline_and_empty_lines():
+    buffer = LineBuffer()
+    assert buffer.feed(b"one\ntwo\r\n\r\n\nthree\n") == [b"one", b"two", b"three"]
+
+
+def test_max_line_length():
+    buffer = LineBuffer(max_line_length=10)
+    assert buffer.feed(b"0123456789abc\r\nok\r\n") == [b"0123456789", b"ok"]
+    assert buffer.lines_truncated == 1
+
+    # a long line split over several chunks is only returned once
+    assert buffer.feed(b"0123456") == []
+    assert buffer.feed(b"789abcdef") == [b"0123456789"]
+    assert buffer.buffered == 0
+    assert buffer.feed(b"ghijklmnopqrstuvwxyz") == []
+    assert buffer.feed(b"\r\nnext\r\n") == [b"next"]
+    assert buffer.lines_truncated == 2
+
+
+def test_large_burst():
+    line = b":nick!user@host PRIVMSG #channel :" + b"x" * 100 + b"\r\n"
+    data = line * 20000
+    buffer = LineBuffer()
+    lines = []
+    for i in range(0, len(data), 4096):
+        lines.extend(buffer.feed(data[i:i + 4096]))
+    assert len(lines) == 20000
+    assert lines[0] == line[:-2]
+    assert lines[-1] == line[:-2]
+    assert buffer.bytes_received == len(data)
+    assert buffer.buffered == 0
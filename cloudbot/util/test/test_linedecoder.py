@@ -0,0 +1,54 @@
+from cloudbot.util.linedecoder import LineDecoder
+
+
+def test_decode_ascii():
+    decoder = LineDecoder()
+    assert decoder.decode(b":nick!user@host PRIVMSG #channel :hello") == ":nick!user@host PRIVMSG #channel :hello"
+    assert decoder.ascii_lines == 1
+    assert decoder.fallback_count == 0
+
+
+def test_decode_utf8():
+    decoder = LineDecoder()
+    line = ":nick!user@host PRIVMSG #channel :héllo 日本語"
+    assert decoder.decode(line.encode("utf-8")) == line
+    assert decoder.fallback_count == 0
+
+
+def test_decode_fallback():
+    decoder = LineDecoder()
+    line = ":nick!user@host PRIVMSG #channel :café €5"
+    assert decoder.decode(line.encode("cp1252")) == line
+    assert decoder.fallbacks["cp1252"] == 1
+
+    # 0x81 isn't valid cp1252
+    assert decoder.decode(b":nick!user@host PRIVMSG #channel :\x81") == ":nick!user@host PRIVMSG #channel :\x81"
+    assert decoder.fallbacks["iso8859-1"] == 1
+
+
+def test_sender_cache():
+    decoder = LineDecoder(fallback_encodings=["shift_jis", "cp1252"])
+    line = ":nick!user@host PRIVMSG #channel :日本語"
+    assert decoder.decode(line.encode("shift_jis")) == line
+    assert decoder._sender_encodings[b"nick!user@host"] == "shift_jis"
+
+    # a sender that switches to UTF-8 is still decoded correctly
+    assert decoder.decode(line.encode("utf-8")) == line
+    assert decoder._sender_encodings[b"nick!user@host"] == "utf-8"
+
+
+def test_sender_cache_size():
+    decoder = LineDecoder(cache_size=2)
+    for nick in (b"a", b"b", b"c"):
+        decoder.decode(b"@time=x :" + nick + b"!u@h PRIVMSG #c :\xe9")
+    assert list(decoder._sender_encodings) == [b"b!u@h", b"c!u@h"]
+
+
+def test_forget():
+    decoder = LineDecoder()
+    decoder.decode(b":nick!user@host PRIVMSG #channel :\xe9")
+    assert b"nick!user@host" in decoder._sender_encodings
+
+    decoder.forget(b"@time=x :nick!user@host QUIT :bye")
+    assert b"nick!user@host" not in decoder._sender_encodings
+    decoder.forget(b"PING :server")
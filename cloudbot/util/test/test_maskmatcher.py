@@ -0,0 +1,47 @@
+import random
+import re
+from fnmatch import fnmatch
+
+from cloudbot.util.maskmatcher import MaskMatcher, translate
+
+
+def test_translate():
+    assert re.fullmatch(translate("*!*@host.com"), "nick!user@host.com")
+    assert not re.fullmatch(translate("*!*@host.com"), "nick!user@hostxcom")
+    assert re.fullmatch(translate("nick?!*@*"), "nick_!user@host")
+    assert re.fullmatch(translate("[ab]!*@*"), "b!user@host")
+    assert re.fullmatch(translate("[!ab]!*@*"), "c!user@host")
+    assert not re.fullmatch(translate("[!ab]!*@*"), "a!user@host")
+    assert re.fullmatch(translate("nick[!*@*"), "nick[!user@host")
+
+
+def test_match():
+    matcher = MaskMatcher(["Luke!*@*", "*!*@snoonet/staff/*", "exact!user@host"])
+    assert matcher.match("luke!~luke@host.com")
+    assert matcher.match("Someone!user@snoonet/staff/someone")
+    assert matcher.match("EXACT!user@host")
+    assert not matcher.match("exact!user@host2")
+    assert not matcher.match("lukes!user@host")
+    assert len(matcher) == 3
+
+    assert not MaskMatcher([]).match("nick!user@host")
+
+    # an invalid mask doesn't stop the others from matching
+    matcher = MaskMatcher(["[z-a]!*@*", "luke!*@*"])
+    assert matcher.match("luke!user@host")
+    assert matcher.patterns == ["luke!*@*"]
+
+
+def test_match_like_fnmatch():
+    rand = random.Random(0)
+    chars = "ab!@.*?[]"
+    masks = ["".join(rand.choice(chars) for _ in range(rand.randint(1, 8))) for _ in range(2000)]
+    users = ["".join(rand.choice("ab!@.[]") for _ in range(rand.randint(1, 8))) for _ in range(200)]
+    for mask in masks[:200]:
+        single = MaskMatcher([mask])
+        for user in users:
+            assert single.match(user) == fnmatch(user, mask.lower()), (mask, user)
+
+    matcher = MaskMatcher(masks)
+    for user in users:
+        assert matcher.match(user) == any(fnmatch(user, mask.lower()) for mask in masks), user
@@ -0,0 +1,40 @@
+import pytest
+
+from cloudbot.util.prefixtrie import PrefixTrie
+
+
+def test_mapping():
+    trie = PrefixTrie()
+    trie["weather"] = 1
+    trie["we"] = 2
+    trie["weather"] = 3
+
+    assert len(trie) == 2
+    assert trie["weather"] == 3
+    assert trie.get("wea") is None
+    assert "we" in trie
+    assert "w" not in trie
+    with pytest.raises(KeyError):
+        trie["w"]
+
+    del trie["weather"]
+    assert len(trie) == 1
+    assert "weather" not in trie
+    assert trie["we"] == 2
+    with pytest.raises(KeyError):
+        del trie["weather"]
+    # the unused branch is removed
+    assert not trie._find("we").children
+
+
+def test_items():
+    trie = PrefixTrie()
+    for key in ("weather", "web", "wa", "weatherforecast", "time"):
+        trie[key] = key.upper()
+
+    assert trie.items("we") == [("weather", "WEATHER"), ("weatherforecast", "WEATHERFORECAST"), ("web", "WEB")]
+    assert trie.items("weather") == [("weather", "WEATHER"), ("weatherforecast", "WEATHERFORECAST")]
+    assert trie.items("we", exclude={"web"}) == [("weather", "WEATHER"), ("weatherforecast", "WEATHERFORECAST")]
+    assert trie.items("x") == []
+    assert len(trie.items()) == 5
+
@@ -0,0 +1,59 @@
+import re
+
+import pytest
+
+from cloudbot.util.regexmatcher import RegexMatcher, required_literals, fold
+
+
+def test_required_literals():
+    assert required_literals(re.compile(r"vimeo.com/([0-9]+)")) == (("vimeo",), ("com/",))
+    assert required_literals(re.compile(r"^[sS]/(.*/.*(?:/[igx]{,4})?)\S*$")) == (("s/",),)
+    assert required_literals(re.compile(r"^([a-z0-9_]{3,})(\+\+|\-\-)$", re.I)) == (("++", "--"),)
+    assert required_literals(re.compile(r".*(((www\.)?reddit\.com/r|redd\.it)[^ ]+)", re.I)) == \
+        (("redd.it", "reddit.com/r"),)
+    # nothing between "x" and "z" is required, so they can't be joined
+    assert set(required_literals(re.compile(r"(x(y*))z"))) == {("x",), ("z",)}
+    assert required_literals(re.compile(r"Ab(cD)e")) == (("abcde",),)
+    assert required_literals(re.compile(r"(a|\w+)b+")) == (("b",),)
+    assert required_literals(re.compile(r"\w+")) is None
+    assert required_literals(re.compile(r"caf\xe9")) == (("caf",),)
+    assert required_literals(re.compile(br"bytes")) is None
+
+
+def test_candidates():
+    youtube_re = re.compile(r'(?:youtube.*?(?:v=|/v/)|youtu\.be/)([-_a-zA-Z0-9]+)', re.I)
+    karma_re = re.compile(r"^([a-z0-9_]{3,})(\+\+|\-\-)$", re.I)
+    any_re = re.compile(r"\w+")
+
+    matcher = RegexMatcher()
+    matcher.add(youtube_re, "youtube")
+    matcher.add(karma_re, "karma")
+    matcher.add(any_re, "any")
+
+    assert matcher.candidates("hello there") == [(any_re, "any")]
+    assert matcher.candidates("https://YOUTU.BE/abc") == [(youtube_re, "youtube"), (any_re, "any")]
+    assert matcher.candidates("cloudbot--") == [(karma_re, "karma"), (any_re, "any")]
+    assert matcher.skipped == 4
+    assert matcher.checked == 5
+
+    matcher.remove(youtube_re, "youtube")
+    assert len(matcher) == 2
+    assert "utube" not in matcher._literals
+    assert matcher.candidates("https://youtu.be/abc") == [(any_re, "any")]
+    with pytest.raises(ValueError):
+        matcher.remove(youtube_re, "youtube")
+
+
+
+def test_ignorecase_non_ascii():
+    # re.IGNORECASE matches these to ASCII letters, so they mustn't hide the literals a regex needs
+    cases = [("kix", "k\u0130x"), ("kix", "k\u0131x"), ("ss", "\u017fs"), ("k", "\u212a")]
+    for pattern, text in cases:
+        regex = re.compile(pattern, re.I)
+        assert regex.search(text)
+        matcher = RegexMatcher()
+        matcher.add(regex, pattern)
+        assert matcher.candidates(text) == [(regex, pattern)]
+
+    assert fold("ABC") == "abc"
+    assert fold("k\u0130x") == "kix"
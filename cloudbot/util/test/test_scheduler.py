@@ -0,0 +1,213 @@
+import asyncio
+import time
+
+from cloudbot.util.scheduler import Scheduler, PeriodicJob
+
+
+def test_schedule():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    ran = []
+    try:
+        now = time.time()
+        scheduler.schedule(now + 0.06, ran.append, "third")
+        scheduler.schedule(now + 0.02, ran.append, "first")
+        scheduler.schedule(now + 0.04, ran.append, "second", owner="test", key=1)
+        scheduler.schedule(now + 0.04, ran.append, "replaced", owner="test", key=2)
+        scheduler.schedule(now + 0.05, ran.append, "replacement", owner="test", key=2)
+        scheduler.schedule(now + 0.01, ran.append, "cancelled", owner="other", key=1)
+        assert scheduler.cancel("other", 1)
+        assert not scheduler.cancel("other", 1)
+        assert len(scheduler) == 4
+        assert [job.args[0] for job in scheduler.get_jobs("test")] == ["second", "replacement"]
+
+        loop.run_until_complete(asyncio.sleep(0.1))
+        assert ran == ["first", "second", "replacement", "third"]
+        assert scheduler.jobs_run == 4
+        assert len(scheduler) == 0
+        assert scheduler.max_lateness >= scheduler.average_lateness >= 0
+    finally:
+        loop.close()
+
+
+def test_cancel_all():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    ran = []
+    try:
+        now = time.time()
+        for i in range(10):
+            scheduler.schedule(now + 0.01, ran.append, i, owner="plugin", key=i)
+        scheduler.schedule(now + 0.01, ran.append, "kept", owner="other")
+        assert scheduler.cancel_all("plugin") == 10
+        assert len(scheduler) == 1
+
+        loop.run_until_complete(asyncio.sleep(0.05))
+        assert ran == ["kept"]
+    finally:
+        loop.close()
+
+
+def test_coroutine_job():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    tasks = []
+    create_task = loop.create_task
+    loop.create_task = lambda coro: tasks.append(create_task(coro)) or tasks[-1]
+
+    try:
+        scheduler.schedule(time.time(), asyncio.sleep, 0, "done")
+        loop.run_until_complete(asyncio.sleep(0.02))
+        assert tasks[-1].result() == "done"
+    finally:
+        loop.close()
+
+
+class FakeHandle:
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeTask:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return None
+
+    def finish(self):
+        for callback in self.callbacks:
+            callback(self)
+
+
+class FakeLoop:
+    """
+    An event loop with a clock which only moves when it's told to, and tasks which only finish when they're told to
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.handles = []
+        self.tasks = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = FakeHandle(when, callback)
+        self.handles.append(handle)
+        return handle
+
+    def create_task(self, coro):
+        task = FakeTask()
+        self.tasks.append(task)
+        return task
+
+    def advance(self, seconds):
+        end = self.now + seconds
+        while True:
+            due = [handle for handle in self.handles if not handle.cancelled and handle.when <= end]
+            if not due:
+                break
+            handle = min(due, key=lambda h: h.when)
+            self.handles.remove(handle)
+            self.now = max(self.now, handle.when)
+            handle.callback()
+        self.now = end
+
+    @property
+    def pending(self):
+        return [handle for handle in self.handles if not handle.cancelled]
+
+
+def test_periodic_fixed_delay():
+    loop = FakeLoop()
+    job = PeriodicJob(loop, 10, lambda: None, initial_interval=5, jitter=0)
+    job.start()
+    loop.advance(5)
+    assert len(loop.tasks) == 1 and job.running
+
+    # the next run is only scheduled once this one finishes
+    assert not loop.pending
+    loop.advance(3)
+    loop.tasks[0].finish()
+    assert [handle.when for handle in loop.pending] == [1018]
+
+    loop.advance(10)
+    assert len(loop.tasks) == 2
+    loop.tasks[1].finish()
+    assert job.runs == 2
+    assert job.run_time == 3
+    assert job.max_run_time == 3
+    assert job.max_lateness == 0
+
+
+def test_periodic_fixed_rate():
+    loop = FakeLoop()
+    job = PeriodicJob(loop, 10, lambda: None, fixed_rate=True, jitter=0)
+    job.start()
+    loop.advance(10)
+    loop.advance(3)
+    loop.tasks[0].finish()
+    loop.advance(7)
+    # runs are due every interval, however long they take
+    assert len(loop.tasks) == 2
+    assert job.due == 1030
+
+
+def test_periodic_skips_running():
+    loop = FakeLoop()
+    job = PeriodicJob(loop, 10, lambda: None, fixed_rate=True, jitter=0)
+    job.start()
+    loop.advance(35)
+    # the first run is still going, so the runs due at 20 and 30 seconds are skipped
+    assert len(loop.tasks) == 1
+    assert job.skipped == 2
+
+    loop.tasks[0].finish()
+    loop.advance(5)
+    assert len(loop.tasks) == 2
+    assert job.runs == 1
+
+
+def test_periodic_stop():
+    loop = FakeLoop()
+    job = PeriodicJob(loop, 10, lambda: None, jitter=0)
+    job.start()
+    loop.advance(10)
+    job.stop()
+    assert not loop.pending
+
+    # a run which was still going when the job stopped doesn't schedule another
+    loop.tasks[0].finish()
+    assert not loop.pending
+    loop.advance(100)
+    assert len(loop.tasks) == 1
+    assert job.runs == 1
+
+
+def test_periodic_jitter():
+    loop = FakeLoop()
+    job = PeriodicJob(loop, 100, lambda: None, fixed_rate=True)
+    job.start()
+    # without an explicit jitter, only the first run is jittered, by up to 5%
+    first = loop.pending[0].when
+    assert 1100 <= first <= 1105
+    loop.advance(first - loop.now)
+    assert loop.pending[0].when == 1200
+
+    job = PeriodicJob(FakeLoop(), 100, lambda: None, fixed_rate=True, jitter=50)
+    job.start()
+    job.loop.advance(job.next_run - job.loop.now)
+    assert 1200 <= job.next_run <= 1250
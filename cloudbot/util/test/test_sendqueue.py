@@ -0,0 +1,60 @@
+from cloudbot.util.sendqueue import SendQueue, PRIORITY_PROTOCOL, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+
+def test_priority_order():
+    queue = SendQueue(enabled=False)
+    queue.put(b"bulk", PRIORITY_BULK, "#a")
+    queue.put(b"reply", PRIORITY_INTERACTIVE, "#a")
+    queue.put(b"mode", PRIORITY_PROTOCOL)
+    queue.put_unthrottled(b"pong")
+    assert queue.depth == 3
+    assert queue.queue_depths() == [1, 1, 0, 1]
+
+    lines, delay = queue.pop_ready()
+    assert lines == [b"pong", b"mode", b"reply", b"bulk"]
+    assert delay is None
+    assert not queue
+    assert queue.lines_sent == 3
+
+
+def test_round_robin():
+    queue = SendQueue(enabled=False)
+    for i in range(3):
+        queue.put("a{}".format(i).encode(), PRIORITY_INTERACTIVE, "#a")
+    queue.put(b"b0", PRIORITY_INTERACTIVE, "#b")
+    queue.put(b"c0", PRIORITY_INTERACTIVE, "#c")
+
+    lines, delay = queue.pop_ready()
+    assert lines == [b"a0", b"b0", b"c0", b"a1", b"a2"]
+
+
+def test_rate_limit():
+    queue = SendQueue(tokens=2, restore_rate=1)
+    for i in range(4):
+        queue.put(str(i).encode(), PRIORITY_INTERACTIVE, "#a")
+    queue.put_unthrottled(b"pong")
+
+    lines, delay = queue.pop_ready()
+    assert lines == [b"pong", b"0", b"1"]
+    assert 0 < delay <= 1
+    assert queue.depth == 2
+
+    # nothing more may be sent until the bucket refills
+    lines, delay = queue.pop_ready()
+    assert lines == []
+    assert 0 < delay <= 1
+
+    # a connection that's closing sends everything at once
+    assert queue.pop_all() == [b"2", b"3"]
+    assert not queue
+
+
+def test_no_restore_rate():
+    # a rate limit which could never send anything is treated as no limit
+    queue = SendQueue(tokens=5, restore_rate=0)
+    assert not queue.enabled
+    for i in range(10):
+        queue.put(str(i).encode(), PRIORITY_BULK, "#a")
+    lines, delay = queue.pop_ready()
+    assert len(lines) == 10
+    assert delay is None
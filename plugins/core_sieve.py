@@ -32,15 +32,10 @@ def init_tasks(loop, conn):
     ready = True
 
 
-@asyncio.coroutine
-@hook.sieve(priority=100)
-def sieve_suite(bot, event, _hook):
-    global buckets
-
-    conn = event.conn
-
+@hook.sieve(priority=100, per_channel=True)
+def sieve_acls(bot, event, _hook):
     # check acls
-    acl = conn.config.get('acls', {}).get(_hook.function_name)
+    acl = event.conn.config.get('acls', {}).get(_hook.function_name)
     if acl:
         if 'deny-except' in acl:
             allowed_channels = list(map(str.lower, acl['deny-except']))
@@ -51,11 +46,17 @@ def sieve_suite(bot, event, _hook):
             if event.chan.lower() in denied_channels:
                 return None
 
-    # check disabled_commands
-    if _hook.type == "command":
-        disabled_commands = conn.config.get('disabled_commands', [])
-        if event.triggered_command in disabled_commands:
-            return None
+    return event
+
+
+@asyncio.coroutine
+@hook.sieve(priority=100)
+def sieve_suite(bot, event, _hook):
+    global buckets
+
+    conn = event.conn
+
+    # acls and disabled_commands are checked before the hook is launched, see sieve_acls and CloudBot.process
 
     # check permissions
     allowed_permissions = _hook.permissions
@@ -21,10 +21,7 @@ table = Table(
     Column("nick", String(25))
 )
 
-
-def _load_cache_db(db):
-    query = db.execute(table.select())
-    return [(row["word"], row["data"]) for row in query]
+factoids = database.CachedTable(table, "word")
 
 
 @asyncio.coroutine
@@ -33,11 +30,18 @@ def load_cache(async, db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global factoid_cache
-    factoid_cache = {}
-    for word, data in (yield from async(_load_cache_db, db)):
-        # nick = row["nick"]
-        factoid_cache[word] = data  # we might want (data, nick) sometime later
+    yield from async(factoids.load, db)
+
+
+def get_factoid(word):
+    """
+    :type word: str
+    :rtype: str | None
+    """
+    row = factoids.get(word)
+    if row is None:
+        return None
+    return row["data"]
 
 
 @asyncio.coroutine
@@ -48,14 +52,7 @@ def add_factoid(async, db, word, data, nick):
     :type data: str
     :type nick: str
     """
-    if word in factoid_cache:
-        # if we have a set value, update
-        yield from async(db.execute, table.update().values(data=data, nick=nick).where(table.c.word == word))
-    else:
-        # otherwise, insert
-        yield from async(db.execute, table.insert().values(word=word, data=data, nick=nick))
-    yield from async(db.commit)
-    yield from load_cache(async, db)
+    yield from async(factoids.upsert, db, word=word, data=data, nick=nick)
 
 
 @asyncio.coroutine
@@ -64,9 +61,7 @@ def del_factoid(async, db, word):
     :type db: sqlalchemy.orm.Session
     :type word: str
     """
-    yield from async(db.execute, table.delete().where(table.c.word == word))
-    yield from async(db.commit)
-    yield from load_cache(async, db)
+    yield from async(factoids.delete, db, word)
 
 
 @asyncio.coroutine
@@ -81,7 +76,7 @@ def remember(text, nick, db, notice, async):
 
     word = word.lower()
 
-    old_data = factoid_cache.get(word)
+    old_data = get_factoid(word)
 
     if data.startswith('+') and old_data:
         # remove + symbol
@@ -105,7 +100,7 @@ def remember(text, nick, db, notice, async):
 def forget(text, db, async, notice):
     """<word> - forgets previously remembered <word>"""
 
-    data = factoid_cache.get(text.lower())
+    data = get_factoid(text.lower())
 
     if data:
         yield from del_factoid(async, db, text)
@@ -123,8 +118,9 @@ def info(text, notice):
 
     text = text.strip().lower()
 
-    if text in factoid_cache:
-        notice(factoid_cache[text])
+    data = get_factoid(text)
+    if data is not None:
+        notice(data)
     else:
         notice("Unknown Factoid.")
 
@@ -146,8 +142,8 @@ def factoid(match, async, event, message, action):
     else:
         arguments = ""
 
-    if factoid_id in factoid_cache:
-        data = factoid_cache[factoid_id]
+    data = get_factoid(factoid_id)
+    if data is not None:
         # factoid pre-processors
         if data.startswith("<py>"):
             code = data[4:].strip()
@@ -181,7 +177,7 @@ def listfactoids(notice):
     """- lists all available factoids"""
     reply_text = []
     reply_text_length = 0
-    for word in factoid_cache.keys():
+    for word in sorted(row["word"] for row in factoids):
         added_length = len(word) + 2
         if reply_text_length + added_length > 400:
             notice(", ".join(reply_text))
@@ -3,7 +3,6 @@ import asyncio
 import re
 
 from cloudbot import hook
-from cloudbot.util import formatting
 
 
 @asyncio.coroutine
@@ -65,13 +64,12 @@ def help_command(text, chan, conn, bot, notice, message, has_permission):
 
             commands.append(command)
 
-        # list of lines to send to the user
-        lines = formatting.chunk_str("Here's a list of commands you can use: " + ", ". join(commands))
+        # the connection splits this into as many lines as needed
+        text = "Here's a list of commands you can use: " + ", ".join(commands)
 
-        for line in lines:
-            if chan[:1] == "#":
-                notice(line)
-            else:
-                #This is an user in this case.
-                message(line)
+        if chan[:1] == "#":
+            notice(text)
+        else:
+            #This is an user in this case.
+            message(text)
         notice("For detailed help, use {}help <command>, without the brackets.".format(conn.config["command_prefix"]))
@@ -1,4 +1,5 @@
 import asyncio
+import threading
 import time
 
 import re
@@ -6,36 +7,125 @@ from collections import deque
 
 from cloudbot import hook
 from cloudbot.event import EventType
-from cloudbot.util import timeformat
-
-db_ready = []
+from cloudbot.util import timeformat, database
+
+seen_user_schema = database.Migration(
+    1,
+    "create table if not exists seen_user(name, time, quote, chan, host, primary key(name, chan))",
+    # the name is matched with LIKE, which can't use the primary key
+    "create index if not exists seen_user_chan on seen_user (chan)"
+)
+
+# (name, chan) -> the latest seen_user row for them which hasn't been written to the database yet
+pending_seen = {}
+# (name, chan) -> seen_user rows being written by flush_seen, which are kept until they're committed
+flushing_seen = {}
+pending_lock = threading.Lock()
+# held while writing, so an older batch can't be committed over a newer one
+flush_lock = threading.Lock()
+last_flush = time.time()
+
+
+def get_flush_settings(bot):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    :return: The number of seconds between writes of pending seen entries, and the number of pending entries after
+             which they are written right away
+    :rtype: (float, int)
+    """
+    seen_config = bot.config.get("seen_tracking", {})
+    return seen_config.get("flush_interval", 30), seen_config.get("flush_size", 500)
 
 
-def db_init(db, conn_name):
-    """check to see that our db has the the seen table (connection name is for caching the result per connection)
+def flush_seen(db):
+    """ Writes all pending seen entries in a single transaction
     :type db: sqlalchemy.orm.Session
     """
-    global db_ready
-    if db_ready.count(conn_name) < 1:
-        db.execute("create table if not exists seen_user(name, time, quote, chan, host, primary key(name, chan))")
-        db.commit()
-        db_ready.append(conn_name)
+    global last_flush
+    with flush_lock:
+        with pending_lock:
+            flushing_seen.update(pending_seen)
+            pending_seen.clear()
+            rows = list(flushing_seen.values())
+            last_flush = time.time()
+
+        if not rows:
+            return
+
+        try:
+            db.execute(
+                "insert or replace into seen_user(name, time, quote, chan, host) "
+                "values(:name,:time,:quote,:chan,:host)", rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # put the entries back for the next flush, unless the user has been seen again since
+            with pending_lock:
+                for key, row in flushing_seen.items():
+                    pending_seen.setdefault(key, row)
+                flushing_seen.clear()
+            raise
+
+        with pending_lock:
+            flushing_seen.clear()
+
+
+def flush_seen_if_pending(bot):
+    """ Writes all pending seen entries, opening a database session only if there are any
+    :type bot: cloudbot.bot.CloudBot
+    """
+    if not pending_seen:
+        return
+
+    db = bot.db_factory()
+    try:
+        flush_seen(db)
+    finally:
+        db.close()
 
 
-def track_seen(event, db, conn):
+def get_pending_seen(name, chan):
+    """ Finds a seen entry which isn't in the database yet, matching the name like the seen_user query does
+    :type name: str
+    :type chan: str
+    :rtype: dict | None
+    """
+    with pending_lock:
+        # pending entries are newer than ones being written
+        for rows in (pending_seen, flushing_seen):
+            row = rows.get((name, chan))
+            if row is not None:
+                return row
+
+        if "_" not in name:
+            return None
+
+        # "_" is a wildcard in the LIKE query
+        name_re = re.compile("".join("." if char == "_" else re.escape(char) for char in name) + "$")
+        for rows in (pending_seen, flushing_seen):
+            for (pending_name, pending_chan), row in rows.items():
+                if pending_chan == chan and name_re.match(pending_name):
+                    return row
+    return None
+
+
+def track_seen(event, db, bot):
     """ Tracks messages for the .seen command
     :type event: cloudbot.event.Event
     :type db: sqlalchemy.orm.Session
-    :type conn: cloudbot.client.Client
+    :type bot: cloudbot.bot.CloudBot
     """
-    db_init(db, conn)
     # keep private messages private
     if event.chan[:1] == "#" and not re.findall('^s/.*/.*/$', event.content.lower()):
-        db.execute(
-            "insert or replace into seen_user(name, time, quote, chan, host) values(:name,:time,:quote,:chan,:host)",
-            {'name': event.nick.lower(), 'time': time.time(), 'quote': event.content, 'chan': event.chan,
-             'host': event.mask})
-        db.commit()
+        name = event.nick.lower()
+        flush_interval, flush_size = get_flush_settings(bot)
+        with pending_lock:
+            pending_seen[(name, event.chan)] = {'name': name, 'time': time.time(), 'quote': event.content,
+                                                'chan': event.chan, 'host': event.mask}
+            size = len(pending_seen)
+
+        if size >= flush_size:
+            flush_seen(db)
 
 
 def track_history(event, message_time, conn):
@@ -56,20 +146,39 @@ def track_history(event, message_time, conn):
 
 
 @hook.event([EventType.message, EventType.action], singlethread=True)
-def chat_tracker(event, db, conn):
+def chat_tracker(event, db, conn, bot):
     """
     :type db: sqlalchemy.orm.Session
     :type event: cloudbot.event.Event
     :type conn: cloudbot.client.Client
+    :type bot: cloudbot.bot.CloudBot
     """
     if event.type is EventType.action:
         event.content = "\x01ACTION {}\x01".format(event.content)
 
     message_time = time.time()
-    track_seen(event, db, conn)
+    track_seen(event, db, bot)
     track_history(event, message_time, conn)
 
 
+@hook.periodic(5, initial_interval=5)
+def flush_seen_periodic(bot):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    """
+    flush_interval, flush_size = get_flush_settings(bot)
+    if time.time() - last_flush >= flush_interval:
+        flush_seen_if_pending(bot)
+
+
+@hook.on_stop()
+def flush_seen_on_stop(bot):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    """
+    flush_seen_if_pending(bot)
+
+
 @asyncio.coroutine
 @hook.command(autohelp=False)
 def resethistory(event, conn):
@@ -112,11 +221,14 @@ def seen(text, nick, chan, db, event, conn):
     else:
         chan_to_check = chan
 
-    db_init(db, conn.name)
-
     last_seen = db.execute("select name, time, quote from seen_user where name like :name and chan = :chan",
                            {'name': name, 'chan': chan_to_check}).fetchone()
 
+    # entries which haven't been written yet are newer than the database, unless writing them failed
+    pending = get_pending_seen(name, chan_to_check)
+    if pending is not None and (not last_seen or pending['time'] >= last_seen[1]):
+        last_seen = (pending['name'], pending['time'], pending['quote'])
+
     if last_seen:
         reltime = timeformat.time_since(last_seen[1])
         if last_seen[0] != name.lower():  # for glob matching
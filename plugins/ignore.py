@@ -1,10 +1,12 @@
 import asyncio
-from fnmatch import fnmatch
+import threading
+from collections import OrderedDict
 
 from sqlalchemy import Table, Column, UniqueConstraint, PrimaryKeyConstraint, String, Boolean
 
 from cloudbot import hook
 from cloudbot.util import database
+from cloudbot.util.maskmatcher import MaskMatcher
 
 
 table = Table(
@@ -18,64 +20,125 @@ table = Table(
     PrimaryKeyConstraint("connection", "channel", "mask")
 )
 
+ignores = database.CachedTable(table, ("connection", "channel", "mask"),
+                               indexes=[("connection", "channel"), ("channel",)])
+
+# the number of (connection, channel, mask) verdicts to remember
+verdict_cache_size = 1024
+
+# bucket -> the compiled masks of the bucket. Buckets are (connection, channel) for channel ignores, and "*" for
+# global ignores, which apply on every connection. Matchers are compiled when they are first needed.
+matchers = {}
+# (connection, channel, mask) -> whether the mask is ignored there, in least to most recently used order
+verdicts = OrderedDict()
+# the number of times the ignores have changed. Matchers and verdicts are worked out without holding the lock, and
+# are only stored if nothing changed in the meantime.
+changes = 0
+ignore_lock = threading.Lock()
+
 
 @hook.on_start
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global ignore_cache
-    ignore_cache = []
-    for row in db.execute(table.select()):
-        conn = row["connection"]
-        chan = row["channel"]
-        mask = row["mask"]
-        ignore_cache.append((conn, chan, mask))
+    global changes
+    ignores.load(db)
+    with ignore_lock:
+        changes += 1
+        matchers.clear()
+        verdicts.clear()
 
 
-def add_ignore(db, conn, chan, mask):
-    if (conn, chan) in ignore_cache:
-        pass
-    else:
-        db.execute(table.insert().values(connection=conn, channel=chan, mask=mask))
+def _get_bucket(conn, chan):
+    if chan == "*":
+        return "*"
+    return conn, chan
+
+
+def _changed(conn, chan):
+    """
+    Forgets the compiled masks of the bucket an ignore was added to or removed from, and all verdicts
+    """
+    global changes
+    with ignore_lock:
+        changes += 1
+        matchers.pop(_get_bucket(conn, chan), None)
+        verdicts.clear()
+
+
+def _get_matcher(bucket, seen_changes):
+    """
+    Gets the compiled masks of a bucket, compiling them if they aren't yet. This must be called without holding
+    ignore_lock.
+    :type bucket: (str, str) | str
+    :param seen_changes: The value of changes before the caller started looking at the ignores
+    :type seen_changes: int
+    :rtype: MaskMatcher
+    """
+    matcher = matchers.get(bucket)
+    if matcher is None:
+        if bucket == "*":
+            rows = ignores.find(channel="*")
+        else:
+            rows = ignores.find(connection=bucket[0], channel=bucket[1])
+        matcher = MaskMatcher(row["mask"] for row in rows)
+        with ignore_lock:
+            if changes == seen_changes:
+                matchers[bucket] = matcher
+    return matcher
 
-    db.commit()
-    load_cache(db)
+
+def add_ignore(db, conn, chan, mask):
+    if (conn, chan, mask) not in ignores:
+        ignores.insert(db, connection=conn, channel=chan, mask=mask)
+        _changed(conn, chan)
 
 
 def remove_ignore(db, conn, chan, mask):
-    db.execute(table.delete().where(table.c.connection == conn).where(table.c.channel == chan)
-               .where(table.c.mask == mask))
-    db.commit()
-    load_cache(db)
+    ignores.delete(db, conn, chan, mask)
+    _changed(conn, chan)
+
 
 def is_ignored(conn, chan, mask):
-    for _conn, _chan, _mask in ignore_cache:
-        if _chan == "*":
-            # this is a global ignore
-            if fnmatch(mask, _mask):
-                return True
-        else:
-            # this is a channel-specific ignore
-            if not (conn, chan) == (_conn, _chan):
-                continue
-            if fnmatch(mask, _mask):
-                return True
+    """
+    :type conn: str
+    :type chan: str
+    :type mask: str
+    :rtype: bool
+    """
+    # Masks match case-insensitively, as IRC nicks and hosts are. The ignore commands and the ignore sieve already
+    # lowercased masks when they were matched with fnmatch, so only ignores written to the table by hand with capital
+    # letters match differently: they never used to match, and now they do.
+    key = (conn, chan, mask)
+    with ignore_lock:
+        verdict = verdicts.get(key)
+        if verdict is not None:
+            verdicts.move_to_end(key)
+            return verdict
+        seen_changes = changes
+
+    # this runs in the event loop, so threaded hooks adding or removing ignores mustn't have to wait for it
+    verdict = _get_matcher("*", seen_changes).match(mask) or \
+        (chan != "*" and _get_matcher((conn, chan), seen_changes).match(mask))
+
+    with ignore_lock:
+        if changes == seen_changes:
+            verdicts[key] = verdict
+            if len(verdicts) > verdict_cache_size:
+                verdicts.popitem(last=False)
+    return verdict
 
 
 # noinspection PyUnusedLocal
 @asyncio.coroutine
-@hook.sieve(priority=50)
+@hook.sieve(priority=50, hook_types=["command", "regex"])
 def ignore_sieve(bot, event, _hook):
     """
     :type bot: cloudbot.bot.CloudBot
     :type event: cloudbot.event.Event
     :type _hook: cloudbot.plugin.Hook
     """
-    # don't block event hooks
-    if _hook.type in ("irc_raw", "event"):
-        return event
-
     # don't block an event that could be unignoring
     if _hook.type == "command" and event.triggered_command in ("unignore", "global_unignore"):
         return event
@@ -17,28 +17,23 @@ table = Table(
     PrimaryKeyConstraint('nick')
 )
 
+accounts = database.CachedTable(table, "nick")
+
 
 @hook.on_start()
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global last_cache
-    last_cache = []
-    for row in db.execute(table.select()):
-        nick = row["nick"]
-        account = row["acc"]
-        last_cache.append((nick, account))
+    accounts.load(db)
 
 
 def get_account(nick):
-    """looks in last_cache for the lastfm account name"""
-    last_account = [row[1] for row in last_cache if nick.lower() == row[0]]
-    if not last_account:
+    """looks in accounts for the lastfm account name"""
+    row = accounts.get(nick.lower())
+    if row is None:
         return
-    else:
-        last_account = last_account[0]
-    return last_account
+    return row["acc"]
 
 
 @hook.command("lastfm", "np", autohelp=False)
@@ -114,10 +109,7 @@ def lastfm(text, nick, db, bot, notice):
     out += ending
 
     if text and not dontsave:
-        db.execute("insert or replace into lastfm(nick, acc) values (:nick, :account)",
-                   {'nick': nick.lower(), 'account': user})
-        db.commit()
-        load_cache(db)
+        accounts.upsert(db, nick=nick.lower(), acc=user)
     return out
 
 
@@ -9,7 +9,7 @@ from cloudbot import hook
 from cloudbot.util import database
 
 from sqlalchemy import select
-from sqlalchemy import Table, DateTime, Column, String, PrimaryKeyConstraint, Text
+from sqlalchemy import Table, DateTime, Column, String, PrimaryKeyConstraint, Text, Index
 from sqlalchemy.orm import mapper
 import sqlalchemy.sql
 
@@ -20,7 +20,8 @@ table = Table(
     Column('add_nick', String(25)),
     Column('msg', Text),
     Column('time', DateTime),
-    PrimaryKeyConstraint('chan', 'msg')
+    PrimaryKeyConstraint('chan', 'msg'),
+    Index('quote_chan_time', 'chan', 'time')
 )
 
 class Quote(object):
@@ -4,6 +4,7 @@ import math
 import random
 import asyncio
 import functools
+import concurrent.futures
 import urllib.parse
 from html.parser import HTMLParser
 
@@ -15,6 +16,7 @@ import requests
 
 from cloudbot import hook
 from cloudbot.util import timeformat, formatting, database
+from cloudbot.util.sendqueue import PRIORITY_BULK
 
 
 reddit_re = re.compile(r'.*(((www\.)?reddit\.com/r|redd\.it)[^ ]+)', re.I)
@@ -22,8 +24,19 @@ reddit_re = re.compile(r'.*(((www\.)?reddit\.com/r|redd\.it)[^ ]+)', re.I)
 base_url = "http://reddit.com/r/{}/.json"
 top_url = "http://reddit.com/r/{}/top/.json?t={}"
 short_url = "http://redd.it/{}"
+new_url = "https://reddit.com/r/{}/new/.json"
+
+# the most subreddits the watcher fetches at once
+max_concurrent_fetches = 8
+# seconds to wait for reddit to answer a fetch
+fetch_timeout = 30
+
+# the watcher's fetches get their own threads, so a slow reddit can't hold up the threads threaded hooks run in
+fetch_executor = concurrent.futures.ThreadPoolExecutor(max_concurrent_fetches)
 
 subreddit_cache = []
+# subreddit -> (ETag, Last-Modified) of its last fetched listing
+listing_validators = {}
 
 table = Table(
     'reddit',
@@ -47,41 +60,100 @@ class Reddit(object):
 
 mapper(Reddit, table)
 
+def fetch_new_posts(subreddit, user_agent):
+    """
+    Fetches the newest posts of a subreddit, sending the ETag and Last-Modified of the last fetch, so an unchanged
+    listing isn't sent again.
+    :type subreddit: str
+    :type user_agent: str
+    :return: The posts and the listing's (ETag, Last-Modified), or None if the listing hasn't changed since the last
+             fetch
+    :rtype: (list[dict], (str, str)) | None
+    """
+    # Again, identify with Reddit using an User Agent, otherwise get a 429
+    headers = {'User-Agent': user_agent}
+    etag, last_modified = listing_validators.get(subreddit, (None, None))
+    if etag is not None:
+        headers['If-None-Match'] = etag
+    if last_modified is not None:
+        headers['If-Modified-Since'] = last_modified
+
+    inquiry = requests.get(new_url.format(subreddit), headers=headers, timeout=fetch_timeout)
+    if inquiry.status_code == 304:
+        return None
+    inquiry.raise_for_status()
+
+    posts = inquiry.json()["data"]["children"]
+    return posts, (inquiry.headers.get('ETag'), inquiry.headers.get('Last-Modified'))
+
+
+@hook.on_stop
+def shutdown_fetch_executor():
+    fetch_executor.shutdown(wait=False)
+
+
 @asyncio.coroutine
 @hook.periodic(120, initial_interval=120)
 def check_subreddits(bot, async, db, loop):
     """
     type db: sqlalchemy.orm.Session
     """
-    headers = {'User-Agent': bot.user_agent}
+    watches = yield from async(db.query(Reddit).all)
+
+    # fetch each subreddit once, however many channels watch it
+    watchers = {}
+    for watch in watches:
+        watchers.setdefault(watch.subreddit.lower(), []).append(watch)
 
-    for subreddit in db.query(Reddit).all():
-        print("REDDIT: processing subreddit {}".format(subreddit))
-        url = 'https://reddit.com/r/{}/new/.json'.format(subreddit.subreddit)
+    @asyncio.coroutine
+    def fetch(subreddit):
+        # the executor has max_concurrent_fetches threads, so no more fetches than that run at once
         try:
-            # Again, identify with Reddit using an User Agent, otherwise get a 429
-            inquiry = yield from loop.run_in_executor(None, functools.partial(requests.get, url, headers=headers))
-            data = inquiry.json()
+            return (yield from loop.run_in_executor(fetch_executor, fetch_new_posts, subreddit, bot.user_agent))
         except Exception as e:
-            print("REDDIT: we couldn't do fetching: {}".format(e))
+            bot.logger.warning("[reddit] Couldn't fetch /r/{}: {}".format(subreddit, e))
+            return None
+
+    subreddits = list(watchers)
+    listings = yield from asyncio.gather(*[fetch(subreddit) for subreddit in subreddits], loop=loop)
+
+    changed = False
+    # subreddit -> validators of listings whose new posts were all sent
+    delivered = {}
+    for subreddit, listing in zip(subreddits, listings):
+        if listing is None:
+            # unchanged or not fetched
             continue
-        new_posts = [item for item in data["data"]["children"] if datetime.fromtimestamp(item['data']['created_utc']) > subreddit.latest]
 
-        print("REDDIT: new posts: {}".format(new_posts))
+        posts, validators = listing
+        delivered[subreddit] = validators
+        for watch in watchers[subreddit]:
+            new_posts = [item for item in posts if datetime.fromtimestamp(item['data']['created_utc']) > watch.latest]
+            if not new_posts:
+                continue
+            if watch.connection not in bot.connections:
+                # fetch the whole listing again next time, so these posts are sent once the connection is back
+                delivered.pop(subreddit, None)
+                continue
 
-        if len(new_posts) > 0:
-            conn = bot.connections[subreddit.connection]
+            conn = bot.connections[watch.connection]
 
             # we have new posts
-            subreddit.latest = datetime.fromtimestamp(new_posts[0]['data']['created_utc'])
-
-            print("REDDIT: printing {} posts now to channel {}....".format(len(new_posts), subreddit.channel))
-            print("REDDIT: latest post is {}".format(subreddit.latest))
+            watch.latest = datetime.fromtimestamp(new_posts[0]['data']['created_utc'])
+            changed = True
 
+            bot.logger.debug("[reddit] Sending {} new posts from /r/{} to {}".format(len(new_posts), subreddit,
+                                                                                    watch.channel))
             for post in new_posts:
-                conn.message(subreddit.channel, format_output(post['data'], prefix='New submission to \x02r/{}\x02 \x037|\x03 '.format(subreddit.subreddit)))
-            db.add(subreddit)
-            yield from async(db.commit)
+                conn.message(watch.channel, format_output(post['data'], prefix='New submission to \x02r/{}\x02 \x037|\x03 '.format(watch.subreddit)),
+                             priority=PRIORITY_BULK)
+
+    if changed:
+        # all channels' latest posts are saved together
+        yield from async(db.commit)
+
+    # only now that the latest posts are saved, a listing which hasn't changed since can be skipped
+    listing_validators.update(delivered)
 
 
 def format_output(item, show_url=False, prefix=None):
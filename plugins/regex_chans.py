@@ -12,6 +12,8 @@ table = Table(
     UniqueConstraint("connection", "channel")
 )
 
+regex_status = database.CachedTable(table, ("connection", "channel"))
+
 # Default value.
 # If True, all channels without a setting will have regex enabled
 # If False, all channels without a setting will have regex disabled
@@ -23,13 +25,19 @@ def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global status_cache
-    status_cache = {}
-    for row in db.execute(table.select()):
-        conn = row["connection"]
-        chan = row["channel"]
-        status = row["status"]
-        status_cache[(conn, chan)] = status
+    regex_status.load(db)
+
+
+def get_status(conn, chan):
+    """
+    :type conn: str
+    :type chan: str
+    :rtype: str | None
+    """
+    row = regex_status.get(conn, chan)
+    if row is None:
+        return None
+    return row["status"]
 
 
 def set_status(db, conn, chan, status):
@@ -39,25 +47,17 @@ def set_status(db, conn, chan, status):
     :type chan: str
     :type status: str
     """
-    if (conn, chan) in status_cache:
-        # if we have a set value, update
-        db.execute(
-            table.update().values(status=status).where(table.c.connection == conn).where(table.c.channel == chan))
-    else:
-        # otherwise, insert
-        db.execute(table.insert().values(connection=conn, channel=chan, status=status))
-    db.commit()
+    regex_status.upsert(db, connection=conn, channel=chan, status=status)
 
 
 def delete_status(db, conn, chan):
-    db.execute(table.delete().where(table.c.connection == conn).where(table.c.channel == chan))
-    db.commit()
+    regex_status.delete(db, conn, chan)
 
 
-@hook.sieve()
+@hook.sieve(hook_types="regex", per_channel=True)
 def sieve_regex(bot, event, _hook):
-    if _hook.type == "regex" and event.chan.startswith("#") and _hook.plugin.title != "factoids":
-        status = status_cache.get((event.conn.name, event.chan))
+    if event.chan.startswith("#") and _hook.plugin.title != "factoids":
+        status = get_status(event.conn.name, event.chan)
         if status != "ENABLED" and (status == "DISABLED" or not default_enabled):
             bot.logger.info("[{}] Denying {} from {}".format(event.conn.name, _hook.function_name, event.chan))
             return None
@@ -67,7 +67,7 @@ def sieve_regex(bot, event, _hook):
 
 
 @hook.command(autohelp=False, permissions=["botcontrol"])
-def enableregex(text, db, conn, chan, nick, message, notice):
+def enableregex(text, db, bot, conn, chan, nick, message, notice):
     text = text.strip().lower()
     if not text:
         channel = chan
@@ -79,11 +79,11 @@ def enableregex(text, db, conn, chan, nick, message, notice):
     message("Enabling regex matching (youtube, etc) (issued by {})".format(nick), target=channel)
     notice("Enabling regex matching (youtube, etc) in channel {}".format(channel))
     set_status(db, conn.name, channel, "ENABLED")
-    load_cache(db)
+    bot.loop.call_soon_threadsafe(bot.plugin_manager.clear_channel_hooks, conn, channel)
 
 
 @hook.command(autohelp=False, permissions=["botcontrol"])
-def disableregex(text, db, conn, chan, nick, message, notice):
+def disableregex(text, db, bot, conn, chan, nick, message, notice):
     text = text.strip().lower()
     if not text:
         channel = chan
@@ -95,11 +95,11 @@ def disableregex(text, db, conn, chan, nick, message, notice):
     message("Disabling regex matching (youtube, etc) (issued by {})".format(nick), target=channel)
     notice("Disabling regex matching (youtube, etc) in channel {}".format(channel))
     set_status(db, conn.name, channel, "DISABLED")
-    load_cache(db)
+    bot.loop.call_soon_threadsafe(bot.plugin_manager.clear_channel_hooks, conn, channel)
 
 
 @hook.command(autohelp=False, permissions=["botcontrol"])
-def resetregex(text, db, conn, chan, nick, message, notice):
+def resetregex(text, db, bot, conn, chan, nick, message, notice):
     text = text.strip().lower()
     if not text:
         channel = chan
@@ -111,7 +111,7 @@ def resetregex(text, db, conn, chan, nick, message, notice):
     message("Resetting regex matching setting (youtube, etc) (issued by {})".format(nick), target=channel)
     notice("Resetting regex matching setting (youtube, etc) in channel {}".format(channel))
     delete_status(db, conn.name, channel)
-    load_cache(db)
+    bot.loop.call_soon_threadsafe(bot.plugin_manager.clear_channel_hooks, conn, channel)
 
 
 @hook.command(autohelp=False, permissions=["botcontrol"])
@@ -123,7 +123,7 @@ def regexstatus(text, conn, chan):
         channel = text
     else:
         channel = "#{}".format(text)
-    status = status_cache.get((conn.name, chan))
+    status = get_status(conn.name, chan)
     if status is None:
         if default_enabled:
             status = "ENABLED"
@@ -135,8 +135,8 @@ def regexstatus(text, conn, chan):
 @hook.command(autohelp=False, permissions=["botcontrol"])
 def listregex(conn):
     values = []
-    for (conn_name, chan), status in status_cache.values():
-        if conn_name != conn.name:
+    for row in regex_status:
+        if row["connection"] != conn.name:
             continue
-        values.append("{}: {}".format(chan, status))
+        values.append("{}: {}".format(row["channel"], row["status"]))
     return ", ".join(values)
@@ -38,104 +38,101 @@ table = Table(
     PrimaryKeyConstraint('network', 'added_user', 'added_time')
 )
 
-
-@asyncio.coroutine
-def delete_reminder(async, db, network, remind_time, user):
-    query = table.delete() \
-        .where(table.c.network == network.lower()) \
-        .where(table.c.remind_time == remind_time) \
-        .where(table.c.added_user == user.lower())
-    yield from async(db.execute, query)
-    yield from async(db.commit)
+reminders = database.CachedTable(table, ("network", "added_user", "added_time"), indexes=[("network", "added_user")])
 
 
 @asyncio.coroutine
 def delete_all(async, db, network, user):
-    query = table.delete() \
-        .where(table.c.network == network.lower()) \
-        .where(table.c.added_user == user.lower())
-    yield from async(db.execute, query)
-    yield from async(db.commit)
+    yield from async(reminders.delete_where, db, network=network.lower(), added_user=user.lower())
 
 
 @asyncio.coroutine
 def add_reminder(async, db, network, added_user, added_chan, message, remind_time, added_time):
-    query = table.insert().values(
-        network=network.lower(),
-        added_user=added_user.lower(),
-        added_time=added_time,
-        added_chan=added_chan.lower(),
-        message=message,
-        remind_time=remind_time
-    )
-    yield from async(db.execute, query)
-    yield from async(db.commit)
+    yield from async(reminders.insert, db, network=network.lower(), added_user=added_user.lower(),
+                     added_time=added_time, added_chan=added_chan.lower(), message=message, remind_time=remind_time)
 
 
-@asyncio.coroutine
-@hook.on_start()
-def load_cache(async, db):
-    global reminder_cache
-    reminder_cache = []
+def schedule_reminder(bot, reminder):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    :type reminder: dict
+    """
+    key = (reminder["network"], reminder["added_user"], reminder["added_time"])
+    bot.scheduler.schedule(reminder["remind_time"].timestamp(), deliver_reminder, bot, key, owner="remind", key=key)
 
-    for network, remind_time, added_time, user, message in (yield from async(_load_cache_db, db)):
-        reminder_cache.append((network, remind_time, added_time, user, message))
 
-
-def _load_cache_db(db):
-    query = db.execute(table.select())
-    return [(row["network"], row["remind_time"], row["added_time"], row["added_user"], row["message"]) for row in query]
+def _delete_delivered(bot, key):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    """
+    db = bot.db_factory()
+    try:
+        reminders.delete(db, *key)
+    finally:
+        db.close()
 
 
 @asyncio.coroutine
-@hook.periodic(30, initial_interval=30)
-def check_reminders(bot, async, db):
-    current_time = datetime.now()
+def deliver_reminder(bot, key):
+    reminder = reminders.get(*key)
+    if reminder is None:
+        # deleted since it was scheduled
+        return
 
-    for reminder in reminder_cache:
-        network, remind_time, added_time, user, message = reminder
-        if remind_time <= current_time:
-            if network not in bot.connections:
-                # connection is invalid
-                yield from add_reminder(async, db, network, remind_time, user)
-                yield from load_cache(async, db)
-                continue
+    network, added_time, remind_time = reminder["network"], reminder["added_time"], reminder["remind_time"]
+    user, message = reminder["added_user"], reminder["message"]
 
-            conn = bot.connections[network]
+    if network not in bot.connections:
+        # connection is invalid
+        yield from bot.db_executor.run(_delete_delivered, bot, key)
+        return
 
-            if not conn.ready:
-                return
+    conn = bot.connections[network]
 
-            remind_text = colors.parse(time_since(added_time, count=2))
-            alert = colors.parse("{}, you have a reminder from $(b){}$(clear) ago!".format(user, remind_text))
+    if not conn.ready:
+        # try again once we're connected
+        bot.scheduler.schedule(time.time() + 30, deliver_reminder, bot, key, owner="remind", key=key)
+        return
+
+    remind_text = colors.parse(time_since(added_time, count=2))
+    alert = colors.parse("{}, you have a reminder from $(b){}$(clear) ago!".format(user, remind_text))
+
+    conn.message(user, alert)
+    conn.message(user, '"{}"'.format(message))
 
-            conn.message(user, alert)
-            conn.message(user, '"{}"'.format(message))
+    delta = (datetime.now() - remind_time).total_seconds()
+    if delta > (30*60):
+        late_time = time_since(remind_time, count=2)
+        late = "(I'm sorry for delivering this message $(b){}$(clear) late," \
+               " it seems I was unable to deliver it on time)".format(late_time)
+        conn.message(user, colors.parse(late))
 
-            delta = (remind_time-added_time).seconds
-            if delta > (30*60):
-                late_time = time_since(remind_time, count=2)
-                late = "(I'm sorry for delivering this message $(b){}$(clear) late," \
-                       " it seems I was unable to deliver it on time)".format(late_time)
-                conn.message(user, colors.parse(late))
+    yield from bot.db_executor.run(_delete_delivered, bot, key)
 
-            yield from delete_reminder(async, db, network, remind_time, user)
-            yield from load_cache(async, db)
+
+@asyncio.coroutine
+@hook.on_start()
+def load_cache(async, db, bot):
+    yield from async(reminders.load, db)
+    # the reminders table is the scheduler's persistent store, so everything still in it gets scheduled again
+    for reminder in reminders:
+        schedule_reminder(bot, reminder)
 
 
 @asyncio.coroutine
 @hook.command('remind', 'reminder')
-def remind(text, nick, chan, db, conn, notice, async):
+def remind(text, nick, chan, db, conn, bot, notice, async):
     """<1 minute, 30 seconds>: <do task> -- reminds you to <do task> in <1 minute, 30 seconds>"""
 
-    count = len([x for x in reminder_cache if x[0] == conn.name and x[3] == nick.lower()])
+    count = len(reminders.find(network=conn.name.lower(), added_user=nick.lower()))
 
     if text == "clear":
         if count == 0:
             return "You have no reminders to delete."
 
+        for reminder in reminders.find(network=conn.name.lower(), added_user=nick.lower()):
+            bot.scheduler.cancel("remind", (reminder["network"], reminder["added_user"], reminder["added_time"]))
         yield from delete_all(async, db, conn.name, nick)
-        yield from load_cache(async, db)
         return "Deleted all ({}) reminders for {}!".format(count, nick)
 
     # split the input on the first ":"
@@ -172,7 +169,7 @@ def remind(text, nick, chan, db, conn, notice, async):
 
     # finally, add the reminder and send a confirmation message
     yield from add_reminder(async, db, conn.name, nick, chan, message, remind_time, current_time)
-    yield from load_cache(async, db)
+    schedule_reminder(bot, reminders.get(conn.name.lower(), nick.lower(), current_time))
 
     remind_text = format_time(seconds, count=2)
     output = "Alright, I'll remind you \"{}\" in $(b){}$(clear)!".format(message, remind_text)
@@ -1,8 +1,9 @@
 import re
+import threading
 from datetime import datetime
-from sqlalchemy import Table, Column, String, Boolean, DateTime
+from sqlalchemy import Table, Column, String, Boolean, DateTime, Index
 
-from sqlalchemy.sql import select
+from sqlalchemy.sql import select, functions
 
 from cloudbot import hook
 from cloudbot.util import timeformat, database
@@ -17,21 +18,43 @@ table = Table(
     Column('message', String(500)),
     Column('is_read', Boolean),
     Column('time_sent', DateTime),
-    Column('time_read', DateTime)
+    Column('time_read', DateTime),
+    Index('tells_connection_target', 'connection', 'target', 'is_read')
 )
 
 
+# (connection, target) -> the number of unread tells, only for targets which have any
+unread_counts = {}
+unread_lock = threading.Lock()
+
+
 @hook.on_start
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global tell_cache
-    tell_cache = []
-    for row in db.execute(table.select().where(table.c.is_read == False)):
-        conn = row["connection"]
-        target = row["target"]
-        tell_cache.append((conn, target))
+    query = select([table.c.connection, table.c.target, functions.count()]) \
+        .where(table.c.is_read == False) \
+        .group_by(table.c.connection, table.c.target)
+    counts = {(conn, target): count for conn, target, count in db.execute(query)}
+    with unread_lock:
+        unread_counts.clear()
+        unread_counts.update(counts)
+
+
+def _change_unread(server, target, change):
+    """
+    :type server: str
+    :type target: str
+    :type change: int
+    """
+    key = (server.lower(), target.lower())
+    with unread_lock:
+        count = unread_counts.get(key, 0) + change
+        if count > 0:
+            unread_counts[key] = count
+        else:
+            unread_counts.pop(key, None)
 
 
 def get_unread(db, server, target):
@@ -43,14 +66,8 @@ def get_unread(db, server, target):
     return db.execute(query).fetchall()
 
 
-def count_unread(db, server, target):
-    query = select([table]) \
-        .where(table.c.connection == server.lower()) \
-        .where(table.c.target == target.lower()) \
-        .where(table.c.is_read == False) \
-        .alias("count") \
-        .count()
-    return db.execute(query).fetchone()[0]
+def count_unread(server, target):
+    return unread_counts.get((server.lower(), target.lower()), 0)
 
 
 def read_all_tells(db, server, target):
@@ -61,17 +78,19 @@ def read_all_tells(db, server, target):
         .values(is_read=True)
     db.execute(query)
     db.commit()
-    load_cache(db)
+    with unread_lock:
+        unread_counts.pop((server.lower(), target.lower()), None)
 
 def read_tell(db, server, target, message):
     query = table.update() \
         .where(table.c.connection == server.lower()) \
         .where(table.c.target == target.lower()) \
         .where(table.c.message == message) \
+        .where(table.c.is_read == False) \
         .values(is_read=True)
-    db.execute(query)
+    result = db.execute(query)
     db.commit()
-    load_cache(db)
+    _change_unread(server, target, -result.rowcount)
 
 
 def add_tell(db, server, sender, target, message):
@@ -85,14 +104,10 @@ def add_tell(db, server, sender, target, message):
     )
     db.execute(query)
     db.commit()
-    load_cache(db)
+    _change_unread(server, target, 1)
 
 def tell_check(conn, nick):
-    for _conn, _target in tell_cache:
-        if (conn, nick.lower()) == (_conn, _target):
-            return True
-        else:
-            continue
+    return (conn, nick.lower()) in unread_counts
 
 
 @hook.event(EventType.message, singlethread=True)
@@ -171,7 +186,7 @@ def tell_cmd(text, nick, db, notice, conn):
         notice("Invalid nick '{}'.".format(target))
         return
 
-    if count_unread(db, conn.name, target) >= 10:
+    if count_unread(conn.name, target) >= 10:
         notice("Sorry, {} has too many messages queued already.".format(target))
         return
 
@@ -27,7 +27,7 @@ table = Table(
 # <https://developers.google.com/maps/documentation/geocoding/#RegionCodes>
 bias = None
 
-w_cache = []
+locations = database.CachedTable(table, "nick")
 
 def check_status(status):
     """
@@ -87,26 +87,20 @@ def _parse_weather_output(weather_data, location):
     return "Current weather in \x02{location}\x02 \x02\x033|\x03\x02 {summary}, {temp_f}°F ({temp_c}°C) feels like {feelslike_f}°F ({feelslike_c}°C), {humidity}% humidity, wind speed {windspeed_mph} mph ({windspeed_ms} m/s), {precip_chance}% chance of precipitation. Today's forecast: {daily_summary}".format(**w_dict)
 
 
-def load_weather_db(db):
-    global w_cache
-    w_cache = []
-    for row in db.execute(table.select()):
-        w_cache.append((row['nick'], row['location']))
-
-
 @hook.on_start
 def load_cache(bot, db):
     """ Loads API keys """
     global dev_key, forecast_io_key
     dev_key = bot.config.get("api_keys", {}).get("google_dev_key", None)
     forecast_io_key = bot.config.get("api_keys", {}).get("forecast_io", None)
-    load_weather_db(db)
+    locations.load(db)
 
 
 def get_saved_weather(nick):
-    global w_cache
-    w_loc = [row[1] for row in w_cache if nick.lower() == row[0]]
-    return w_loc
+    row = locations.get(nick.lower())
+    if row is None:
+        return None
+    return row['location']
 
 
 @hook.command("weather", "w", autohelp=False)
@@ -143,10 +137,6 @@ def weather(text, reply, bot, db, nick, notice):
     reply(_parse_weather_output(response, formatted_address))
 
     if should_save:
-        db.execute('insert into weather(nick, location) values (:nick, :location) '
-                'on conflict(nick) do update set location = EXCLUDED.location',
-                {'nick': nick.lower(), 'location': formatted_address})
-        db.commit()
-        load_weather_db(db)
+        locations.upsert(db, nick=nick.lower(), location=formatted_address)
         notice('Location {} saved'.format(formatted_address))
 